@@ -19,6 +19,8 @@ def main():
           author_email='shawn@garbett.org',
           url='http://github.com/LoLab-VU/varsens',
           packages=['varsens'],
+          package_data={'varsens': ['data/*.gz']},
+          entry_points={'console_scripts': ['varsens = varsens.cli:main']},
           cmdclass={'test': Test},
           keywords=['sensitivity', 'mathematics', 'engineering'],
           classifiers=['Development Status :: 2 - Pre-Alpha',
@@ -1,4 +1,15 @@
 from varsens.saltelli import Varsens, Sample, Objective
 from varsens.scale    import *
+from varsens          import store
+from varsens          import convergence
+from varsens          import bootstrap
+from varsens          import sequence
+from varsens          import shard
+from varsens          import checkpoint
+from varsens          import adapter
+from varsens          import cache
+from varsens          import morris
+from varsens          import pce
+from varsens.accumulate import Accumulator
 
-__all__ = ['scale', 'Varsens', 'Sample', 'Objective']
+__all__ = ['scale', 'store', 'convergence', 'bootstrap', 'sequence', 'shard', 'checkpoint', 'adapter', 'cache', 'morris', 'pce', 'Varsens', 'Sample', 'Objective', 'Accumulator']
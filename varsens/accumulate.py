@@ -0,0 +1,186 @@
+"""Incremental Saltelli estimates from objective values that arrive in any order.
+"""
+
+import numpy
+from varsens.saltelli import layout, membership
+
+class Accumulator(object):
+    ''' Accumulates the sums needed by the Saltelli estimators as objective values arrive,
+        e.g. as the blocks of a cluster array job land, so that the current sensitivity
+        estimates can be inspected at any time instead of only once every block is done.
+
+        Rows are addressed by their index in the flat layout of Sample.flat() (M_1, M_2,
+        N_j[0..k-1], N_nj[0..k-1], each n rows long, see varsens.saltelli.layout()). Only
+        the double scheme is supported, with k the number of groups if the parameters are
+        grouped. Every estimator in Varsens is a sum over j of products of two rows sharing
+        the same j, so when a row arrives its products with the rows already received for
+        that j are added to running sums. The variance of the output is kept with
+        Welford's algorithm. Rows containing NaN are ignored (pairwise deletion).
+
+        Parameters
+        ----------
+        k : int
+            Number of parameters
+        n : int
+            Number of low discrepancy draws in the sample
+        second_order : bool, optional (default: False)
+            Also accumulate the products needed for sens_2 and sens_2n. This keeps sums
+            for all (2+2k)^2 pairs of blocks instead of only those involving M_1 or M_2.
+        scheme : str, optional (default: "double")
+            Sampling scheme of the sample (see Sample); anything but "double" raises
+        groups : list of lists of int, optional
+            Parameter groups of the sample (see Sample), whose blocks are per group
+
+        Examples
+        ________
+            >>> from varsens import *
+            >>> import numpy
+            >>> s = Sample(3, 64, lambda x: x, verbose=False)
+            >>> y = numpy.sum(s.flat()**2, axis=1)
+            >>> a = Accumulator(3, 64)
+            >>> order = numpy.random.permutation(len(y))
+            >>> a.add(order[:500], y[order[:500]]).add(order[500:], y[order[500:]]).complete
+            True
+            >>> v = Varsens(Objective(3, 64, objective_vals=y, verbose=False), verbose=False)
+            >>> numpy.allclose(a.sens, v.sens)
+            True
+    '''
+    def __init__(self, k, n, second_order=False, scheme="double", groups=None):
+        if scheme != "double":
+            raise Exception("The Accumulator is only available for the double scheme")
+        self.groups       = groups
+        self.k            = int(k) if groups is None else len(membership(groups, int(k)))
+        self.n            = int(n)
+        self.second_order = second_order
+        self.blocks       = len(layout(scheme, self.k)[0])
+        self.received     = numpy.zeros((self.n, self.blocks), dtype=bool)
+        self.values       = None
+        self.count        = 0
+
+    def _allocate(self, m):
+        rows = self.blocks if self.second_order else 2
+        self.m      = m
+        self.values = numpy.zeros((self.n, self.blocks, m))
+        self.G      = numpy.zeros((rows, self.blocks, m)) # Sums of products of block pairs
+        self.C      = numpy.zeros((rows, self.blocks))    # and the number of terms in each
+        self.N_y    = 0                                   # Welford state for V(y) over M_1, M_2
+        self.mean_y = numpy.zeros(m)
+        self.M2_y   = numpy.zeros(m)
+
+    def add(self, index, values):
+        '''Ingest objective values for the given rows of the flat layout.
+
+        Parameters
+        ----------
+        index : array of int
+            Row indices in Sample.flat() order
+        values : array
+            Objective values, of shape (rows,) or (rows, m)
+
+        Returns
+        -------
+        The Accumulator, so calls can be chained
+        '''
+        index  = numpy.asarray(index, dtype=int).reshape(-1)
+        values = numpy.asarray(values, dtype=float).reshape((len(index), -1))
+        if self.values is None: self._allocate(values.shape[1])
+
+        block = index // self.n
+        j     = index %  self.n
+        # Drop rows already received (or repeated within this call) and rows containing NaN
+        keep  = numpy.logical_not(numpy.any(numpy.isnan(values), axis=1))
+        keep &= numpy.logical_not(self.received[j, block])
+        _, first = numpy.unique(index, return_index=True)
+        unique = numpy.zeros(len(index), dtype=bool)
+        unique[first] = True
+        keep &= unique
+
+        R = self.G.shape[0]
+        # Bound the temporary of partner values to about a million elements
+        chunk = max(1, 2**20 // (self.blocks*self.m))
+        for s in numpy.unique(block[keep]):
+            rows = numpy.flatnonzero(keep & (block == s))
+            for c in range(0, len(rows), chunk):
+                r  = rows[c:c+chunk]
+                js = j[r]
+                y  = values[r]
+                partners = self.values[js] * self.received[js][:,:,None]
+                P  = numpy.einsum('rm,rtm->tm', y, partners)
+                N  = numpy.sum(self.received[js], axis=0)
+                if s < R:
+                    self.G[s]      += P
+                    self.C[s]      += N
+                    self.G[s, s]   += numpy.sum(y*y, axis=0)
+                    self.C[s, s]   += len(r)
+                self.G[:R, s] += P[:R]
+                self.C[:R, s] += N[:R]
+                self.values[js, s]   = y
+                self.received[js, s] = True
+                if s < 2: self._welford(y)
+            self.count += len(rows)
+        return self
+
+    def add_block(self, start, values):
+        '''Ingest objective values for the consecutive rows starting at start (e.g. one
+        exported batch)'''
+        values = numpy.asarray(values)
+        return self.add(numpy.arange(start, start+len(values)), values)
+
+    def _welford(self, y):
+        '''Update the running mean and sum of squared deviations with a batch of values'''
+        count = len(y)
+        mean  = numpy.mean(y, axis=0)
+        delta = mean - self.mean_y
+        total = self.N_y + count
+        self.M2_y   += numpy.sum((y - mean)**2, axis=0) + delta**2 * self.N_y * count / total
+        self.mean_y += delta * count / total
+        self.N_y     = total
+
+    @property
+    def complete(self):
+        '''True once every row of the sample has been received'''
+        return bool(numpy.all(self.received))
+
+    @property
+    def fraction(self):
+        '''Fraction of the 2*n*(1+k) rows received so far'''
+        return float(self.count) / (self.n*self.blocks)
+
+    def _U(self, a, b, c, d):
+        '''Double estimate of U from block pairs (a, b) and (c, d), each over its own count'''
+        return (self.G[a, b] / (self.C[a, b][...,None] - 1) + self.G[c, d] / (self.C[c, d][...,None] - 1)) / 2.0
+
+    def __getattr__(self, name):
+        if name in ('E_2', 'var_y', 'U_j', 'U_nj', 'sens', 'sens_t', 'sens_2', 'sens_2n'):
+            estimates = self.estimate()
+            if name in estimates: return estimates[name] # sens_2 and sens_2n need second_order
+        raise AttributeError(name)
+
+    def estimate(self):
+        '''Compute the current estimates from the rows received so far.
+
+        Returns
+        -------
+        dict with E_2, var_y, U_j, U_nj, sens and sens_t (plus sens_2 and sens_2n when
+        accumulating second order terms), as computed by Varsens.compute_varsens(). Each
+        sum is normalized by the number of pairs it actually contains.
+        '''
+        if self.values is None: raise ValueError("No objective values have been added")
+        k = self.k
+        j, nj = numpy.arange(2, 2+k), numpy.arange(2+k, 2+2*k)
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            E_2   = self.G[0, 1] / self.C[0, 1]                     # Eq (21)
+            var_y = self.M2_y / (self.N_y - 1)
+            U_j   = self._U(0, j, 1, nj)                             # Eq (12)
+            U_nj  = self._U(0, nj, 1, j)                             # Eq (unnumbered one after 18)
+            result = {'E_2'    : E_2,
+                      'var_y'  : var_y,
+                      'U_j'    : U_j,
+                      'U_nj'   : U_nj,
+                      'sens'   : (U_j - E_2) / var_y,                # Eq (27)
+                      'sens_t' : 1.0 - (U_nj - E_2) / var_y}         # Eq (28)
+            if self.second_order: # (k, k, m), one matrix per objective
+                a, b = j[:,None], j[None,:]
+                result['sens_2']  = (self._U(a+k, b,   a, b+k) - E_2) / var_y
+                result['sens_2n'] = (self._U(a+k, b+k, a, b  ) - E_2) / var_y
+        return result
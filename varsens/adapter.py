@@ -0,0 +1,138 @@
+"""Build the inputs of a batched ODE solver (e.g. cupSODA) for a whole block of sample rows.
+
+A batched solver takes one row of rate constants and one row of initial concentrations per
+simulation. The rate constant of a reaction is the product of its rate arguments, each
+either a sampled parameter, a fixed parameter or a number, and an initial concentration is
+either a sampled parameter or fixed. The arguments are resolved once into an index table
+over the sample columns (with a trailing column of ones for the fixed factors), so the
+matrices for a block are built with a few vectorized products instead of a loop over
+simulations, reactions and arguments.
+"""
+
+import re
+import numpy
+
+class Adapter(object):
+    ''' Maps blocks of sample rows to rate constant and initial concentration matrices.
+
+        Parameters
+        ----------
+        columns : list of str or dict
+            Names of the sampled parameters, in sample column order, or a dict mapping
+            each name to its column
+        rate_args : list of lists
+            The rate arguments of each reaction: parameter names or numbers
+        initials : list of (int, str or float), optional
+            The species index and the parameter name (or value) of each initial condition
+        n_species : int, optional
+            Number of species (default: one past the largest species index in initials)
+        values : dict, optional
+            Values of the parameters that are not sampled
+
+        Examples
+        ________
+            >>> from varsens import *
+            >>> import numpy
+            >>> a = adapter.Adapter(['kf', 'A_0'], [['kf', 2.0], ['kr']], [(0, 'A_0'), (1, 'B_0')],
+            ...                     values={'kr': 0.5, 'B_0': 10.0})
+            >>> rates, initials = a(numpy.array([[1.0, 100.0], [3.0, 200.0]]))
+            >>> rates.tolist()
+            [[2.0, 0.5], [6.0, 0.5]]
+            >>> initials.tolist()
+            [[100.0, 10.0], [200.0, 10.0]]
+            >>>
+
+    '''
+    def __init__(self, columns, rate_args, initials=None, n_species=None, values=None):
+        if not isinstance(columns, dict):
+            columns = dict((name, i) for i, name in enumerate(columns))
+        values = values or {}
+        self.columns = columns
+        self.k       = max(columns.values()) + 1 if columns else 0
+
+        # Rate constants: a constant factor and the sampled columns of each reaction, padded
+        # with column k (the ones appended to the block)
+        self.constants = numpy.ones(len(rate_args))
+        cols = []
+        for r, args in enumerate(rate_args):
+            cols.append([])
+            for arg in args:
+                factor = self._resolve(arg, values)
+                if isinstance(factor, int): cols[-1].append(factor)
+                else:                       self.constants[r] *= factor
+        width = max([len(c) for c in cols] + [0])
+        self.table = numpy.array([c + [self.k]*(width-len(c)) for c in cols], dtype=int).reshape((len(rate_args), width))
+
+        # Initial concentrations: sampled species copy a column, the others are fixed
+        initials = initials or []
+        if n_species is None: n_species = max([s for s, p in initials] + [-1]) + 1
+        self.n_species = n_species
+        self.fixed     = numpy.zeros(n_species)
+        sampled        = []
+        for species, parameter in initials:
+            value = self._resolve(parameter, values)
+            if isinstance(value, int): sampled.append((species, value))
+            else:                      self.fixed[species] = value
+        self.species = numpy.array([s for s, c in sampled], dtype=int)
+        self.sources = numpy.array([c for s, c in sampled], dtype=int)
+
+    def _resolve(self, arg, values):
+        '''The sample column (int) of a sampled parameter, or the value (float) of any other
+        argument'''
+        name = str(arg)
+        if name in self.columns: return int(self.columns[name])
+        if name in values:       return float(values[name])
+        try:
+            return float(name)
+        except ValueError:
+            raise Exception("Rate argument '%s' is neither sampled, given a value, nor a number" % name)
+
+    def rates(self, x):
+        '''The (len(x), reactions) rate constants of a block of sample rows'''
+        x = numpy.atleast_2d(x)
+        X = numpy.hstack((x, numpy.ones((len(x), 1))))
+        c = numpy.empty((len(x), len(self.table)))
+        c[:] = self.constants
+        for w in range(self.table.shape[1]):
+            c *= X[:, self.table[:, w]]
+        return c
+
+    def initial_conditions(self, x):
+        '''The (len(x), species) initial concentrations of a block of sample rows'''
+        x = numpy.atleast_2d(x)
+        y = numpy.empty((len(x), self.n_species))
+        y[:] = self.fixed
+        y[:, self.species] = x[:, self.sources]
+        return y
+
+    def __call__(self, x):
+        '''The rate constants and initial concentrations of a block of sample rows'''
+        return self.rates(x), self.initial_conditions(x)
+
+def from_pysb(model, names=None):
+    """An Adapter for a PySB model whose reaction network has been generated
+
+    Parameters
+    ----------
+    model : pysb.Model
+        The model, with model.reactions and model.species filled in
+    names : list of str, optional
+        The sampled parameters in sample column order (default: the rate parameters,
+        model.parameters_rules())
+
+    Returns
+    -------
+    Adapter
+    """
+    if names is None: names = [p.name for p in model.parameters_rules()]
+    rate_args = []
+    for rxn in model.reactions:
+        rate = rxn['rate']
+        args = rate.args if rate.is_Mul else [rate]
+        # Species concentrations (__s0, __s1, ..., or a power such as __s0**2) are not part
+        # of the rate constant; parameters may be named anything, e.g. syn_rate
+        rate_args.append([str(arg) for arg in args if not re.match(r"__s\d+(\*\*\d+)?$", str(arg))])
+    index    = dict((str(sp), i) for i, sp in enumerate(model.species))
+    initials = [(index[str(cp)], p.name) for cp, p in model.initial_conditions]
+    values   = dict((p.name, p.value) for p in model.parameters)
+    return Adapter(names, rate_args, initials, len(model.species), values)
@@ -0,0 +1,109 @@
+"""Bootstrap confidence intervals for the Saltelli sensitivities.
+
+The objective values already computed for a Varsens analysis are resampled over the
+draws j (the rows shared by M_1, M_2, N_j and N_nj), so no further model evaluations are
+needed. Every estimator is a sum over j, so each replicate is a weighted sum with the
+number of times each j was drawn as weight, and all replicates in a chunk are computed
+with a single matrix product of the (replicates, n) weights and the (n, features) terms.
+"""
+
+import numpy
+
+def _terms(fM_1, fM_2, fN_j, fN_nj):
+    '''The per-draw terms whose sums give E_2, V(y), U_j and U_nj, as an (n, features) array'''
+    n = len(fM_1)
+    terms = [fM_1*fM_2,                                       # E_2,  Eq (21)
+             fM_1 + fM_2,                                     # V(y)
+             fM_1**2 + fM_2**2,
+             (fM_1*fN_j  + fM_2*fN_nj).transpose((1,0,2)),    # U_j,  Eq (12)
+             (fM_1*fN_nj + fM_2*fN_j ).transpose((1,0,2))]    # U_nj
+    return numpy.hstack([t.reshape((n, -1)) for t in terms])
+
+def _terms_2(fN_j, fN_nj, a):
+    '''The per-draw terms of sens_2 and sens_2n for parameter a, as an (n, 2*k*m) array'''
+    k, n, m = fN_j.shape
+    t2  = fN_nj[a]*fN_j  + fN_j[a]*fN_nj
+    t2n = fN_nj[a]*fN_nj + fN_j[a]*fN_j
+    return numpy.hstack([t2.transpose((1,0,2)).reshape((n, -1)), t2n.transpose((1,0,2)).reshape((n, -1))])
+
+def _replicates(seed, size, F, fN_j, fN_nj, second_order):
+    '''Sensitivities of size bootstrap replicates, drawn from RandomState(seed)'''
+    n = fN_j.shape[1]
+    W = numpy.random.RandomState(seed).multinomial(n, [1.0/n]*n, size=size).astype(float)
+    return _weighted(W, F, fN_j, fN_nj, second_order)
+
+def _weighted(W, F, fN_j, fN_nj, second_order):
+    '''Sensitivities for each row of bootstrap weights W'''
+    k, n, m = fN_j.shape
+    b = len(W)
+    S = numpy.dot(W, F)
+    E_2   = S[:, 0:m] / n
+    var_y = (S[:, 2*m:3*m] - S[:, m:2*m]**2 / (2.0*n)) / (2.0*n - 1)
+    U_j   = S[:, 3*m:(3+k)*m].reshape((b, k, m))       / (2.0*(n-1))
+    U_nj  = S[:, (3+k)*m:(3+2*k)*m].reshape((b, k, m)) / (2.0*(n-1))
+    result = {'sens'   : (U_j - E_2[:,None]) / var_y[:,None],
+              'sens_t' : 1.0 - (U_nj - E_2[:,None]) / var_y[:,None]}
+    if second_order:
+        # One parameter at a time, so the terms are (n, 2*k*m) rather than k times that
+        S2 = numpy.array([numpy.dot(W, _terms_2(fN_j, fN_nj, a)).reshape((b, 2, k, m)) for a in range(k)]) / (2.0*(n-1))
+        S2 = S2.transpose((2, 1, 0, 3, 4)) # (2, b, k, k, m)
+        result['sens_2']  = (S2[0] - E_2[:,None,None]) / var_y[:,None,None]
+        result['sens_2n'] = (S2[1] - E_2[:,None,None]) / var_y[:,None,None]
+    return result
+
+def confidence_intervals(varsens, B=1000, alpha=0.05, chunk=100, second_order=False, seed=None, executor=None):
+    """Percentile bootstrap confidence intervals of the sensitivities of a Varsens analysis
+
+    Parameters
+    ----------
+    varsens : Varsens
+        A completed analysis, whose objective values are resampled
+    B : int, optional (default: 1000)
+        Number of bootstrap replicates
+    alpha : float, optional (default: 0.05)
+        The intervals cover 1-alpha
+    chunk : int, optional (default: 100)
+        Number of replicates computed together, bounding memory to chunk*n weights per
+        chunk in progress
+    second_order : bool, optional (default: False)
+        Also compute intervals for sens_2 and sens_2n (per objective, shape (k, k, m))
+    seed : int, optional
+        Seed for the resampling. Chunk c is drawn from RandomState([seed, c]), so the
+        intervals do not depend on the executor.
+    executor : Executor, optional
+        A concurrent.futures Executor to compute chunks in parallel (a ThreadPoolExecutor
+        avoids copying the terms to other processes; NumPy releases the GIL in dot)
+
+    Returns
+    -------
+    intervals : dict
+        'sens' and 'sens_t' (and 'sens_2', 'sens_2n'), each an array of shape
+        (2,) + shape of the estimate holding the lower and upper bounds
+    """
+    o    = varsens.objective
+    if o.scheme != "double":
+        raise Exception("Bootstrap intervals are only available for the double scheme")
+    rows = o.valid_rows()
+    def valid(x, axis=0): return x if rows is None else x.take(rows, axis=axis)
+    # Only the analysed outputs (see Varsens outputs) are resampled
+    fM_1, fM_2 = varsens.select(valid(o.fM_1)), varsens.select(valid(o.fM_2))
+    fN_j, fN_nj = varsens.select(valid(o.fN_j, 1)), varsens.select(valid(o.fN_nj, 1))
+    k, n, m = fN_j.shape
+
+    F = _terms(fM_1, fM_2, fN_j, fN_nj)
+
+    if seed is None: seed = numpy.random.randint(2**31)
+    # Each chunk draws its own weights, so only chunk*n of them exist per chunk in progress
+    chunks = [([int(seed), c], min(chunk, B-c*chunk)) for c in range(int(numpy.ceil(float(B) / chunk)))]
+    if executor is None:
+        parts = [_replicates(c, size, F, fN_j, fN_nj, second_order) for c, size in chunks]
+    else:
+        parts = [f.result() for f in [executor.submit(_replicates, c, size, F, fN_j, fN_nj, second_order)
+                                      for c, size in chunks]]
+
+    intervals = {}
+    for name in parts[0]:
+        replicates = numpy.concatenate([p[name] for p in parts])
+        intervals[name] = numpy.array([numpy.percentile(replicates, 100.0*alpha/2,       axis=0),
+                                       numpy.percentile(replicates, 100.0*(1-alpha/2),   axis=0)])
+    return intervals
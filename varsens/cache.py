@@ -0,0 +1,131 @@
+"""A persistent cache of objective values, keyed on the parameter rows they were computed at.
+
+Successive analyses of the same model (e.g. for increasing n with the same sequence and
+scaling) evaluate many identical rows: the first draws of M_1 and M_2, and the rows of
+N_j and N_nj built from them. A Cache passed to Objective is consulted before
+objective_func is called, so only rows never seen before are evaluated.
+
+The cache is a sqlite database mapping the SHA-1 of a row (as float64 bytes) to the values
+computed for it. The least recently used entries are evicted once the cache holds more
+than max_entries values or max_bytes of them. A cache belongs to one objective function:
+the function itself is not part of the key.
+"""
+
+import hashlib
+import sqlite3
+import numpy
+
+class Cache(object):
+    ''' A persistent, size limited cache of objective values.
+
+        Parameters
+        ----------
+        filename : str
+            The sqlite database, created if it does not exist
+        max_entries : int, optional (default: no limit)
+            Number of rows kept
+        max_bytes : int, optional (default: no limit)
+            Bytes of values kept
+
+        Examples
+        ________
+            >>> from varsens import *
+            >>> import numpy
+            >>> c = cache.Cache(":memory:", max_entries=2)
+            >>> c.put(numpy.array([[0.1, 0.2], [0.3, 0.4]]), numpy.array([[1.0], [2.0]]))
+            >>> found, values = c.get(numpy.array([[0.3, 0.4], [0.5, 0.6]]), 1)
+            >>> found.tolist(), values[found].tolist()
+            ([True, False], [[2.0]])
+            >>> c.put(numpy.array([[0.5, 0.6]]), numpy.array([[3.0]])) # Evicts [0.1, 0.2]
+            >>> len(c)
+            2
+            >>>
+
+    '''
+    def __init__(self, filename, max_entries=None, max_bytes=None):
+        self.filename    = filename
+        self.max_entries = max_entries
+        self.max_bytes   = max_bytes
+        self.db = sqlite3.connect(filename)
+        self.db.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB, size INTEGER, used INTEGER)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS cache_used ON cache (used)")
+        self.db.commit()
+        self.clock = self.db.execute("SELECT COALESCE(MAX(used), 0) FROM cache").fetchone()[0]
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def keys(self, x):
+        '''The keys of the rows of x'''
+        x = numpy.ascontiguousarray(numpy.atleast_2d(x), dtype=numpy.float64)
+        return [hashlib.sha1(row.tobytes()).hexdigest() for row in x]
+
+    def get(self, x, m):
+        '''Look up the rows of x.
+
+        Returns
+        -------
+        (found, values) : boolean array of len(x) and array of shape (len(x), m)
+            Which rows are in the cache with m values, and their values (NaN elsewhere)
+        '''
+        keys   = self.keys(x)
+        found  = numpy.zeros(len(keys), dtype=bool)
+        values = numpy.nan*numpy.ones((len(keys), m))
+        index  = dict((key, i) for i, key in enumerate(keys))
+        hits   = []
+        for c in range(0, len(keys), 500): # sqlite allows 999 parameters per statement
+            chunk = keys[c:c+500]
+            query = "SELECT key, value FROM cache WHERE key IN (%s)" % ",".join("?"*len(chunk))
+            for key, value in self.db.execute(query, chunk):
+                y = numpy.frombuffer(value, dtype=numpy.float64)
+                if len(y) != m: continue
+                values[index[key]] = y
+                found[index[key]]  = True
+                hits.append(key)
+        if hits: # Mark them recently used
+            self.clock += 1
+            self.db.executemany("UPDATE cache SET used = ? WHERE key = ?", [(self.clock, key) for key in hits])
+            self.db.commit()
+        return found, values
+
+    def lookup(self, row):
+        '''The values stored for a single row, whatever their number, or None if it is not in
+        the cache (e.g. to learn the number of objectives without evaluating the row)'''
+        found = self.db.execute("SELECT value FROM cache WHERE key = ?", self.keys(row)).fetchone()
+        if found is None: return None
+        return numpy.frombuffer(found[0], dtype=numpy.float64).copy()
+
+    def put(self, x, values):
+        '''Store the values computed for the rows of x, then evict the least recently used
+        entries beyond the limits'''
+        values = numpy.asarray(values, dtype=numpy.float64).reshape((len(x), -1))
+        self.clock += 1
+        self.db.executemany("INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)",
+                            [(key, sqlite3.Binary(y.tobytes()), y.nbytes, self.clock)
+                             for key, y in zip(self.keys(x), values)])
+        self.evict()
+        self.db.commit()
+
+    def evict(self):
+        '''Remove the least recently used entries until the cache is within its limits'''
+        if self.max_entries is not None:
+            excess = len(self) - int(self.max_entries)
+            if excess > 0:
+                self.db.execute("DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY used LIMIT ?)", (excess,))
+        if self.max_bytes is not None:
+            excess = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0] - int(self.max_bytes)
+            if excess > 0:
+                remove = []
+                for key, size in self.db.execute("SELECT key, size FROM cache ORDER BY used"):
+                    if excess <= 0: break
+                    remove.append((key,))
+                    excess -= size
+                self.db.executemany("DELETE FROM cache WHERE key = ?", remove)
+
+    def clear(self):
+        '''Remove every entry'''
+        self.db.execute("DELETE FROM cache")
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,145 @@
+"""Checkpoints of objective evaluations, so an interrupted evaluation can be resumed.
+
+A checkpoint is a pair of files sharing a prefix. ``prefix.ckpt`` is append only: a
+header of six int64 (a format tag, k, n, the number of objectives m, the number of rows
+and a signature of the scheme and parameter groups of the sample) followed by one
+record per evaluated batch, holding the start and stop rows (int64, in Sample.flat()
+order), the (stop-start, m) float64 values and the stop-start int8 reason codes of the
+rows (see varsens.saltelli.Objective.failures). ``prefix.done`` is a bitmap of the
+completed rows (numpy.packbits order) updated after each record, so progress can be
+inspected without reading the records. A record cut short by a crash is discarded when
+the checkpoint is read back, so at most one batch of work is lost.
+"""
+
+import json
+import os
+import zlib
+import numpy
+
+TAG = 0x76617273656e7303 # "varsens" and the format version
+
+class Checkpoint(object):
+    ''' The checkpoint of the objective evaluations of a sample of k parameters and n draws.
+
+        Parameters
+        ----------
+        prefix : str
+            Prefix of the checkpoint files
+        k : int
+            Number of parameters
+        n : int
+            Number of low discrepancy draws
+        rows : int, optional (default: 2*n*(1+k))
+            Number of rows of the sample (see varsens.saltelli.layout())
+        scheme : str, optional (default: "double")
+            Sampling scheme of the sample
+        groups : list of lists of int, optional
+            Parameter groups of the sample
+
+        A checkpoint is only read back by a Checkpoint with the same k, n, rows, scheme and
+        groups, so rows are never restored into another layout.
+    '''
+    def __init__(self, prefix, k, n, rows=None, scheme="double", groups=None):
+        self.prefix    = prefix
+        self.k         = int(k)
+        self.n         = int(n)
+        self.rows      = int(rows) if rows else 2*self.n*(1+self.k)
+        self.layout    = signature(scheme, groups)
+        self.data      = prefix + '.ckpt'
+        self.bitmap    = prefix + '.done'
+        self.m         = None
+        self.completed = numpy.zeros(self.rows, dtype=bool)
+        self.file      = None
+
+    def exists(self):
+        '''True if a checkpoint has been written'''
+        return os.path.isfile(self.data)
+
+    def read(self):
+        '''Read the checkpoint back.
+
+        Returns
+        -------
+        (m, records) : int and list of (start, values, reasons)
+            The number of objectives and the evaluated batches. completed is updated.
+        '''
+        size = os.path.getsize(self.data)
+        records = []
+        with open(self.data, 'rb') as f:
+            header = numpy.fromfile(f, dtype=numpy.int64, count=6)
+            if len(header) < 6 or header[0] != TAG:
+                raise Exception("%s is not a varsens checkpoint" % self.data)
+            if header[1] != self.k or header[2] != self.n:
+                raise Exception("Checkpoint %s is for k=%d, n=%d, not k=%d, n=%d" %
+                                (self.data, header[1], header[2], self.k, self.n))
+            if header[4] != self.rows or header[5] != self.layout:
+                raise Exception("Checkpoint %s is for another sampling scheme or parameter groups (%d rows, not %d)" %
+                                (self.data, header[4], self.rows))
+            self.m = int(header[3])
+            end = f.tell()
+            while end + 16 <= size:
+                start, stop = numpy.fromfile(f, dtype=numpy.int64, count=2)
+                if stop < start or stop > self.rows or end + 16 + (8*self.m+1)*(stop-start) > size: break
+                values  = numpy.fromfile(f, dtype=numpy.float64, count=(stop-start)*self.m)
+                reasons = numpy.fromfile(f, dtype=numpy.int8, count=stop-start)
+                records.append((int(start), values.reshape((stop-start, self.m)), reasons))
+                self.completed[start:stop] = True
+                end = f.tell()
+        if end < size: # A record cut short, drop it so appending continues from a clean end
+            with open(self.data, 'r+b') as f: f.truncate(end)
+        self._write_bitmap()
+        return self.m, records
+
+    def create(self, m):
+        '''Start a new checkpoint (replacing any previous one) for m objectives'''
+        self.close()
+        self.m = int(m)
+        self.completed[:] = False
+        with open(self.data, 'wb') as f:
+            numpy.array([TAG, self.k, self.n, self.m, self.rows, self.layout], dtype=numpy.int64).tofile(f)
+        self._write_bitmap()
+
+    def append(self, start, values, reasons=None):
+        '''Record the values of the rows from start on, and their reason codes (default: all
+        evaluated), and mark them completed'''
+        values = numpy.asarray(values, dtype=numpy.float64).reshape((-1, self.m))
+        stop   = start + len(values)
+        if reasons is None: reasons = numpy.zeros(len(values))
+        if self.file is None: self.file = open(self.data, 'ab')
+        numpy.array([start, stop], dtype=numpy.int64).tofile(self.file)
+        values.tofile(self.file)
+        numpy.asarray(reasons, dtype=numpy.int8).reshape(len(values)).tofile(self.file)
+        self.file.flush()
+        self.completed[start:stop] = True
+        # Rewrite only the bytes of the bitmap covering these rows
+        lo, hi = start // 8, (stop + 7) // 8
+        bits = numpy.packbits(self.completed[8*lo:8*hi])
+        with open(self.bitmap, 'r+b') as f:
+            f.seek(lo)
+            bits.tofile(f)
+
+    def missing(self, start=0, stop=None):
+        '''The [start, stop) runs of rows not yet completed within [start, stop)'''
+        if stop is None: stop = self.rows
+        todo  = numpy.concatenate(([False], numpy.logical_not(self.completed[start:stop]), [False]))
+        edges = numpy.flatnonzero(numpy.diff(todo.astype(numpy.int8)))
+        return [(start+a, start+b) for a, b in zip(edges[0::2], edges[1::2])]
+
+    def close(self):
+        '''Close the record file (it is reopened by append())'''
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def _write_bitmap(self):
+        with open(self.bitmap, 'wb') as f:
+            numpy.packbits(self.completed).tofile(f)
+
+def signature(scheme, groups):
+    """A number identifying the sampling scheme and parameter groups of a sample"""
+    return zlib.crc32(json.dumps([scheme, groups])) & 0xffffffff
+
+def completed(prefix):
+    """The completion bitmap of a checkpoint as a boolean array over the rows (padded to a
+    multiple of 8)"""
+    return numpy.unpackbits(numpy.fromfile(prefix + '.done', dtype=numpy.uint8)).astype(bool)
@@ -0,0 +1,206 @@
+"""Command line driver for running an analysis as a cluster array job.
+
+    varsens generate  Write the specification of a sample divided into shards
+    varsens evaluate  Evaluate an objective on the rows of one shard (regenerated locally)
+    varsens merge     Join the shard outputs into one store, checking for missing or
+                      duplicate shards
+    varsens analyze   Compute the sensitivities from the merged objective
+
+For example, with an objective function 'objective' in model.py
+
+    $ varsens generate -k 6 -n 1024 --shards 100 --scaling scaling.json spec.json
+    $ varsens evaluate spec.json $PBS_ARRAYID --objective model.py:objective --outdir out
+    $ varsens merge spec.json --indir out objective
+    $ varsens analyze spec.json objective.npy --output sens.npz
+
+Run 'varsens <command> -h' for the options of each command.
+"""
+
+import argparse
+import glob
+import imp
+import importlib
+import json
+import os
+import re
+import sys
+import numpy
+from varsens import shard
+from varsens import store
+from varsens.saltelli import Objective, Varsens, SCHEMES, evaluate_rows, text_format
+
+def load_function(name):
+    """Import a function given as 'module:function', where module is either a module name
+    (package.module) or the path of a python file"""
+    if ':' not in name:
+        raise Exception("Expected the objective as 'module:function', got '%s'" % name)
+    module, function = name.rsplit(':', 1)
+    if module.endswith('.py') or os.sep in module:
+        module = imp.load_source(os.path.splitext(os.path.basename(module))[0], module)
+    else:
+        module = importlib.import_module(module)
+    return getattr(module, function)
+
+def shard_files(indir, prefix):
+    """Map shard numbers to the output files named prefix_<shard>.<ext> in indir"""
+    pattern = re.compile(re.escape(prefix) + r'_(\d+)\.(txt|npy)$')
+    found = {}
+    for file in sorted(glob.glob(os.path.join(indir, prefix + '_*'))):
+        match = pattern.match(os.path.basename(file))
+        if match: found.setdefault(int(match.group(1)), []).append(file)
+    return found
+
+def generate(args):
+    scaling = None
+    if args.scaling:
+        if os.path.isfile(args.scaling):
+            with open(args.scaling) as f: scaling = json.load(f)
+        else:
+            scaling = json.loads(args.scaling)
+    spec = shard.spec(args.k, args.n, scaling, sequence=args.sequence, discard=args.discard, seed=args.seed,
+                      n_shards=args.shards, blocksize=args.blocksize, scheme=args.scheme,
+                      groups=json.loads(args.groups) if args.groups else None)
+    shard.save(spec, args.spec)
+    if args.verbose: print "Wrote %s: %d rows in %d shards of %d" % (args.spec, spec['rows'], shard.shards(spec), spec['blocksize'])
+
+def evaluate(args):
+    spec = shard.load(args.spec)
+    b    = args.shard
+    if b is None:
+        for variable in ('PBS_ARRAYID', 'SLURM_ARRAY_TASK_ID', 'SGE_TASK_ID'):
+            if os.environ.get(variable):
+                b = int(os.environ[variable])
+                break
+    if b is None:
+        raise Exception("No shard given, and no array job task id found in the environment")
+    objective = load_function(args.objective)
+    x = shard.rows(spec, b)
+    if args.verbose: print "Evaluating shard %d of %d (%d rows)" % (b, shard.shards(spec), len(x))
+    y, reasons = evaluate_rows(objective, x, args.vectorized, args.batch_size, args.outputs, args.timeout, args.capture)
+    y = y.astype(args.dtype)
+    failed = numpy.count_nonzero(reasons)
+    if failed > 0: print >> sys.stderr, "WARNING: %d of %d evaluations failed, recorded as NaN" % (failed, len(x))
+
+    if not os.path.isdir(args.outdir): os.makedirs(args.outdir)
+    prefix = os.path.join(args.outdir, "%s_%d" % (args.prefix, b))
+    if args.binary:
+        numpy.save(prefix + ".npy", y)
+    else:
+        numpy.savetxt(prefix + ".txt", y, fmt=text_format(y.dtype))
+    if args.verbose: print "Wrote %s" % (prefix + (".npy" if args.binary else ".txt"))
+
+def merge(args):
+    spec   = shard.load(args.spec)
+    found  = shard_files(args.indir, args.prefix)
+    total  = shard.shards(spec)
+    errors = []
+    missing = [b for b in range(1, total+1) if b not in found]
+    if missing:
+        errors.append("Missing shards: %s" % " ".join(str(b) for b in missing))
+    for b in sorted(found):
+        if b > total:
+            errors.append("Shard %d is beyond the %d shards of the sample: %s" % (b, total, " ".join(found[b])))
+        elif len(found[b]) > 1:
+            errors.append("Duplicate outputs for shard %d: %s" % (b, " ".join(found[b])))
+    if errors:
+        for error in errors: print >> sys.stderr, error
+        return 1
+
+    files = [found[b][0] for b in range(1, total+1)]
+    header = {'kind': 'objective', 'k': shard.factors(spec), 'n': spec['n'], 'scheme': spec.get('scheme', "double"),
+              'blocksize': spec['blocksize']}
+    data = store.concatenate(files, args.output, header, dtype=args.dtype)
+    # Each shard must have produced exactly its rows
+    header = store.read_header(args.output)
+    for b in range(1, total+1):
+        if tuple(header['blocks'][b-1]) != shard.shard_range(spec, b):
+            print >> sys.stderr, "Shard %d has %d rows, expected %d" % (b, header['blocks'][b-1][1]-header['blocks'][b-1][0],
+                                                                         numpy.diff(shard.shard_range(spec, b))[0])
+            return 1
+    if args.verbose: print "Merged %d shards into %s (%d rows, %d objectives)" % (total, store.paths(args.output)[0], data.shape[0], data.shape[1])
+
+def analyze(args):
+    spec = shard.load(args.spec)
+    o = Objective(shard.factors(spec), spec['n'], loadFile=args.objective, verbose=args.verbose, scheme=spec.get('scheme'))
+    v = Varsens(o, verbose=args.verbose, second_order=args.second_order)
+    results = {'E_2': v.E_2, 'var_y': v.var_y, 'sens_t': v.sens_t}
+    if v.sens is not None:
+        results['sens'] = v.sens
+    if v.sens_2 is not None:
+        results['sens_2']  = v.sens_2
+        results['sens_2n'] = v.sens_2n
+    if args.bootstrap:
+        for name, ci in v.bootstrap(args.bootstrap, second_order=args.second_order).items():
+            results[name + '_ci'] = ci
+    if args.output:
+        numpy.savez(args.output, **results)
+        if args.verbose: print "Wrote %s" % args.output
+    else:
+        for name in ('sens', 'sens_t'):
+            if name not in results: continue
+            print name
+            print results[name]
+
+def parser():
+    """The argument parser of the varsens command"""
+    p = argparse.ArgumentParser(prog='varsens', description="Variance based sensitivity analysis as a batch job")
+    p.add_argument('-q', '--quiet', dest='verbose', action='store_false', help="No progress output")
+    commands = p.add_subparsers(dest='command')
+
+    c = commands.add_parser('generate', help="Write a sample specification")
+    c.add_argument('spec', help="Specification file to write (JSON)")
+    c.add_argument('-k', type=int, required=True, help="Number of parameters")
+    c.add_argument('-n', type=int, required=True, help="Number of low discrepancy draws")
+    c.add_argument('--scaling', help="Scaling specification (see scale.from_spec), as JSON or a JSON file")
+    c.add_argument('--sequence', default='halton', help="Low discrepancy sequence (default: halton)")
+    c.add_argument('--discard', type=int, default=0, help="Additional points to discard from the sequence")
+    c.add_argument('--seed', type=int, default=1, help="Seed of the shuffle of M_2")
+    c.add_argument('--shards', type=int, default=1, help="Number of shards")
+    c.add_argument('--blocksize', type=int, help="Rows per shard (overrides --shards)")
+    c.add_argument('--scheme', default='double', choices=SCHEMES,
+                   help="Sampling scheme: double (2n(1+k) rows), jansen (n(k+2)) or radial (n(k+1), total order only)")
+    c.add_argument('--groups', help="Parameter groups as a JSON list of lists of columns, e.g. '[[0,1],[2]]'")
+    c.set_defaults(run=generate)
+
+    c = commands.add_parser('evaluate', help="Evaluate the objective on one shard")
+    c.add_argument('spec', help="Specification file")
+    c.add_argument('shard', type=int, nargs='?',
+                   help="Shard number, from 1 (default: the array job task id, e.g. $PBS_ARRAYID)")
+    c.add_argument('--objective', required=True, help="Objective function, as module:function or file.py:function")
+    c.add_argument('--vectorized', action='store_true', help="The objective takes a block of rows")
+    c.add_argument('--batch-size', type=int, help="Rows per call of a vectorized objective")
+    c.add_argument('--outdir', default='.', help="Output directory")
+    c.add_argument('--prefix', default='objective', help="Output file prefix (default: objective)")
+    c.add_argument('--binary', action='store_true', help="Write .npy instead of text")
+    c.add_argument('--timeout', type=float, help="Seconds allowed for each evaluation")
+    c.add_argument('--capture', action='store_true', help="Record failed or timed out evaluations as NaN")
+    c.add_argument('--outputs', type=int, help="Number of objectives returned per row (default: from the first row that evaluates)")
+    c.add_argument('--dtype', default='float64', help="Type of the values written (default: float64, or float32)")
+    c.set_defaults(run=evaluate)
+
+    c = commands.add_parser('merge', help="Join the shard outputs into one store")
+    c.add_argument('spec', help="Specification file")
+    c.add_argument('output', help="Prefix of the store to write (prefix.npy and prefix.json)")
+    c.add_argument('--indir', default='.', help="Directory of the shard outputs")
+    c.add_argument('--prefix', default='objective', help="Prefix of the shard outputs (default: objective)")
+    c.add_argument('--dtype', default='float64', help="Type of the merged store (default: float64, or float32)")
+    c.set_defaults(run=merge)
+
+    c = commands.add_parser('analyze', help="Compute the sensitivities")
+    c.add_argument('spec', help="Specification file")
+    c.add_argument('objective', help="Merged objective (.npy) or text file")
+    c.add_argument('--output', help="Write the results to this .npz file instead of printing them")
+    c.add_argument('--no-second-order', dest='second_order', action='store_false', help="Skip sens_2 and sens_2n")
+    c.add_argument('--bootstrap', type=int, default=0, help="Number of bootstrap replicates for confidence intervals")
+    c.set_defaults(run=analyze)
+    return p
+
+def main(argv=None):
+    args = parser().parse_args(argv)
+    if not hasattr(args, 'run'):
+        parser().print_help()
+        return 2
+    return args.run(args) or 0
+
+if __name__ == '__main__':
+    sys.exit(main())
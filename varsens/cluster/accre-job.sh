@@ -7,7 +7,10 @@
 #PBS -M shawn.garbett@vanderbilt.edu
 
 # $PBS_ARRAYID is the number of the block (starts from 1)
+# Each job regenerates the rows of its block from spec.json, see accre-submit.sh
 
 cd ~/earm
 
-python varsens/compute_objective.py /scratch/garbetsp/varsens/samples/earm-batch-$PBS_ARRAYID.csv
+varsens evaluate /scratch/garbetsp/varsens/spec.json $PBS_ARRAYID \
+	--objective earm_objective.py:objective \
+	--outdir /scratch/garbetsp/varsens/objectives --binary
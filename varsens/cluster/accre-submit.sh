@@ -4,25 +4,33 @@
 usage()
 {
 cat << EOF
-usage: $0 blocks
+usage: $0 k n blocks
+
+Writes the sample specification, and submits one job per block. Once they are done:
+
+  varsens merge /scratch/garbetsp/varsens/spec.json objective --indir /scratch/garbetsp/varsens/objectives
+  varsens analyze /scratch/garbetsp/varsens/spec.json objective.npy --output sens.npz
 
 EOF
 }
 
-if [[ $# -lt 1 ]]; then
+if [[ $# -lt 3 ]]; then
 	usage
 	exit 1
 fi
-if [[ $# -gt 1 ]]; then
+if [[ $# -gt 3 ]]; then
 	usage
 	exit 1
 fi
 
-BLOCKS=$1
+K=$1
+N=$2
+BLOCKS=$3
 HERE=`pwd`
 
 mkdir -p $HERE/results
 
-# Submit jobs as a multiple of blocks
-qsub -o $HERE/results -N PySB -t $BLOCKS accre-job.sh
+varsens generate /scratch/garbetsp/varsens/spec.json -k $K -n $N --shards $BLOCKS --scaling $HERE/scaling.json
 
+# Submit jobs as a multiple of blocks
+qsub -o $HERE/results -N PySB -t 1-$BLOCKS accre-job.sh
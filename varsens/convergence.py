@@ -0,0 +1,71 @@
+"""Accuracy of the Saltelli estimates as a function of the sample size.
+
+The error profiles in varsens/profile (error-profile-dim*.csv) are the largest observed
+error of the first order indices over repeated analyses of random g-functions, for k from
+6 to 192 and n from 5 to 20480. profile/model.R fits them with the power law
+
+    log10(sqrt(max error)) = a + (b + c*k)*log10(n)
+
+whose coefficients are reproduced here (model3 in model.R), so the required n can be
+predicted without running anything. The fit is of the square root of the error, so the
+predicted maximum error is the square of the power law. The fit assumes independent parameters, and for k
+above about 350 the fitted slope is no longer negative, so it cannot be extrapolated there.
+"""
+
+import numpy
+
+# Coefficients (a, b, c) of model3 in profile/model.R
+PROFILE = (0.16103141, -0.9620883, 0.00268003)
+
+def predicted_error(n, k, profile=PROFILE):
+    """Predicted maximum error of the first order sensitivities, the square of the power
+    law fitted to sqrt(max error)
+
+    Parameters
+    ----------
+    n : int or numpy.array
+        Number of low discrepancy draws
+    k : int or numpy.array
+        Number of parameters
+    profile : tuple, optional
+        Power law coefficients (a, b, c)
+
+    Returns
+    -------
+    error : float or numpy.array
+
+    Examples
+    ________
+
+        >>> from varsens import *
+        >>> "%.6f" % convergence.predicted_error(10000, 197)
+        '0.000706'
+        >>>
+
+    """
+    a, b, c = profile
+    return 10.0**(2.0*(a + (b + c*numpy.asarray(k, dtype=float))*numpy.log10(n)))
+
+def required_n(k, tolerance, profile=PROFILE):
+    """Smallest n for which the predicted maximum error (see predicted_error()) is below
+    tolerance
+
+    Parameters
+    ----------
+    k : int
+        Number of parameters
+    tolerance : float
+        Desired accuracy of the first order sensitivities
+    profile : tuple, optional
+        Power law coefficients (a, b, c)
+
+    Returns
+    -------
+    n : int or None
+        None if the profile does not reach the tolerance for this k (the error no longer
+        decreases with n)
+    """
+    a, b, c = profile
+    slope = b + c*k
+    if slope >= 0: return None
+    return int(numpy.ceil(10.0**((0.5*numpy.log10(tolerance) - a) / slope)))
@@ -20,7 +20,6 @@ max_samples_per_batch = 352
 #####
 
 par_names = [p.name for p in model.parameters_rules()]
-par_dict  = {name : index for index,name in enumerate(par_names)}
 
 obj_names = ['emBid', 'ecPARP', 'e2']
 
@@ -73,6 +72,9 @@ tspan = exp_data['Time']
 
 # Initialize solver object
 solver = cupSODA(model, tspan, atol=1e-12, rtol=1e-6, verbose=True)
+
+# Maps sample rows to the solver's rate constants and initial concentrations
+inputs = adapter.from_pysb(model)
 	
 # Determine IDs for rate parameters, original values for all parameters to overlay, and reference values for scaling.
 ref = np.array([p.value for p in model.parameters_rules()])
@@ -166,36 +168,8 @@ for n_samples in N_SAMPLES:
 		end = min(start+max_sims_per_batch, n_sims)
 		sample_batch = sample_flat[start:end]
 		
-		# Rate constants
-		c_matrix = np.zeros((len(sample_batch), len(model.reactions)))
-		rate_args = []
-		for rxn in model.reactions:
-			rate_args.append([arg for arg in rxn['rate'].args if not re.match("_*s",str(arg))])
-		output = 0.01*len(sample_batch)
-		output = int(output) if output > 1 else 1
-		for i in range(len(sample_batch)):
-			if i % output == 0: print str(int(round(100.*i/len(sample_batch))))+"%"
-			for j in range(len(model.reactions)):
-				rate = 1.0
-				for r in rate_args[j]:
-					x = str(r)
-					if x in par_dict.keys():
-						rate *= sample_batch[i][par_dict[x]]
-					else:
-						rate *= float(x)
-				c_matrix[i][j] = rate
-		
-		# Initial concentrations
-		MX_0 = np.zeros((len(sample_batch),len(model.species)))
-		for i in range(len(model.initial_conditions)):
-			for j in range(len(model.species)):
-				if str(model.initial_conditions[i][0]) == str(model.species[j]): # The ComplexPattern objects are not the same, even though they refer to the same species (ask about this)
-					x = model.initial_conditions[i][1]
-					if (x.name in par_dict.keys()):
-						MX_0[:,j] = sample_batch[:,par_dict[x.name]]
-					else:
-						MX_0[:,j] = [x.value for i in range(len(sample_batch))]
-					break
+		# Rate constants and initial concentrations of the whole batch
+		c_matrix, MX_0 = inputs(sample_batch)
 		
 		solver.run(c_matrix, MX_0, outdir=os.path.join(outdir,'NSAMPLES_'+str(n_samples)), gpu=GPU) # load_conc_data=False) #obs_species_only=False)
 		if n_batches > 1:
@@ -203,10 +177,10 @@ for n_samples in N_SAMPLES:
 			
 		for i in range(end-start):
 			try:
-				obj_vals[i] = objective_func(solver.yobs[i])
-			except IndexError:
-				print i
-				raise
+				obj_vals[start+i] = objective_func(solver.yobs[i])
+			except IndexError: # A failed integration, masked out of the analysis by Objective
+				print "WARNING: objective %d failed, recorded as NaN" % (start+i)
+				obj_vals[start+i] = np.nan
 			
 	objective = Objective(len(par_names), n_samples, objective_vals=obj_vals)
 	v = Varsens(objective)
@@ -223,7 +197,7 @@ for n_samples in N_SAMPLES:
 		OUTPUT[obj_names[n]+'_sens_t'].write("\n")
 		
 		# sens_2
-		sens_2 = v.sens_2[:,n,:,n] # 2-D matrix
+		sens_2 = v.sens_2[:,:,n] # 2-D matrix
 		OUTPUT[obj_names[n]+'_sens_2'].write(str(n_samples))
 		for i in range(len(sens_2)):
 			for j in range(i,len(sens_2[i])):
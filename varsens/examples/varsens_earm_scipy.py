@@ -158,11 +158,18 @@ def objective_func(params):
 N_SAMPLES = range(10,100,10) + range(100,501,50)
 solver.verbose = False
 
+v = None
 for n_samples in N_SAMPLES:
 	
-	sample = Sample(len(model.parameters_rules()), n_samples, lambda x: scale.linear(x, lower_bound=0.1*ref, upper_bound=10*ref), verbose=True)
-	objective = Objective(len(model.parameters_rules()), n_samples, sample, objective_func, verbose=True)
-	v = Varsens(objective, verbose=True)
+	if v is None:
+		sample = Sample(len(model.parameters_rules()), n_samples, lambda x: scale.linear(x, lower_bound=0.1*ref, upper_bound=10*ref), verbose=True)
+		# Rows already simulated for a smaller n are read back from the cache
+		objective = Objective(len(model.parameters_rules()), n_samples, sample, objective_func, verbose=True,
+		                      cache=os.path.join(outdir, "objective_cache.db"))
+		v = Varsens(objective, verbose=True)
+	else:
+		# Only the new points are simulated, the previous ones are reused
+		v.update(n_samples - v.n)
  	
  	for n in range(v.sens.shape[1]):
 		
@@ -176,7 +183,7 @@ for n_samples in N_SAMPLES:
 		OUTPUT[obj_names[n]+'_sens_t'].write("\n")
 		
 		# sens_2
-		sens_2 = v.sens_2[:,n,:,n] # 2-D matrix
+		sens_2 = v.sens_2[:,:,n] # 2-D matrix
 		OUTPUT[obj_names[n]+'_sens_2'].write(str(n_samples))
 		for i in range(len(sens_2)):
 			for j in range(i,len(sens_2[i])):
@@ -10,7 +10,6 @@ from pysb.generator.bng import BngGenerator
 from pysb.tools.cupsoda import *
 import filecmp
 import os
-import re
 import datetime
 
 par_names = ['k1', 'k3', 'k4', 'kp4', 'k6', 'k8', 'k9']
@@ -54,7 +53,7 @@ ref = odesolve(model, t, integrator='lsoda', verbose=True)
 set_cupSODA_path("/Users/lopezlab/cupSODA")
 solver = cupSODA(model, t, atol=1e-12, rtol=1e-6, verbose=True)
 
-par_dict = {par_names[i] : i for i in range(len(par_names))}
+inputs = adapter.from_pysb(model, par_names)
 par_vals = np.array([model.parameters[nm].value for nm in par_names])
 scaling = [par_vals-0.2*par_vals, par_vals+0.2*par_vals] # 20% around values
 
@@ -95,36 +94,8 @@ for iter in range(n_iter):
         end = min(start+sims_per_batch, total_sims)
         sample_batch = sample_flat[start:end]
     
-        # Rate constants
-        c_matrix = np.zeros((len(sample_batch),len(model.reactions)))
-        rate_args = []
-        for rxn in model.reactions:
-                rate_args.append([arg for arg in rxn['rate'].args if not re.match("_*s",str(arg))])
-        output = 0.01*len(sample_batch)
-        output = int(output) if output > 1 else 1
-        for i in range(len(sample_batch)):
-            if i % output == 0: print str(int(round(100.*i/len(sample_batch))))+"%"
-            for j in range(len(model.reactions)):
-                rate = 1.0
-                for r in rate_args[j]:
-                    x = str(r)
-                    if x in par_dict.keys():
-                        rate *= sample_batch[i][par_dict[x]] # model.parameters[x].value
-                    else:
-                        rate *= float(x)
-                c_matrix[i][j] = rate
-        
-        # Initial concentrations
-        MX_0 = np.zeros((len(sample_batch),len(model.species)))
-        for i in range(len(model.initial_conditions)):
-            for j in range(len(model.species)):
-                if str(model.initial_conditions[i][0]) == str(model.species[j]): # The ComplexPattern objects are not the same, even though they refer to the same species (ask about this)
-                    x = model.initial_conditions[i][1]
-                    if (x.name in par_dict.keys()):
-                        MX_0[:,j] = sample_batch[:,par_dict[x.name]]
-                    else:
-                        MX_0[:,j] = [x.value for i in range(len(sample_batch))]
-                    break
+        # Rate constants and initial concentrations of the whole batch
+        c_matrix, MX_0 = inputs(sample_batch)
         
         solver.run(c_matrix, MX_0, outdir=os.path.join(outdir,'NSAMPLES_'+str(n_samples))) #obs_species_only=False, load_conc_data=False)
         os.rename(os.path.join(solver.outdir,"__CUPSODA_FILES"), os.path.join(solver.outdir,"__CUPSODA_FILES_"+str(batch)))
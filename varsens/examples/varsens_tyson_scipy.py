@@ -77,7 +77,8 @@ n_samples = 10
 for iter in range(n_iter):
     
     sample = Sample(len(par_vals), n_samples, scale)
-    objective = Objective(len(par_vals), n_samples, sample, osc_objective)
+    # Rows already simulated for a smaller n are read back from the cache
+    objective = Objective(len(par_vals), n_samples, sample, osc_objective, cache=os.path.join(outdir, "objective_cache.db"))
     v = Varsens(objective)
 
     # tyson_sens_ALL.txt
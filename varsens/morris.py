@@ -0,0 +1,207 @@
+"""Morris elementary effects screening, to find the parameters worth a variance based analysis.
+
+A Saltelli analysis costs 2n(1+k) evaluations whether or not a parameter matters. The
+Morris method (Morris 1991, with the mu* measure of Campolongo, Cariboni and Saltelli
+2007) costs r(k+1): r trajectories through a grid of the unit cube, each moving one
+parameter at a time by a fixed step. The elementary effect of a step is the change in
+the objective divided by the step, and the mean of their absolute values (mu*) ranks the
+parameters. Parameters with a negligible mu* are fixed at a reference point and the
+shortlist is analyzed with a Sample of reduced k; see Morris.reduce().
+
+The points are in the unit cube and mapped by the same scaling functions as a Sample
+(see varsens.scale), and the objective function has the same interface as Objective.
+"""
+
+import numpy
+from varsens.saltelli import Sample, _evaluate_block
+
+class Morris(object):
+    ''' Elementary effects of the k parameters of an objective function.
+
+        Parameters
+        ----------
+        objective_func : function
+            The objective, as for Objective: a row of k parameters to a value (or array of
+            values), or a block of rows to a block of values if vectorized
+        k : int
+            Number of parameters
+        r : int
+            Number of trajectories, each of k+1 evaluations (10 to 50 is usual)
+        scaling_func : function, optional (default: identity)
+            Maps points of the unit cube to parameters, as for Sample
+        levels : int, optional (default: 4)
+            Number of grid levels of each parameter (even). The step is levels/(2(levels-1)).
+        seed : int, optional (default: 1)
+            Seed of the random trajectories
+        vectorized : bool, optional (default: False)
+            objective_func takes the (r*(k+1), k) block of all points at once
+
+        After construction self.mu, self.mu_star and self.sigma (of shape (k, m) for m
+        objectives) are the mean, mean absolute value and standard deviation of the
+        elementary effects of each parameter, computed on the unit scale. Trajectories
+        with a NaN objective value are left out of the statistics of the parameters they
+        step.
+
+        Examples
+        ________
+            >>> from varsens import *
+            >>> import numpy
+            >>> m = morris.Morris(lambda x: 10*x[0] + x[1] + 0*x[2], 3, 10, verbose=False)
+            >>> m.evaluations
+            40
+            >>> numpy.round(m.mu_star[:,0], 6).tolist()
+            [10.0, 1.0, 0.0]
+            >>> m.shortlist(0.05)
+            [0, 1]
+            >>>
+
+    '''
+    def __init__(self, objective_func, k, r, scaling_func=None, levels=4, seed=1, vectorized=False, verbose=True):
+        self.objective_func = objective_func
+        self.k              = int(k)
+        self.r              = int(r)
+        self.scaling        = scaling_func or (lambda x: x)
+        self.levels         = int(levels)
+        self.delta          = self.levels / (2.0*(self.levels-1))
+        self.vectorized     = vectorized
+        self.verbose        = verbose
+
+        if self.verbose: print "Generating %d Morris trajectories" % self.r
+        self.points = self.trajectories(numpy.random.RandomState(seed))
+
+        if self.verbose: print "Evaluating %d points" % (self.r*(self.k+1))
+        x = self.scaling(self.points.reshape((-1, self.k)))
+        y = _evaluate_block(objective_func, x, vectorized)[0]
+        self.evaluations = len(x)
+        y = numpy.asarray(y, dtype=numpy.float64)
+        self.values = y.reshape((self.r, self.k+1)+y.shape[1:])
+
+        self.effects()
+
+    def trajectories(self, random):
+        '''The (r, k+1, k) points of r random trajectories. Each starts at a random grid
+        point and steps each parameter once, in random order, up or down by delta.'''
+        starts = numpy.arange(self.levels - self.levels//2) / float(self.levels-1) # x + delta stays in [0, 1]
+        points = numpy.empty((self.r, self.k+1, self.k))
+        for t in range(self.r):
+            up = random.randint(2, size=self.k).astype(bool)
+            x  = starts[random.randint(len(starts), size=self.k)] + numpy.where(up, 0.0, self.delta)
+            points[t, 0] = x
+            for s, i in enumerate(random.permutation(self.k)):
+                x = numpy.array(x)
+                x[i] += self.delta if up[i] else -self.delta
+                points[t, s+1] = x
+        return points
+
+    def effects(self):
+        '''Compute the (r, k, m) elementary effects self.ee, and their mu, mu_star and sigma'''
+        step  = numpy.diff(self.points, axis=1)     # (r, k, k), one nonzero per step
+        param = numpy.argmax(numpy.abs(step), axis=2)
+        dy    = numpy.diff(self.values, axis=1)
+        self.ee = numpy.zeros((self.r, self.k)+dy.shape[2:])
+        for t in range(self.r):
+            d = step[t, numpy.arange(self.k), param[t]].reshape((self.k,)+(1,)*(dy.ndim-2))
+            self.ee[t, param[t]] = dy[t] / d
+        valid = numpy.isfinite(self.ee)
+        count = numpy.sum(valid, axis=0)
+        ee    = numpy.where(valid, self.ee, 0.0)
+        self.mu      = numpy.sum(ee, axis=0) / count
+        self.mu_star = numpy.sum(numpy.abs(ee), axis=0) / count
+        self.sigma   = numpy.sqrt(numpy.sum(numpy.where(valid, (ee - self.mu)**2, 0.0), axis=0) / numpy.maximum(count-1, 1))
+
+    def importance(self):
+        '''The mu_star of each parameter relative to the largest, taking the largest over
+        the objectives, so 1.0 is the most influential parameter'''
+        mu_star = self.mu_star.reshape((self.k, -1))
+        top     = numpy.max(mu_star, axis=0)
+        return numpy.max(mu_star / numpy.where(top > 0, top, 1.0), axis=1)
+
+    def ranking(self):
+        '''The parameters, most influential first'''
+        return [int(i) for i in numpy.argsort(-self.importance(), kind='mergesort')]
+
+    def shortlist(self, threshold=0.1, count=None):
+        '''The parameters (in column order) whose importance() is at least threshold, or
+        the count most influential'''
+        if count is not None:
+            return sorted(self.ranking()[:int(count)])
+        return [int(i) for i in numpy.flatnonzero(self.importance() >= threshold)]
+
+    def reduce(self, n, threshold=0.1, count=None, reference=None, **sampleArgs):
+        '''A Sample of the shortlisted parameters, and the objective of its rows.
+
+        Parameters
+        ----------
+        n : int
+            Number of low discrepancy draws of the Sample
+        threshold, count : see shortlist()
+        reference : numpy.array, optional (default: the centre of the unit cube)
+            Unit cube point at which the other parameters are fixed
+        sampleArgs : passed to Sample (e.g. scheme, lazy)
+
+        Returns
+        -------
+        (sample, objective) : Sample and Reduction
+            The Sample of the shortlisted columns, and the objective function taking its
+            rows (see Reduction), for Varsens(objective, sample=sample, vectorized=...)
+        '''
+        columns   = self.shortlist(threshold, count)
+        if self.verbose: print "Screened %d of %d parameters: %s" % (len(columns), self.k, columns)
+        objective = Reduction(self.objective_func, self.k, columns, self.scaling, reference, self.vectorized)
+        sampleArgs.setdefault('verbose', self.verbose)
+        return Sample(len(columns), n, objective.scaling, **sampleArgs), objective
+
+class Reduction(object):
+    ''' An objective function of the shortlisted columns of a k parameter objective, the
+        other parameters fixed at a reference point.
+
+        Parameters
+        ----------
+        objective_func : function
+            The objective of all k parameters
+        k : int
+            Number of parameters of objective_func
+        columns : list of int
+            The parameters that are sampled
+        scaling_func : function
+            Maps points of the unit cube (all k columns) to parameters
+        reference : numpy.array, optional (default: the centre of the unit cube)
+            Unit cube point at which the other parameters are fixed
+        vectorized : bool, optional (default: False)
+            objective_func takes a block of rows
+    '''
+    def __init__(self, objective_func, k, columns, scaling_func, reference=None, vectorized=False):
+        self.objective_func = objective_func
+        self.k              = int(k)
+        self.columns        = numpy.asarray(columns, dtype=int)
+        self.scaling_func   = scaling_func
+        self.reference      = 0.5*numpy.ones(self.k) if reference is None else numpy.asarray(reference, dtype=numpy.float64)
+        self.vectorized     = vectorized
+        self.fixed          = numpy.asarray(scaling_func(self.reference[None,:]))[0]
+
+    def scaling(self, points):
+        '''Scale unit cube points of the shortlisted columns, as the full scaling does'''
+        full = numpy.empty((len(points), self.k))
+        full[:] = self.reference
+        full[:, self.columns] = points
+        return numpy.asarray(self.scaling_func(full))[:, self.columns]
+
+    def expand(self, x):
+        '''The full parameter rows of rows x of the shortlisted columns'''
+        x    = numpy.atleast_2d(x)
+        full = numpy.empty((len(x), self.k))
+        full[:] = self.fixed
+        full[:, self.columns] = x
+        return full
+
+    def full(self, sens, fill=0.0):
+        '''Spread sensitivities of the shortlisted columns (e.g. Varsens.sens) over all k
+        parameters, with fill for the screened out ones'''
+        sens   = numpy.asarray(sens)
+        result = fill*numpy.ones((self.k,)+sens.shape[1:])
+        result[self.columns] = sens
+        return result
+
+    def __call__(self, x):
+        if self.vectorized: return self.objective_func(self.expand(x))
+        return self.objective_func(self.expand(x)[0])
@@ -0,0 +1,226 @@
+"""Sensitivities from a polynomial chaos expansion (PCE) surrogate of the objective.
+
+The objective is approximated by a sum of multivariate Legendre polynomials of the
+parameters mapped to the unit cube, which are orthonormal for independent uniform
+inputs. The Sobol indices of the expansion follow from its coefficients alone (Sudret
+2008): the variance is the sum of the squared coefficients, and the variance due to a
+set of parameters is the sum over the terms involving them. A few hundred evaluations
+(e.g. just the M_1 and M_2 rows of a Sample, see from_sample()) are often enough for a
+smooth objective, where the Saltelli estimates need 2n(1+k).
+
+The coefficients are fitted by sparse least squares: orthogonal matching pursuit adds
+the basis term most correlated with the residual one at a time, and the number of terms
+with the smallest leave-one-out error is kept (Blatman and Sudret 2011). The
+leave-one-out error relative to the variance of the values (self.error) tells how far
+the surrogate, and so its indices, can be trusted.
+"""
+
+import numpy
+from varsens.saltelli import _evaluate_block
+
+def multi_indices(k, degree, q=1.0, interaction=None):
+    '''The (terms, k) degrees of each parameter in the terms of total degree at most
+    degree, with q-norm (sum of degree**q)**(1/q) at most degree (q < 1 drops high
+    order interactions) and at most interaction parameters each. The constant term is
+    first.'''
+    indices = [()]
+    for i in range(k):
+        indices = [a + (d,) for a in indices for d in range(degree+1-sum(a))]
+    alpha = numpy.array(sorted(indices, key=lambda a: (sum(a), [-d for d in a])), dtype=int).reshape((-1, k))
+    keep  = numpy.sum(alpha.astype(float)**q, axis=1)**(1.0/q) <= degree + 1e-9
+    if interaction is not None:
+        keep &= numpy.sum(alpha > 0, axis=1) <= interaction
+    return alpha[keep]
+
+def legendre(u, degree):
+    '''The (len(u), k, degree+1) orthonormal Legendre polynomials of the unit cube points u'''
+    t = 2.0*numpy.atleast_2d(u) - 1.0
+    P = numpy.ones(t.shape + (degree+1,))
+    if degree > 0: P[..., 1] = t
+    for d in range(1, degree):
+        P[..., d+1] = ((2*d+1)*t*P[..., d] - d*P[..., d-1]) / (d+1)
+    return P * numpy.sqrt(2*numpy.arange(degree+1) + 1.0)
+
+class PCE(object):
+    ''' A sparse polynomial chaos expansion of an objective, and its Sobol indices.
+
+        Parameters
+        ----------
+        points : numpy.array of shape (N, k)
+            The evaluated points mapped to the unit cube [0,1]^k, where the parameters
+            are uniform
+        values : numpy.array of shape (N,) or (N, m)
+            The objective values at the points. Rows with a NaN are left out.
+        degree : int, optional (default: 3)
+            Maximum total degree of the polynomials
+        q : float, optional (default: 1.0)
+            q-norm truncation of the basis, see multi_indices()
+        interaction : int, optional (default: None)
+            Maximum number of parameters in a term
+        max_terms : int, optional (default: N/2)
+            Maximum number of terms selected for each objective
+        second_order : bool or list of pairs, optional (default: True)
+            As for Varsens: sens_2 and sens_2n of shape (k, k, m), of shape
+            (len(pairs), m) for a list of pairs, or None
+        verbose : bool, optional (default: True)
+
+        After construction self.sens, self.sens_t, self.sens_2 and self.sens_2n have
+        the shapes of the Varsens estimates: sens_2 is the index of the variance due to
+        the pair (first orders and interaction), and sens_2n that of the parameters other
+        than the pair. self.var_y and self.E_2 are the variance and squared mean of the
+        expansion, self.coefficients the (terms, m) coefficients of the basis
+        self.alpha, and self.error the leave-one-out error relative to the variance.
+
+        Examples
+        ________
+            >>> from varsens import *
+            >>> import numpy
+            >>> u = numpy.random.RandomState(1).rand(50, 3)
+            >>> p = pce.PCE(u, u[:,0] + 2*u[:,1], degree=2, verbose=False)
+            >>> numpy.round(p.sens[:,0], 6).tolist()
+            [0.2, 0.8, 0.0]
+            >>>
+
+    '''
+    def __init__(self, points, values, degree=3, q=1.0, interaction=None, max_terms=None,
+                 second_order=True, verbose=True):
+        points = numpy.atleast_2d(numpy.asarray(points, dtype=numpy.float64))
+        values = numpy.asarray(values, dtype=numpy.float64).reshape((len(points), -1))
+        valid  = numpy.all(numpy.isfinite(values), axis=1)
+        self.points       = points[valid]
+        self.values       = values[valid]
+        self.k            = points.shape[1]
+        self.degree       = int(degree)
+        self.second_order = second_order
+        self.verbose      = verbose
+        self.alpha        = multi_indices(self.k, self.degree, q, interaction)
+        self.max_terms    = int(max_terms) if max_terms else max(1, len(self.values)//2)
+        if self.verbose: print "Fitting %d objectives on %d points, %d candidate terms" % (self.values.shape[1], len(self.values), len(self.alpha))
+
+        Psi = self.basis(self.points)
+        m   = self.values.shape[1]
+        self.coefficients = numpy.zeros((len(self.alpha), m))
+        self.error        = numpy.zeros(m)
+        for j in range(m):
+            active, c, self.error[j] = self.fit(Psi, self.values[:, j])
+            self.coefficients[active, j] = c
+        if self.verbose: print "Selected %s terms, leave-one-out error %s" % (numpy.count_nonzero(self.coefficients, axis=0), self.error)
+
+        self.indices()
+
+    def basis(self, points):
+        '''The (len(points), terms) basis polynomials at unit cube points'''
+        L   = legendre(points, self.degree)
+        Psi = numpy.ones((len(L), len(self.alpha)))
+        for i in range(self.k):
+            Psi *= L[:, i, self.alpha[:, i]]
+        return Psi
+
+    def fit(self, Psi, y):
+        '''Orthogonal matching pursuit of y on the columns of Psi, starting from the
+        constant. Returns the selected columns, their coefficients and the relative
+        leave-one-out error, for the number of terms with the smallest error.'''
+        var    = numpy.var(y) or 1.0
+        active = [0]
+        best   = None
+        for step in range(min(self.max_terms, len(self.alpha), len(y)-1)):
+            if step > 0:
+                corr = numpy.abs(numpy.dot(Psi.T, r))
+                corr[active] = -1
+                active.append(int(numpy.argmax(corr)))
+            Q, R = numpy.linalg.qr(Psi[:, active])
+            if numpy.min(numpy.abs(numpy.diag(R))) < 1e-10 * numpy.max(numpy.abs(numpy.diag(R))):
+                break # The new term is (numerically) a combination of the others
+            c = numpy.linalg.solve(R, numpy.dot(Q.T, y))
+            r = y - numpy.dot(Psi[:, active], c)
+            h = numpy.minimum(numpy.sum(Q**2, axis=1), 1 - 1e-12)
+            loo = numpy.mean((r / (1.0 - h))**2) / var
+            if best is None or loo < best[2]:
+                best = (list(active), c, loo)
+        return best
+
+    def indices(self):
+        '''Compute the variance, and the first, total and second order indices, from the
+        coefficients'''
+        c2 = self.coefficients[1:]**2
+        s  = self.alpha[1:] > 0 # The parameters in each (non constant) term
+        self.E_2   = self.coefficients[0]**2
+        self.var_y = numpy.sum(c2, axis=0)
+        var        = numpy.where(self.var_y > 0, self.var_y, 1.0)
+        only       = numpy.sum(s, axis=1) == 1
+        self.sens   = numpy.array([numpy.sum(c2[s[:, i] & only], axis=0) for i in range(self.k)]) / var
+        self.sens_t = numpy.array([numpy.sum(c2[s[:, i]], axis=0) for i in range(self.k)]) / var
+
+        if self.second_order is False:
+            self.sens_2 = self.sens_2n = None
+            return
+        if self.second_order is True:
+            pairs = [(a, b) for a in range(self.k) for b in range(self.k)]
+        else:
+            pairs = [tuple(p) for p in numpy.array(self.second_order, dtype=int).reshape((-1, 2))]
+        sens_2  = numpy.zeros((len(pairs), c2.shape[1]))
+        sens_2n = numpy.zeros((len(pairs), c2.shape[1]))
+        for p, (a, b) in enumerate(pairs):
+            inside     = ~numpy.any(numpy.delete(s, [a, b], axis=1), axis=1) # Only a and b
+            sens_2[p]  = numpy.sum(c2[inside], axis=0)
+            sens_2n[p] = numpy.sum(c2[~(s[:, a] | s[:, b])], axis=0)
+        sens_2  /= var
+        sens_2n /= var
+        if self.second_order is True:
+            sens_2  = sens_2.reshape((self.k, self.k, -1))
+            sens_2n = sens_2n.reshape((self.k, self.k, -1))
+        self.sens_2, self.sens_2n = sens_2, sens_2n
+
+    def predict(self, points):
+        '''The (len(points), m) values of the expansion at unit cube points'''
+        return numpy.dot(self.basis(points), self.coefficients)
+
+    def compare(self, varsens):
+        '''The largest absolute difference between each index of the expansion and the
+        estimate of a Varsens analysis of the same objective. The diagonals of sens_2 and
+        sens_2n, which the Saltelli estimates leave undefined, are not compared.'''
+        result = {}
+        for name in ('sens', 'sens_t', 'sens_2', 'sens_2n'):
+            a, b = getattr(self, name), getattr(varsens, name, None)
+            if a is None or b is None: continue
+            b = numpy.asarray(b).reshape(a.shape)
+            if name in ('sens_2', 'sens_2n') and self.second_order is True:
+                off = ~numpy.eye(self.k, dtype=bool)
+                a, b = a[off], b[off]
+            result[name] = float(numpy.max(numpy.abs(a - b)))
+        return result
+
+def from_sample(sample, objective, inverse=None, vectorized=False, **pceArgs):
+    '''Fit a PCE on the M_1 and M_2 rows of a Sample.
+
+    Parameters
+    ----------
+    sample : Sample
+        The sample. Only its M_1 and M_2 rows (2n, or n for the radial scheme) are used.
+    objective : Objective or function
+        The evaluated Objective of the sample, or the objective function, which is then
+        evaluated on the M_1 and M_2 rows only
+    inverse : function, optional
+        Maps parameter rows back to the unit cube (the inverse of the sample's scaling).
+        By default each column is mapped by its empirical distribution, which is exact
+        for the ranks of any increasing scaling.
+    vectorized : bool, optional (default: False)
+        The objective function takes a block of rows
+    pceArgs : passed to PCE
+
+    Returns
+    -------
+    PCE
+    '''
+    x = sample.M_1 if sample.scheme == "radial" else numpy.vstack((sample.M_1, sample.M_2))
+    if callable(objective) and not hasattr(objective, 'fM_1'):
+        y = _evaluate_block(objective, x, vectorized)[0]
+    elif sample.scheme == "radial":
+        y = numpy.asarray(objective.fM_1)
+    else:
+        y = numpy.vstack((objective.fM_1, objective.fM_2))
+    if inverse is not None:
+        u = numpy.asarray(inverse(x))
+    else:
+        u = (numpy.argsort(numpy.argsort(x, axis=0, kind='mergesort'), axis=0) + 0.5) / len(x)
+    return PCE(u, y, **pceArgs)
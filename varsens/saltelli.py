@@ -1,8 +1,15 @@
-import ghalton
 import numpy
 import sys
 # import random
 import os
+import multiprocessing
+import Queue
+from varsens import store
+from varsens import convergence
+from varsens import bootstrap
+from varsens.checkpoint import Checkpoint
+from varsens.cache import Cache
+from varsens.sequence import Sequence, LatinHypercube, create as create_sequence
 
 def move_spinner(i):
     '''A function to create a text spinner during long computations'''
@@ -10,10 +17,265 @@ def move_spinner(i):
     print " [%s] %d\r" % (spin[i%4],i)
     sys.stdout.flush()
 
+# Reason codes of Objective.failures
+EVALUATED = 0 # The objective was evaluated (its value may still be NaN)
+EXCEPTION = 1 # objective_func raised an exception
+TIMEOUT   = 2 # objective_func took longer than the timeout
+
+class EvaluationTimeout(Exception):
+    '''Raised when an evaluation of the objective function exceeds its timeout'''
+    pass
+
+def _serve(objective_func, conn, parent):
+    '''The loop of a worker process: evaluate each point received on conn and send back
+    (True, value), or (False, exception) if objective_func raised. None stops the loop.'''
+    parent.close() # The parent's end, so the loop sees EOF if the parent dies
+    while True:
+        try:
+            x = conn.recv()
+        except EOFError:
+            break
+        if x is None: break
+        try:
+            result = (True, objective_func(x))
+        except Exception as e:
+            result = (False, e)
+        try:
+            conn.send(result)
+        except Exception: # The value or exception cannot be pickled
+            conn.send((False, Exception(repr(result[1]))))
+
+class _Worker(object):
+    '''A process evaluating objective_func, killed when an evaluation exceeds its timeout
+    and started again for the next one. The process is forked, so objective_func need not
+    be picklable; the points and values are.'''
+    def __init__(self, objective_func):
+        self.objective_func = objective_func
+        self.process        = None
+
+    def start(self):
+        self.conn, child = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=_serve, args=(self.objective_func, child, self.conn))
+        self.process.daemon = True
+        self.process.start()
+        child.close()
+
+    def kill(self):
+        self.process.terminate()
+        self.process.join()
+        self.conn.close()
+        self.process = None
+
+    def close(self):
+        if self.process is None: return
+        try:
+            self.conn.send(None)
+            self.process.join(1)
+        except Exception:
+            pass
+        if self.process.is_alive(): self.process.terminate()
+        self.process.join()
+        self.conn.close()
+        self.process = None
+
+    def __call__(self, x, timeout=None):
+        if self.process is None: self.start()
+        self.conn.send(x)
+        if not self.conn.poll(timeout):
+            self.kill()
+            raise EvaluationTimeout("Objective evaluation timed out after %g seconds" % timeout)
+        try:
+            ok, value = self.conn.recv()
+        except EOFError: # The process died, e.g. the solver crashed it
+            self.kill()
+            raise Exception("The worker process evaluating the objective died")
+        if not ok: raise value
+        return value
+
+class _Workers(object):
+    '''Worker processes evaluating objective_func under a timeout (see Objective). A
+    signal cannot interrupt an objective stuck in compiled code (e.g. an ODE solver), so
+    each evaluation runs in a worker process that is killed when it takes too long. Calls
+    from several threads each take an idle worker.'''
+    def __init__(self, objective_func, processes=1):
+        self.workers = [_Worker(objective_func) for i in range(int(processes))]
+        self.idle    = Queue.Queue()
+        for worker in self.workers: self.idle.put(worker)
+
+    def __call__(self, x, timeout=None):
+        worker = self.idle.get()
+        try:
+            return worker(x, timeout)
+        finally:
+            self.idle.put(worker)
+
+    def close(self):
+        for worker in self.workers: worker.close()
+
+def _call(objective_func, x, timeout=None):
+    '''Call objective_func(x), raising EvaluationTimeout after timeout seconds. With a
+    timeout the call runs in a worker process that is killed when the time is up, so
+    objective_func is normally a _Workers reused across calls; any other function gets a
+    worker of its own for this call.'''
+    if not timeout: return objective_func(x)
+    if isinstance(objective_func, _Workers): return objective_func(x, timeout)
+    workers = _Workers(objective_func)
+    try:
+        return workers(x, timeout)
+    finally:
+        workers.close()
+
+def _evaluate_point(objective_func, p, m=None, timeout=None, capture=False):
+    '''Evaluate objective_func at a single point, returning (values, reason). If capture is
+    True an exception or timeout gives m NaN values and its reason code instead of raising.'''
+    try:
+        return numpy.reshape(_call(objective_func, p, timeout), -1), EVALUATED
+    except EvaluationTimeout:
+        if not capture: raise
+        return numpy.nan*numpy.ones(m), TIMEOUT
+    except Exception:
+        if not capture: raise
+        return numpy.nan*numpy.ones(m), EXCEPTION
+
+def _evaluate_block(objective_func, x, vectorized, m=None, timeout=None, capture=False):
+    '''Evaluate objective_func on a block of points x, returning an array of shape (rows, m)
+    and the reason code of each row. A vectorized block that fails (or exceeds timeout for
+    each of its rows) is evaluated again one row at a time, so only the failing rows are
+    lost. Defined at module level so that it can be sent to worker processes.'''
+    if vectorized:
+        if len(x) == 1:
+            y, r = _evaluate_point(objective_func, x, m, timeout, capture)
+            return numpy.reshape(y, (1, -1)), numpy.array([r], dtype=numpy.int8)
+        try:
+            y = _call(objective_func, x, timeout and timeout*len(x))
+            return numpy.reshape(y, (len(x), -1)), numpy.zeros(len(x), dtype=numpy.int8)
+        except Exception:
+            if not capture: raise
+        results = [_evaluate_point(objective_func, x[i:i+1], m, timeout, capture) for i in range(len(x))]
+    else:
+        results = [_evaluate_point(objective_func, p, m, timeout, capture) for p in x]
+    return numpy.array([y for y, r in results]), numpy.array([r for y, r in results], dtype=numpy.int8)
+
+def _probe(objective_func, rows, vectorized, timeout=None, capture=False):
+    '''Evaluate objective_func on rows, an iterable of blocks of one row, until it succeeds,
+    to learn the shape of its value. Returns that value (for one point) and the reason codes
+    of the rows that failed before it, or None for the value if every row failed. Without
+    capture the first failure is raised.'''
+    lost = []
+    for x in rows:
+        try:
+            y = numpy.asarray(_call(objective_func, x if vectorized else x[0], timeout))
+            return (y[0] if vectorized else y), lost
+        except EvaluationTimeout:
+            if not capture: raise
+            lost.append(TIMEOUT)
+        except Exception:
+            if not capture: raise
+            lost.append(EXCEPTION)
+    return None, lost
+
+def evaluate_rows(objective_func, x, vectorized=False, batch_size=None, m=None, timeout=None, capture=False):
+    '''Evaluate objective_func on the rows x (e.g. a shard, see varsens.shard), in blocks of
+    batch_size rows, returning an array of shape (rows, m) and the reason code of each row
+    (see Objective.failures). With a timeout the evaluations run in a worker process that
+    is killed when one takes too long.
+
+    If capture is True failed rows are filled with m NaN values. When m is not given it
+    is taken from the first row that evaluates, each row being evaluated only once.'''
+    batch    = batch_size or len(x) or 1
+    function = _Workers(objective_func) if timeout else objective_func
+    results  = []
+    start    = 0
+    try:
+        if capture and m is None:
+            y, lost = _probe(function, (x[i:i+1] for i in range(len(x))), vectorized, timeout, True)
+            if y is None:
+                raise Exception("No row could be evaluated, so the number of objectives is unknown")
+            m = numpy.size(y)
+            results.append((numpy.nan*numpy.ones((len(lost), m)), numpy.array(lost, dtype=numpy.int8)))
+            results.append((numpy.reshape(y, (1, m)), numpy.array([EVALUATED], dtype=numpy.int8)))
+            start = len(lost) + 1
+        results.extend(_evaluate_block(function, x[i:i+batch], vectorized, m, timeout, capture)
+                       for i in range(start, len(x), batch))
+    finally:
+        if timeout: function.close()
+    return numpy.vstack([y for y, r in results]), numpy.concatenate([r for y, r in results])
+
+class _Reduced(object):
+    '''An objective_func whose outputs are reduced before they are stored (see Objective).
+    A class rather than a closure so that it can be sent to worker processes.'''
+    def __init__(self, objective_func, reduce, vectorized):
+        self.objective_func = objective_func
+        self.reduce         = reduce
+        self.vectorized     = vectorized
+
+    def __call__(self, x):
+        y = numpy.asarray(self.objective_func(x))
+        if not self.vectorized: y = y[None] # A block of one row
+        if callable(self.reduce):
+            y = self.reduce(y)
+        elif isinstance(self.reduce, tuple):
+            y = y[(slice(None),)+self.reduce]
+        else:
+            y = y[:, self.reduce]
+        return y if self.vectorized else y[0]
+
+def _read(file, delimiter=None, dtype=None):
+    '''Read a sample or objective file. Binary stores (.npy/.json) are memory mapped, and
+    only copied if they must be converted to dtype.'''
+    if os.path.splitext(file)[1] in ('.npy', '.json'):
+        x = store.open_store(file)[1]
+        return x if dtype is None or x.dtype == dtype else x.astype(dtype)
+    return numpy.loadtxt(open(file, "rb"), delimiter=delimiter, dtype=dtype or numpy.float64)
+
+def text_format(dtype):
+    '''The numpy.savetxt format for values of dtype: single precision needs only 9
+    significant digits to be read back exactly'''
+    return '%.9g' if numpy.dtype(dtype).itemsize <= 4 else '%.18e'
+
+SCHEMES = ("double", "jansen", "radial")
+
+def layout(scheme, k):
+    '''The blocks of n rows that make up the flat layout of a sampling scheme.
+
+        "double" : M_1, M_2, N_j[0..k-1], N_nj[0..k-1], 2n(1+k) rows, for the double
+                   estimates of first, total and second order sensitivities
+        "jansen" : M_1, M_2, N_nj[0..k-1], n(k+2) rows, for first order (Saltelli 2010)
+                   and total (Jansen) sensitivities
+        "radial" : M_1, N_nj[0..k-1], n(k+1) rows, each draw of M_1 the centre of a
+                   star of k points, for total (Jansen) sensitivities only
+
+    Returns
+    -------
+    (kinds, params) : arrays of int
+        The matrix of each block (0: M_1, 1: M_2, 2: N_j, 3: N_nj) and, for N_j and N_nj,
+        its parameter
+    '''
+    if scheme == "double":
+        kinds, params = [0, 1] + [2]*k + [3]*k, [0, 0] + list(range(k))*2
+    elif scheme == "jansen":
+        kinds, params = [0, 1] + [3]*k, [0, 0] + list(range(k))
+    elif scheme == "radial":
+        kinds, params = [0] + [3]*k, [0] + list(range(k))
+    else:
+        raise ValueError("Unknown scheme '%s', must be one of %s" % (scheme, ", ".join(SCHEMES)))
+    return numpy.array(kinds, dtype=int), numpy.array(params, dtype=int)
+
+def membership(groups, k):
+    '''The (len(groups), k) boolean matrix of which of the k parameters are in each group.
+    groups is a list of lists of parameter (column) indices, and must be a partition of
+    range(k).'''
+    G = numpy.zeros((len(groups), k), dtype=bool)
+    for i, group in enumerate(groups):
+        G[i, numpy.asarray(group, dtype=int)] = True
+    if not numpy.all(numpy.sum(G, axis=0) == 1) or numpy.sum(G) != sum(len(g) for g in groups):
+        raise Exception("Parameter groups must contain each of the %d parameters exactly once" % k)
+    return G
+
 class Sample(object):
     ''' An object containing the definition of the sample space, as well as the 
         matrices M_1, M_2, N_j, and N_nj. Generated via Halton low-discrepancy
-        sequence by default.
+        sequence by default, or any of the sequences in varsens.sequence.
         
         Parameters
         ----------
@@ -27,23 +289,49 @@ class Sample(object):
             varsens.scale for helpers.
         discard : int, optional (default: 0)
             Number of samples to discard from the beginning of the generated
-            Halton sequence (note that this is in addition to the 20*k that are
-            discarded by default). This makes it possible to continue a sample from
-            where it was terminated if it is determined that sufficient precision in
-            the sensitivity calculations has not been achieved.
+            sequence (note that this is in addition to the burn in of the sequence,
+            e.g. the 20*k initial Halton points, discarded by default). This makes
+            it possible to continue a sample from where it was terminated if it is
+            determined that sufficient precision in the sensitivity calculations has
+            not been achieved. With "lhs" it must be a multiple of n.
+        sequence : str or varsens.sequence.Sequence, optional (default: "halton")
+            Low discrepancy sequence to generate: "halton", "scrambled_halton", "sobol",
+            "lattice", "lhs" or "ghalton" (see varsens.sequence), or a generator. Sobol
+            usually converges faster for large k. The discarded points are skipped, not
+            generated (except with "ghalton").
+        seed : int, optional (default: 1)
+            Seed of the shuffle of M_2 (see varsens.shard, which regenerates the rows of a
+            sample from k, n, scaling, sequence, discard and seed alone)
         verbose : bool, optional (default: True)
             Verbose output
         raw : Array, optional (default: None)
             A preloaded array, to be used as is with no shuffling. Requires k and n to match.
+        dtype : numpy dtype, optional (default: None)
+            Type of the stored sample, e.g. numpy.float32 to halve its memory and the size
+            of exported files. By default generated samples are float64 and loaded ones
+            keep the type they were stored with.
+        scheme : str, optional (default: "double")
+            The sampling scheme (see layout()): "double" evaluates 2n(1+k) rows and
+            gives first, total and second order sensitivities; "jansen" n(k+2) rows for
+            first and total order; "radial" n(k+1) rows for total order only. N_j is
+            only generated for "double".
+        groups : list of lists of int, optional (default: None)
+            Parameter groups, a partition of the k columns (e.g. the rate constants of each
+            reaction). N_j[i] and N_nj[i] then exchange the columns of group i, so the
+            sample has one block per group instead of one per parameter and Varsens
+            reports the sensitivities of the groups. self.factors is the number of blocks
+            (groups, or k).
+        lazy : bool, optional (default: False)
+            Store only M_1 and M_2. N_j and N_nj are then ResampleMatrix objects which build
+            each block (or single rows) on demand, reducing memory from O(n*k^2) to O(n*k).
         loadArgs : keyword arguments, optional
             Arguments for loading pre-generated sample spaces from file (passed to 
             Sample.load()). There are two types of samples that can be loaded: 1) A 
             sample space of dimension (2*n*(1+k),k); this is usually a Halton sample 
             generated in Sample._init_() and exported through Sample.export(); 2) A 
             sample space of dimension (2*n,k); this is usually a sample generated by 
-            some other method (e.g., Sobol; see the additional quantlib directory in 
-            the varsens package for some C++ quantlib sample space generating code to 
-            make a sample file). If a sample space is loaded that does not conform to 
+            some other method (e.g., an external generator; Sobol samples can instead
+            be generated directly with sequence="sobol"). If a sample space is loaded that does not conform to 
             either of these dimensions then an Exception is raised.
             ---------------------
             Recognized arguments:
@@ -59,12 +347,21 @@ class Sample(object):
             'postfix'  : File postfix (optional; default = '.txt').
             'delimiter': Column delimiter in input files (optional; default = '\t').
     '''
-    def __init__(self, k, n, scaling=None, discard=0, verbose=True, raw=None, **loadArgs):
+    def __init__(self, k, n, scaling=None, discard=0, verbose=True, raw=None, lazy=False, sequence="halton",
+                 seed=1, dtype=None, scheme="double", groups=None, **loadArgs):
         
         self.k = int(k) # Cast to int to allow for scientific notation (useful for large models).
         self.n = int(n)
         self.scaling = scaling
         self.verbose = verbose
+        self.lazy    = lazy
+        self.dtype   = dtype
+        self.scheme  = scheme
+        self.groups  = None if groups is None else [[int(c) for c in group] for group in groups]
+        self.G       = None if groups is None else membership(self.groups, self.k)
+        self.factors = self.k if groups is None else len(self.groups)
+        self.kinds, self.params = layout(scheme, self.factors)
+        self.sequence = None
 
         if not raw is None:
             if self.verbose: print "Using provided raw sample"
@@ -74,40 +371,74 @@ class Sample(object):
         elif loadArgs:
             if self.verbose: print "Loading Sample from loadArgs"
             x = self.load(**loadArgs)
-            if x.shape == (2*self.n*(1+self.k), self.k): return
+            if x.shape == (self.n*len(self.kinds), self.k):
+                self.dtype = x.dtype
+                return
         else: # Generate the sample
             if self.verbose: print "Generating Low Discrepancy Sequence"
             if not self.scaling:
                 raise Exception("Generating a fresh sample space requires that a 'scaling' function be defined.")
-            seq = ghalton.Halton(self.k)
-            seq.get(20*self.k + int(discard)) # Remove initial linear correlated points plus any additional specified by the user.
-            x = numpy.array(seq.get(2*self.n))
+            seq = sequence if isinstance(sequence, Sequence) else create_sequence(sequence, self.k, self.n)
+            if isinstance(seq, LatinHypercube): # M_1 and M_2 must be whole blocks
+                seq.check(discard)
+                seq.check(self.n)
+            seq.skip(seq.burn_in + int(discard)) # Remove initial points (e.g. linearly correlated) plus any additional specified by the user.
+            x = seq.get(2*self.n)
+            self.sequence = seq # Kept so the sample can be extended
 
         if scaling is None:
             if self.verbose: print "Defaulting to identity scaling of parameter space"
             self.scaling = lambda x:x
 
         
+        if self.dtype is None: self.dtype = numpy.float64
         if self.verbose: print "Generating M_1"
-        self.M_1 = self.scaling(x[0:self.n,...])
+        self.M_1 = numpy.asarray(self.scaling(x[0:self.n,...]), dtype=self.dtype)
         
         if self.verbose: print "Generating M_2"
-        self.M_2 = self.scaling(x[self.n:(2*self.n),...])
+        self.M_2 = numpy.array(self.scaling(x[self.n:(2*self.n),...]), dtype=self.dtype)
 
         # NOTE: This is the magic trick that makes it all work, not mentioned in Saltelli's papers.
         # There can be no correlation between sample M_1 and M_2
         if self.verbose: print "Eliminating correlations"
-        numpy.random.seed(1)
-        numpy.random.shuffle(self.M_2) # Eliminate any correlation
+        numpy.random.RandomState(seed).shuffle(self.M_2) # Eliminate any correlation
 
-        # Generate the sample/resample permutations
-        if self.verbose: print "Generating N_j"
-        self.N_j  = self.generate_N_j(self.M_1, self.M_2) # See Eq (11)
-        
-        if self.verbose: print "Generating N_nj"
-        self.N_nj = self.generate_N_j(self.M_2, self.M_1)
+        self._resample()
         
         if self.verbose: print "...Sample Created."
+
+    def _resample(self):
+        '''Generate the sample/resample permutations N_j and N_nj from M_1 and M_2'''
+        double = self.scheme == "double" # Only the double estimates use N_j
+        if self.lazy:
+            self.N_j  = ResampleMatrix(self.M_1, self.M_2, self.G) if double else None
+            self.N_nj = ResampleMatrix(self.M_2, self.M_1, self.G)
+        else:
+            if self.verbose and double: print "Generating N_j"
+            self.N_j  = self.generate_N_j(self.M_1, self.M_2) if double else None # See Eq (11)
+
+            if self.verbose: print "Generating N_nj"
+            self.N_nj = self.generate_N_j(self.M_2, self.M_1)
+
+    def extend(self, n_extra):
+        '''Grow the sample by n_extra draws, continuing the low discrepancy sequence where it
+        left off. The new draws are appended to M_1 and M_2 (the new M_2 rows shuffled among
+        themselves), so rows j < n are unchanged and only the new rows need evaluating; see
+        Objective.extend(). Only generated samples can be extended.'''
+        n_extra = int(n_extra)
+        if self.sequence is None:
+            raise Exception("Only a sample generated from a low discrepancy sequence can be extended.")
+        if isinstance(self.sequence, LatinHypercube): # The new M_1 rows must be whole blocks
+            self.sequence.check(n_extra)
+        if self.verbose: print "Extending sample from n=%d to n=%d" % (self.n, self.n+n_extra)
+        x   = numpy.array(self.sequence.get(2*n_extra))
+        M_2 = numpy.array(self.scaling(x[n_extra:,...]), dtype=self.dtype)
+        numpy.random.RandomState(self.n).shuffle(M_2) # Eliminate any correlation
+        self.M_1 = numpy.vstack((self.M_1, numpy.asarray(self.scaling(x[0:n_extra,...]), dtype=self.dtype)))
+        self.M_2 = numpy.vstack((self.M_2, M_2))
+        self.n  += n_extra
+        self._resample()
+        return self
     
     def generate_N_j(self, M_1, M_2):
         '''When passing the quasi-random low discrepancy-treated M_1 and M_2 matrices, 
@@ -116,44 +447,37 @@ class Sample(object):
         Saisana, Tarantola, "Global Sensitivity Analysis"'''
 
         # allocate the space for the C matrix
-        N_j = numpy.array([M_2]*self.k)
+        N_j = numpy.array([M_2]*self.factors)
 
         # Now we have nparams copies of M_2. replace the i_th column of N_j with the i_th column of M_1
-        for i in range(self.k):
-            N_j[i,:,i] = M_1[:,i]
+        # (or the columns of the i_th group)
+        for i in range(self.factors):
+            if self.G is None: N_j[i,:,i] = M_1[:,i]
+            else:              N_j[i][:,self.G[i]] = M_1[:,self.G[i]]
             
         return N_j
 
+    def block(self, b):
+        '''Return block b of the flat layout (see layout()), n rows long'''
+        kind, i = self.kinds[b], self.params[b]
+        if kind == 0: return self.M_1
+        if kind == 1: return self.M_2
+        if kind == 2: return self.N_j[i]
+        return self.N_nj[i]
+
     def flat(self):
-        '''Return the sample space as an array 2*n*(1+k) long, containing arrays k long'''
+        '''Return the sample space as an array n*blocks long (2*n*(1+k) for the double
+        scheme), containing arrays k long'''
         
         # NEW CODE: Pre-allocates the flat matrix and then fills it
         # ----------------------------------------------------------
         if self.verbose: print "Flattening sample space..."
         
-        l1 = len(self.M_1)
-        l2 = len(self.M_2)
-        l3 = self.N_j.shape[0]*self.N_j.shape[1]
-        l4 = self.N_nj.shape[0]*self.N_nj.shape[1]
-          
-        x = numpy.zeros((l1+l2+l3+l4,self.k))
-        
-        if self.verbose: print "Flattening M_1"
-        x[0:l1]  = self.M_1
+        x = numpy.zeros((self.n*len(self.kinds),self.k), dtype=self.M_1.dtype)
         
-        if self.verbose: print "Flattening M_2"
-        x[l1:l1+l2] = self.M_2
-        
-        if self.verbose: print "Flattening N_j"
-        curr_length = l1+l2
-        for i in range(self.k):
-            x[curr_length:curr_length+len(self.N_j[i])] = self.N_j[i]
-            curr_length += len(self.N_j[i])
-        
-        if self.verbose: print "Flattening N_nj"
-        for i in range(self.k):
-            x[curr_length:curr_length+len(self.N_nj[i])] = self.N_nj[i]
-            curr_length += len(self.N_nj[i])
+        # One block of n rows at a time, in the order of the scheme's layout
+        for b in range(len(self.kinds)):
+            x[b*self.n:(b+1)*self.n] = self.block(b)
         
         if self.verbose: print "...Done. ( flattened.shape = ", x.shape, ")"
         
@@ -170,28 +494,82 @@ class Sample(object):
 #             x = numpy.append(x, self.N_nj[i], axis=0)
 #         return x
 
-    def export(self, outdir=os.getcwd(), prefix="sample", postfix=".txt", blocksize=float("inf"), delimiter="\t"):
-        # Flatten
-        f = self.flat()
+    def take(self, index):
+        '''Return the rows of the flattened sample space (see Sample.flat()) at the given
+        indices, without building the flattened array.'''
+        index = numpy.asarray(index, dtype=int)
+        seg   = index // self.n
+        j     = index %  self.n
+        kind  = self.kinds[seg]
+        i     = self.params[seg]
+        x     = numpy.zeros((len(index), self.k), dtype=self.M_1.dtype)
+        rows  = kind == 0
+        if numpy.any(rows): x[rows] = self.M_1[j[rows]]
+        rows  = kind == 1
+        if numpy.any(rows): x[rows] = self.M_2[j[rows]]
+        rows  = kind == 2
+        if numpy.any(rows): x[rows] = self.N_j[i[rows], j[rows]]
+        rows  = kind == 3
+        if numpy.any(rows): x[rows] = self.N_nj[i[rows], j[rows]]
+        return x
+
+    def rows(self, start, stop):
+        '''Return rows [start, stop) of the flattened sample space'''
+        return self.take(numpy.arange(start, stop))
+
+    def export(self, outdir=os.getcwd(), prefix="sample", postfix=".txt", blocksize=float("inf"), delimiter="\t",
+               binary=False, metadata=None):
+        '''Write the flattened sample space to file(s) for batch processing.
+
+        Text output is split into files of blocksize rows named prefix_1, prefix_2, ...
+        If binary is True a single prefix.npy is written instead, together with a
+        prefix.json header recording k, n, the scaling, any user metadata (a dict) and
+        the [start, stop) rows of each block; see varsens.store.'''
+        # Rows are generated n at a time straight from the sample, the flattened array is never built
+        total = self.n*len(self.kinds)
         # Sanity checks
-        if blocksize > len(f): blocksize = len(f)
+        if blocksize > total: blocksize = total
         else: blocksize = int(blocksize) # just to be safe
         prefix = str(prefix) # just to be safe
         prefix="_".join(prefix.split()) # remove all whitespace and join with underscores (just in case)
         if prefix[-1] == "_": prefix = prefix[:-1] # remove underscore at the end if there is one
         prefix = os.path.join(outdir,prefix)
+        if binary:
+            if self.verbose: print "Writing to %s.npy ..." % prefix,
+            header = {'kind'      : 'sample',
+                      'k'         : self.k,
+                      'n'         : self.n,
+                      'scheme'    : self.scheme,
+                      'groups'    : self.groups,
+                      'scaling'   : getattr(self.scaling, 'spec', getattr(self.scaling, '__name__', repr(self.scaling))),
+                      'blocksize' : blocksize,
+                      'blocks'    : store.blocks(total, blocksize),
+                      'metadata'  : metadata or {}}
+            data = store.create(prefix, (total, self.k), header, self.M_1.dtype)
+            for b in range(0, total, self.n):
+                data[b:b+self.n] = self.rows(b, min(b+self.n, total))
+            data.flush()
+            del data
+            if self.verbose: print "Done."
+            return
         # Write to file
-        nFiles = int(numpy.ceil(float(len(f)) / blocksize))
+        nFiles = int(numpy.ceil(float(total) / blocksize))
         if nFiles == 1:
             if self.verbose: print "Writing to %s%s ..." % (prefix, postfix),
-            numpy.savetxt("%s%s" % (prefix, postfix), f, delimiter=delimiter)
+            self._savetxt("%s%s" % (prefix, postfix), 0, total, delimiter)
             if self.verbose: print "Done."
         else:
             for b in range(nFiles):
                 if self.verbose: print "Writing to %s_%d%s ..." % (prefix, b+1, postfix),
-                numpy.savetxt("%s_%d%s" % (prefix, b+1, postfix), f[b*blocksize : (b+1)*blocksize], delimiter=delimiter)
+                self._savetxt("%s_%d%s" % (prefix, b+1, postfix), b*blocksize, min((b+1)*blocksize, total), delimiter)
                 if self.verbose: print "Done."
-                
+
+    def _savetxt(self, fname, start, stop, delimiter):
+        '''Write rows [start, stop) of the flattened sample space to fname, n rows at a time'''
+        with open(fname, "wb") as f:
+            for b in range(start, stop, self.n):
+                numpy.savetxt(f, self.rows(b, min(b+self.n, stop)), delimiter=delimiter, fmt=text_format(self.M_1.dtype))
+
     def load(self, indir='', loadFile=None, prefix=None, postfix='.txt', nFiles=None, offset=1, delimiter='\t'):
         
         FILES = []
@@ -214,41 +592,90 @@ class Sample(object):
             if not os.path.isfile(file):
                 raise Exception("Cannot find input file "+file)
             if self.verbose: print "Reading "+file+" ...",
-            sample.append(numpy.loadtxt(open(file, "rb"), delimiter=delimiter))
+            sample.append(_read(file, delimiter, self.dtype))
             if self.verbose: print "Done."
         
-        if self.verbose: print "Stacking...",
-        x = numpy.vstack(sample)
-        if self.verbose: print "Done."
+        if len(sample) == 1:
+            x = sample[0]
+        else:
+            if self.verbose: print "Stacking...",
+            x = numpy.vstack(sample)
+            if self.verbose: print "Done."
                     
         # Pre-generated UNSCALED sample
         if x.shape == (2*self.n, self.k):
             if not self.scaling:
                 raise Exception("Loading a pre-generated, unscaled sample space requires that a 'scaling' function be defined.")
         # Flattened SCALED sample
-        elif x.shape == (2*self.n*(1+self.k), self.k): 
+        elif x.shape == (self.n*len(self.kinds), self.k): 
             if self.verbose: print "Flattened sample detected"
+            # The matrices are views, so a memory mapped sample is not copied
+            blocks = x.reshape((len(self.kinds), self.n, self.k))
             if self.verbose: print "Extracting M_1"
-            self.M_1 = x[0:self.n,...]
+            self.M_1 = blocks[0]
             if self.verbose: print "Extracting M_2"
-            self.M_2 = x[self.n:2*self.n,...]
+            self.M_2 = blocks[1] if 1 in self.kinds else None
             if self.verbose: print "Extracting N_j"
-            curr_length = 2*self.n
-            self.N_j = numpy.zeros((self.k, self.n, self.k))
-            for i in range(self.k):
-                self.N_j[i] = x[curr_length:curr_length+self.n,...]
-                curr_length += self.n
+            self.N_j  = blocks[2:2+self.factors] if 2 in self.kinds else None
             if self.verbose: print "Extracting N_nj"
-            self.N_nj = numpy.zeros((self.k, self.n, self.k))
-            for i in range(self.k):
-                self.N_nj[i] = x[curr_length:curr_length+self.n,...]
-                curr_length += self.n
+            self.N_nj = blocks[-self.factors:]
             if self.verbose: print "...Done."
         else:
-            raise Exception("Loaded sample has shape "+str(x.shape)+". Must have shape (%d,%d) or (%d,%d)." % (2*self.n, self.k, 2*self.n*(1+self.k), self.k))
+            raise Exception("Loaded sample has shape "+str(x.shape)+". Must have shape (%d,%d) or (%d,%d)." % (2*self.n, self.k, self.n*len(self.kinds), self.k))
         
         return x
     
+class ResampleMatrix(object):
+    '''A lazy stand-in for the (k, n, k) N_j array of a Sample. Only references to M_1 and
+    M_2 are kept; block i (M_2 with its i-th column replaced by that of M_1, see
+    Sample.generate_N_j) is built when it is indexed. With parameter groups G (see
+    membership()) there is one block per group, taking the group's columns from M_1.
+
+    Supports len(), N_j[i] for a block, N_j[i, j] for single rows (i and j may be integer
+    arrays), iteration over blocks and numpy.array(N_j) to materialize the full array.
+    '''
+    def __init__(self, M_1, M_2, G=None):
+        self.M_1   = M_1
+        self.M_2   = M_2
+        self.G     = G
+        self.shape = (M_2.shape[1] if G is None else len(G), M_2.shape[0], M_2.shape[1])
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            i, j = key
+            i = numpy.asarray(i)
+            j = numpy.asarray(j)
+            if self.G is not None: return numpy.where(self.G[i], self.M_1[j], self.M_2[j])
+            x = numpy.array(self.M_2[j], copy=True)
+            if i.shape == () and j.shape == (): # single row
+                x[i] = self.M_1[j, i]
+            elif j.shape == ():                  # several blocks, same row
+                x = numpy.array([x]*len(i))
+                x[numpy.arange(len(i)), i] = self.M_1[j, i]
+            else:
+                x[numpy.arange(len(j)), i] = self.M_1[j, i]
+            return x
+        if key < 0: key += len(self)
+        if key < 0 or key >= len(self): raise IndexError("index %d out of range" % key)
+        if self.G is not None: return numpy.where(self.G[key], self.M_1, self.M_2)
+        x = numpy.array(self.M_2, copy=True)
+        x[:,key] = self.M_1[:,key]
+        return x
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __array__(self, dtype=None):
+        if self.G is not None: return numpy.array([self[i] for i in range(len(self))], dtype=dtype)
+        x = numpy.array([self.M_2]*len(self), dtype=dtype)
+        for i in range(len(self)):
+            x[i,:,i] = self.M_1[:,i]
+        return x
+
 class Objective(object):
     ''' Function parmeval calculates the fM_1, fM_2, and fN_ji arrays needed for variance-based
     global sensitivity analysis as prescribed by Saltelli and derived from the work by Sobol
@@ -257,7 +684,8 @@ class Objective(object):
     Parameters
     ----------
     k : int
-        Number of parameters that the objective function expects.
+        Number of parameters that the objective function expects (if the sample has
+        parameter groups, the number of groups is used instead).
     n : int
         Number of low discrepancy draws to use to estimate the variance.
     sample : Sample, optional (default: None)
@@ -268,6 +696,60 @@ class Objective(object):
     objective_vals : Array containing the raw values
     verbose : bool, optional (default: True)
         Verbose output.
+    vectorized : bool, optional (default: False)
+        If True the objective_func is passed a block of points, an array of shape (rows, k)
+        taken in Sample.flat() order, and must return an array of shape (rows,) or (rows, m).
+    batch_size : int, optional (default: n)
+        Number of points passed to a vectorized objective_func in a single call, and the
+        number of points in each task submitted to an executor.
+    executor : Executor or int, optional (default: None)
+        Evaluate the objective in parallel. Either a concurrent.futures Executor (or anything
+        with the same submit() interface), or a number of worker processes for which a
+        ProcessPoolExecutor is created. With a process pool the objective_func must be
+        picklable, i.e. defined at the top level of a module. Requires the 'futures'
+        package under Python 2. With a timeout only a number of processes is accepted.
+    window : int, optional (default: twice the number of workers)
+        Maximum number of blocks submitted to the executor and not yet completed, which
+        bounds the rows held in memory. The number of workers is executor when it is a
+        number, and otherwise is not known, so multiprocessing.cpu_count() is used.
+    checkpoint : str, optional (default: None)
+        Prefix of checkpoint files (see varsens.checkpoint). Every evaluated batch is
+        appended to prefix.ckpt as it completes. If the checkpoint already exists the
+        evaluation resumes from it: only the rows it does not hold are evaluated.
+    timeout : float, optional (default: None)
+        Seconds allowed for each evaluation of objective_func (for a vectorized objective,
+        per row of the block). The evaluations then run in worker processes (one, or
+        executor of them) that are killed when an evaluation takes longer, so even an
+        objective stuck in compiled code is stopped. A ValueError is raised if executor is
+        an Executor object, whose workers cannot be killed.
+    capture : bool, optional (default: False)
+        Record evaluations that raise an exception or time out as rows of NaN, with the
+        reason (EXCEPTION or TIMEOUT) in self.failures, instead of stopping. The NaN rows
+        are then masked out of the analysis (see update_mask()). The first evaluation, which
+        determines the number of objectives, must succeed (unless shape is given).
+    scheme : str, optional (default: the scheme of the sample, or "double")
+        Sampling scheme of the values (see layout()), which determines which of fM_2 and
+        fN_j exist (the others are None)
+    cache : str or varsens.cache.Cache, optional (default: None)
+        A persistent cache of objective values (or the file name of one). Rows found in it
+        are not evaluated, and every row evaluated successfully is added to it, so repeated
+        analyses (e.g. for increasing n) only evaluate the rows they have not seen. The
+        number of rows found is counted in self.hits.
+    shape : int or tuple, optional (default: None)
+        Shape of the value objective_func returns for one point (after reduce), e.g.
+        (5001, 3) for a trajectory of 3 observables. The values are stored flattened, as
+        m = prod(shape) objectives, and self.shape keeps the shape. Declaring it lets the
+        storage be allocated without a first probing evaluation.
+    dtype : numpy dtype, optional (default: None)
+        Type of the stored values. numpy.float32 halves the memory of fM_1, fM_2, fN_j and
+        fN_nj and the size of exported files; Varsens still accumulates in float64. By
+        default evaluated values are float64 and loaded ones keep their type.
+    reduce : function, index or tuple of indices, optional (default: None)
+        Applied to the output of objective_func before it is stored, so only what is to be
+        analysed is kept. A function is passed a block of outputs, an array of shape
+        (rows,) + the output shape, and returns (rows, ...); an index (or a tuple indexing
+        a multidimensional output) selects outputs, e.g. (slice(None, None, 10),) keeps
+        every 10th time point.
     loadArgs : keyword arguments, optional
             Arguments for loading pre-calculated objective values from file (passed to 
             Objective.load()). If the dimension of the loaded array is not (2*n*(1+k),k)
@@ -283,14 +765,40 @@ class Objective(object):
             'nFiles'   : Number of files to read objective from (required if 'prefix' is defined).
             'offset'   : Starting index for input filenames (optional; default=1).
             'postfix'  : File postfix (optional; default = '.txt').
+            A single binary store (.npy/.json, see varsens.store.concatenate() for joining
+            batch outputs) is memory mapped and used in place: fM_1, fM_2, fN_j and fN_nj
+            are views into it, and rows containing NaN are masked (see update_mask())
+            rather than deleted.
     '''
-    def __init__(self, k, n, sample=None, objective_func=None, objective_vals=[], verbose=True, **loadArgs):
+    def __init__(self, k, n, sample=None, objective_func=None, objective_vals=[], verbose=True,
+                 vectorized=False, batch_size=None, executor=None, checkpoint=None, timeout=None, capture=False,
+                 shape=None, dtype=None, reduce=None, cache=None, scheme=None, window=None, **loadArgs):
 
-        self.k              = k
+        self.k              = getattr(sample, 'factors', k) # The blocks are per group, if any
         self.n              = n
+        self.scheme         = scheme or getattr(sample, 'scheme', "double")
+        self.kinds, self.params = layout(self.scheme, self.k)
         self.sample         = sample
         self.objective_func = objective_func
+        if objective_func and reduce is not None:
+            self.objective_func = _Reduced(objective_func, reduce, vectorized)
         self.verbose        = verbose
+        self.vectorized     = vectorized
+        self.batch_size     = int(batch_size) if batch_size else n
+        self.executor       = executor
+        self.window         = int(window) if window else None
+        self.evaluations    = 0
+        self.hits           = 0
+        self.cache          = Cache(cache) if isinstance(cache, basestring) else cache
+        self.checkpoint     = Checkpoint(checkpoint, self.k, n, n*len(self.kinds), self.scheme,
+                                         getattr(sample, 'groups', None)) if checkpoint else None
+        self.timeout        = timeout
+        self.workers        = None
+        if timeout and executor is not None and hasattr(executor, 'submit'):
+            raise ValueError("A timeout needs executor=None or a number of processes, the workers of an Executor cannot be killed when they hang")
+        self.capture        = capture
+        self.shape          = None if shape is None else tuple(int(s) for s in numpy.atleast_1d(shape))
+        self.dtype          = dtype
 
         if self.verbose: print "Generating Objective Values."
         
@@ -304,118 +812,363 @@ class Objective(object):
             elif not self.objective_func:
                 raise Exception("Generating a fresh objective requires that an 'objective_func' be defined.")
 
-            # Determine objective_func return type
-            test = self.objective_func(sample.M_1[0])
-            
-            # assign the arrays that will hold fM_1, fM_2, fN_j, and fN_nj
+            if self.checkpoint and self.checkpoint.exists():
+                self._resume()
+                return
+            # Determine objective_func return type, unless it was declared or the first row
+            # is in the cache (which gives the number of objectives, but not their shape)
+            # With capture the first row that evaluates is used, the rows failing before it
+            # are recorded as failures
+            test   = None
+            lost   = []
+            cached = None
+            if self.shape is None and self.cache is not None:
+                cached = self.cache.lookup(sample.rows(0, 1))
             try:
-                l = len(test)
-                self.fM_1  = numpy.zeros((self.n, l))
-                self.fM_2  = numpy.zeros((self.n, l))
-                self.fN_j  = numpy.zeros((self.k, self.n, l))
-                self.fN_nj = numpy.zeros((self.k, self.n, l))
-            except TypeError:
-                self.fM_1  = numpy.zeros((self.n, 1))
-                self.fM_2  = numpy.zeros((self.n, 1))
-                self.fN_j  = numpy.zeros((self.k, self.n, 1))
-                self.fN_nj = numpy.zeros((self.k, self.n, 1))
-            
-            step = 0
-            total = 2*self.n*(1+self.k)
-            output = 0.01*total
-            output = int(output) if output > 1 else 1
-            
-            if self.verbose: print "Processing f(M_1):"
-            self.fM_1[0] = test # Save first execution
-            for i in range(1,self.n):
-                self.fM_1[i] = self.objective_func(sample.M_1[i])
-                step += 1
-                if self.verbose and step % output == 0: print str(int(round(100.*step/total)))+"%" #move_spinner(i)
-                
-            if self.verbose: print "Processing f(M_2):"
-            for i in range(self.n):
-                self.fM_2[i] = self.objective_func(sample.M_2[i])
-                step += 1
-                if self.verbose and step % output == 0: print str(int(round(100.*step/total)))+"%" #move_spinner(i)
-        
-            if self.verbose: print "Processing f(N_j)"
-            for i in range(self.k):
-                if self.verbose: print " * parameter %d"%i
-                for j in range(self.n):
-                    self.fN_j[i][j] = self.objective_func(sample.N_j[i][j])
-                    step += 1 
-                    if self.verbose and step % output == 0: print str(int(round(100.*step/total)))+"%" #move_spinner(i)
-        
-            if self.verbose: print "Processing f(N_nj)"
-            for i in range(self.k):
-                if self.verbose: print " * parameter %d"%i
-                for j in range(self.n):
-                    self.fN_nj[i][j] = self.objective_func(sample.N_nj[i][j])
-                    step += 1
-                    if self.verbose and step % output == 0: print str(int(round(100.*step/total)))+"%" #move_spinner(i)
+                if self.shape is None and cached is None:
+                    rows = (sample.rows(i, i+1) for i in range(self.n*len(self.kinds)))
+                    test, lost = _probe(self._target(), rows, self.vectorized, self.timeout, self.capture)
+                    if test is None:
+                        raise Exception("No row could be evaluated, so the number of objectives is unknown")
+                    self.shape = numpy.shape(test)
+            except Exception:
+                self._close()
+                raise
+            l = int(numpy.prod(self.shape)) if cached is None else len(cached)
+
+            # assign the buffer that will hold fM_1, fM_2, fN_j, and fN_nj
+            self._allocate(l)
+
+            self.step   = 0
+            self.total  = self.n*len(self.kinds)
+            self.output = 0.01*self.total
+            self.output = int(self.output) if self.output > 1 else 1
+
+            if self.verbose: print "Processing objective (%d evaluations):" % self.total
+            if self.checkpoint: self.checkpoint.create(l)
+            if test is None:
+                self._evaluate(0, self.total)
+            else:
+                p = len(lost) # Save the failed rows and the first execution
+                self._flat[0:p]    = numpy.nan
+                self.failures[0:p] = lost
+                self._flat[p]      = numpy.reshape(test, l)
+                if self.checkpoint: self.checkpoint.append(0, self._flat[0:p+1], self.failures[0:p+1])
+                if self.cache is not None: self.cache.put(sample.rows(p, p+1), self._flat[p:p+1])
+                self._progress(p+1)
+                self._evaluate(p+1, self.total)
+            if self.checkpoint: self.checkpoint.close()
+            self._report_failures()
+
+    def _resume(self):
+        '''Restore the rows held by the checkpoint and evaluate only the missing ones'''
+        l, records = self.checkpoint.read()
+        self._allocate(l)
+        for start, values, reasons in records:
+            self._flat[start:start+len(values)]    = values
+            self.failures[start:start+len(values)] = reasons
+        missing     = self.checkpoint.missing()
+        self.step   = 0
+        self.total  = sum(stop-start for start, stop in missing)
+        self.output = 0.01*self.total
+        self.output = int(self.output) if self.output > 1 else 1
+        if self.verbose: print "Resuming from %s.ckpt (%d evaluations left):" % (self.checkpoint.prefix, self.total)
+        for start, stop in missing:
+            self._evaluate(start, stop)
+        self.checkpoint.close()
+        self._report_failures()
+
+    def _report_failures(self):
+        '''Warn about evaluations that failed and were recorded as NaN'''
+        failed = numpy.count_nonzero(self.failures)
+        if self.verbose and self.hits > 0:
+            print "%d evaluations were found in the cache" % self.hits
+        if self.verbose and failed > 0:
+            print "WARNING: %d of %d evaluations failed (%d timed out), recorded as NaN" % \
+                  (failed, len(self.failures), numpy.count_nonzero(self.failures == TIMEOUT))
+
+    def extend(self, n_extra=None):
+        '''Grow the objective to match an extended sample, evaluating only the new rows and
+        keeping the values already computed. If n_extra is given the sample is first extended
+        by that many draws (see Sample.extend()), otherwise the sample must already have been
+        extended.'''
+        if not self.sample or not self.objective_func:
+            raise Exception("Extending an objective requires a 'sample' and an 'objective_func'.")
+        if n_extra: self.sample.extend(n_extra)
+        n, N = self.n, self.sample.n
+        if N == n: return self
+
+        # Move the computed values to their place in the new flat layout
+        blocks = len(self.kinds)
+        old    = self._flat.reshape((blocks, n, -1))
+        failures = self.failures.reshape((blocks, n))
+        self.n = N
+        self._allocate(old.shape[2])
+        self._flat.reshape((blocks, N, -1))[:,0:n] = old
+        self.failures.reshape((blocks, N))[:,0:n] = failures
+        if self.checkpoint:
+            # The layout has changed, so the checkpoint restarts from the values kept
+            self.checkpoint = Checkpoint(self.checkpoint.prefix, self.k, N, N*blocks, self.scheme, self.sample.groups)
+            self.checkpoint.create(old.shape[2])
+            for b in range(blocks):
+                self.checkpoint.append(b*N, old[b], failures[b])
+
+        self.step   = 0
+        self.total  = blocks*(N-n)
+        self.output = 0.01*self.total
+        self.output = int(self.output) if self.output > 1 else 1
+        if self.verbose: print "Processing objective (%d new evaluations):" % self.total
+        for b in range(blocks):
+            self._evaluate(b*N+n, (b+1)*N)
+        if self.checkpoint: self.checkpoint.close()
+        self._report_failures()
+        return self
+
+    def _allocate(self, l):
+        '''Allocate a single flat buffer of n*blocks rows of l values, with fM_1, fM_2, fN_j
+        and fN_nj as views into it (so results can be stored in Sample.flat() order)'''
+        self._attach(numpy.zeros((self.n*len(self.kinds), l), dtype=self.dtype or numpy.float64))
+
+    def _attach(self, x):
+        '''Use x, an array of n*blocks rows in Sample.flat() order (possibly memory mapped), as
+        the backing store. fM_1, fM_2, fN_j and fN_nj become views into it (or None if the
+        scheme has no such block); nothing is copied.'''
+        l = x.shape[1]
+        if getattr(self, 'shape', None) is None or int(numpy.prod(self.shape)) != l: self.shape = (l,)
+        self._flat = x
+        self.failures = numpy.zeros(len(x), dtype=numpy.int8) # Reason codes, see capture
+        blocks     = x.reshape((len(self.kinds), self.n, l))
+        self.fM_1  = blocks[0]
+        self.fM_2  = blocks[1] if 1 in self.kinds else None
+        self.fN_j  = blocks[2:2+self.k] if 2 in self.kinds else None
+        self.fN_nj = blocks[-self.k:]
+        self.mask  = None
+
+    def update_mask(self):
+        '''Locate the draws j for which fM_1, fM_2, fN_j or fN_nj is NaN, in one pass over the
+        blocks. self.masks (n, m) marks the draws valid for each objective, and
+        self.mask (n,) the draws valid for all of them. Invalid draws are skipped by Varsens
+        rather than deleted from the arrays.'''
+        m = self._flat.shape[1]
+        invalid = numpy.zeros((self.n, m), dtype=bool)
+        for b in range(len(self.kinds)):
+            invalid |= numpy.isnan(self._flat[b*self.n:(b+1)*self.n])
+        self.masks = numpy.logical_not(invalid)
+        self.mask  = numpy.all(self.masks, axis=1)
+        return self.mask
+
+    def valid_rows(self):
+        '''Return the indices of the draws valid for every objective, or None if all are'''
+        if self.mask is None: self.update_mask()
+        if numpy.all(self.mask): return None
+        return numpy.flatnonzero(self.mask)
+
+    def valid_mask(self, per_objective=False):
+        '''Return the (n, m) mask of valid draws, or None if all draws are valid. Unless
+        per_objective is True a draw that is invalid for one objective is invalid for all.'''
+        if self.mask is None: self.update_mask()
+        if per_objective:
+            return None if numpy.all(self.masks) else self.masks
+        if numpy.all(self.mask): return None
+        return numpy.repeat(self.mask[:,None], self.masks.shape[1], axis=1)
+
+    def _progress(self, count, cached=False):
+        '''Advance the verbose progress counter by count evaluations (or cache hits)'''
+        before = self.step // self.output
+        self.step += count
+        if cached: self.hits += count
+        else:      self.evaluations += count
+        if self.verbose and self.step // self.output > before:
+            print str(int(round(100.*self.step/self.total)))+"%" #move_spinner(i)
+
+    def _target(self):
+        '''The function evaluated: objective_func, or with a timeout the worker processes
+        running it (see _Workers)'''
+        if not self.timeout: return self.objective_func
+        if self.workers is None:
+            self.workers = _Workers(self.objective_func, 1 if self.executor is None else int(self.executor))
+        return self.workers
+
+    def _close(self):
+        '''Stop the worker processes, if any'''
+        if self.workers is not None:
+            self.workers.close()
+            self.workers = None
+
+    def _evaluate(self, start, stop):
+        '''Evaluate the objective function on rows [start, stop) of the flattened sample
+        space, in blocks of batch_size rows. Each block is checkpointed once complete.'''
+        try:
+            if self.executor is not None:
+                self._evaluate_parallel(start, stop)
+            else:
+                self._evaluate_serial(start, stop)
+        finally:
+            self._close()
+
+    def _evaluate_serial(self, start, stop):
+        '''Evaluate rows [start, stop) in this process (or its one worker, with a timeout)'''
+        function = self._target()
+        for b in range(start, stop, self.batch_size):
+            e = min(b+self.batch_size, stop)
+            x = self.sample.rows(b, e)
+            m = self._flat.shape[1]
+            todo = self._lookup(b, x)
+            if not len(todo):
+                pass
+            elif self.vectorized:
+                self._flat[b+todo], self.failures[b+todo] = _evaluate_block(function, x[todo], True, m,
+                                                                            self.timeout, self.capture)
+                self._progress(len(todo))
+            else:
+                for i in todo:
+                    self._flat[b+i], self.failures[b+i] = _evaluate_point(function, x[i], m,
+                                                                          self.timeout, self.capture)
+                    self._progress(1)
+            self._store(b, x, todo)
+            if self.checkpoint: self.checkpoint.append(b, self._flat[b:e], self.failures[b:e])
+
+    def _lookup(self, b, x):
+        '''Fill the rows x (from row b on) found in the cache, returning the indices into x
+        of the rows left to evaluate'''
+        if self.cache is None: return numpy.arange(len(x))
+        found, values = self.cache.get(x, self._flat.shape[1])
+        self._flat[b:b+len(x)][found] = values[found]
+        self._progress(numpy.count_nonzero(found), cached=True)
+        return numpy.flatnonzero(~found)
+
+    def _store(self, b, x, todo):
+        '''Add the rows x[todo] (from row b on) that were evaluated successfully to the cache'''
+        if self.cache is None or not len(todo): return
+        todo = todo[self.failures[b+todo] == EVALUATED]
+        self.cache.put(x[todo], self._flat[b+todo])
+
+    def _evaluate_parallel(self, start, stop):
+        '''Evaluate rows [start, stop) by submitting blocks of batch_size rows to the executor.
+        Results are stored by row index as they complete, so the layout does not depend on
+        the order in which workers finish.'''
+        import concurrent.futures # Python 2 requires the 'futures' backport
+
+        executor = self.executor
+        shutdown = not hasattr(executor, 'submit')
+        function = self.objective_func
+        if self.timeout:
+            # The threads only wait on the worker processes, which are killed if they hang
+            executor = concurrent.futures.ThreadPoolExecutor(int(executor))
+            function = self._target()
+        elif shutdown:
+            executor = concurrent.futures.ProcessPoolExecutor(int(executor))
+        # Bound the number of blocks in flight, so the sample is never fully materialized
+        window = self.window or 2*(int(self.executor) if shutdown else multiprocessing.cpu_count())
+
+        try:
+            blocks  = iter(range(start, stop, self.batch_size))
+            pending = {}
+            while True:
+                for b in blocks:
+                    e = min(b+self.batch_size, stop)
+                    x = self.sample.rows(b, e)
+                    todo = self._lookup(b, x) # Only rows missing from the cache are sent to workers
+                    if not len(todo):
+                        if self.checkpoint: self.checkpoint.append(b, self._flat[b:e], self.failures[b:e])
+                        continue
+                    f = executor.submit(_evaluate_block, function, x[todo], self.vectorized,
+                                        self._flat.shape[1], self.timeout, self.capture)
+                    pending[f] = (b, e, x, todo)
+                    if len(pending) >= window: break
+                if not pending: break
+                done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for f in done:
+                    b, e, x, todo = pending.pop(f)
+                    self._flat[b+todo], self.failures[b+todo] = f.result()
+                    self._progress(len(todo))
+                    self._store(b, x, todo)
+                    if self.checkpoint: self.checkpoint.append(b, self._flat[b:e], self.failures[b:e])
+        finally:
+            if shutdown: executor.shutdown()
+
+    def segments(self):
+        '''Return the blocks of n values present in the scheme (fM_1, fM_2, fN_j[i] and
+        fN_nj[i]), in Sample.flat() order'''
+        segments = [self.fM_1]
+        if self.fM_2 is not None: segments.append(self.fM_2)
+        if self.fN_j is not None: segments.extend(self.fN_j)
+        return segments + list(self.fN_nj)
 
     def flat(self):
-        '''Return the objectives as an array 2*n*(1+k) long'''
+        '''Return the objectives as an array n*blocks long (2*n*(1+k) for the double scheme)'''
 
         if self.verbose: print "Flattening objectives..."
         
-        l1 = len(self.fM_1)
-        l2 = len(self.fM_2)
-        l3 = self.fN_j.shape[0]*self.fN_j.shape[1]
-        l4 = self.fN_nj.shape[0]*self.fN_nj.shape[1]
+        segments = self.segments()
+        l = sum(len(seg) for seg in segments)
                 
         if len(self.fM_1.shape) > 1:
-            x = numpy.zeros(((l1+l2+l3+l4), self.fM_1.shape[1]))
+            x = numpy.zeros((l, self.fM_1.shape[1]), dtype=self.fM_1.dtype)
         else:
-            x = numpy.zeros(l1+l2+l3+l4)
+            x = numpy.zeros(l, dtype=self.fM_1.dtype)
         
-        if self.verbose: print "Flattening fM_1"
-        x[0:l1,...]  = self.fM_1
-        
-        if self.verbose: print "Flattening fM_2"
-        x[l1:l1+l2,...] = self.fM_2
-        
-        if self.verbose: print "Flattening fN_j"
-        curr_length = l1+l2
-        for i in range(self.k):
-            x[curr_length:curr_length+len(self.fN_j[i]),...] = self.fN_j[i]
-            curr_length += len(self.fN_j[i])
-        
-        if self.verbose: print "Flattening fN_nj"
-        for i in range(self.k):
-            x[curr_length:curr_length+len(self.fN_nj[i]),...] = self.fN_nj[i]
-            curr_length += len(self.fN_nj[i])
+        curr_length = 0
+        for seg in segments:
+            x[curr_length:curr_length+len(seg),...] = seg
+            curr_length += len(seg)
         
         if self.verbose: print "...Done. ( flattened.shape = ", x.shape, ")"
         
         return x
 
-    def export(self, outdir=os.getcwd(), prefix="objective", postfix=".txt", blocksize=float("inf")):
+    def export(self, outdir=os.getcwd(), prefix="objective", postfix=".txt", blocksize=float("inf"),
+               binary=False, metadata=None):
+        '''Write the objective values to file(s) in Sample.flat() order. See Sample.export()
+        for the binary format.'''
+        prefix = str(prefix) # just to be safe
+        prefix="_".join(prefix.split()) # remove all whitespace and join with underscores (just in case)
+        if prefix[-1] == "_": prefix = prefix[:-1] # remove underscore at the end if there is one
+        prefix = os.path.join(outdir,prefix)
+        if binary:
+            # Written segment by segment, without building the flattened array
+            segments = self.segments()
+            total = sum(len(seg) for seg in segments)
+            m = self.fM_1.shape[1] if len(self.fM_1.shape) > 1 else 1
+            if blocksize > total: blocksize = total
+            if self.verbose: print "Writing to %s.npy ..." % prefix,
+            header = {'kind'      : 'objective',
+                      'k'         : self.k,
+                      'n'         : self.n,
+                      'scheme'    : self.scheme,
+                      'blocksize' : int(blocksize),
+                      'blocks'    : store.blocks(total, blocksize),
+                      'metadata'  : metadata or {}}
+            data = store.create(prefix, (total, m), header, self.fM_1.dtype)
+            curr_length = 0
+            for seg in segments:
+                data[curr_length:curr_length+len(seg)] = numpy.reshape(seg, (len(seg), m))
+                curr_length += len(seg)
+            data.flush()
+            del data
+            if self.verbose: print "Done."
+            return
         # Flatten
         f = self.flat()
         # Sanity checks
         if blocksize > len(f): blocksize = len(f)
         else: blocksize = int(blocksize) # just to be safe
-        prefix = str(prefix) # just to be safe
-        prefix="_".join(prefix.split()) # remove all whitespace and join with underscores (just in case)
-        if prefix[-1] == "_": prefix = prefix[:-1] # remove underscore at the end if there is one
-        prefix = os.path.join(outdir,prefix)
         # Write to file
         nFiles = int(numpy.ceil(float(len(f)) / blocksize))
         if nFiles == 1:
             if self.verbose: print "Writing to %s%s ..." % (prefix, postfix),
-            numpy.savetxt("%s%s" % (prefix, postfix), f)
+            numpy.savetxt("%s%s" % (prefix, postfix), f, fmt=text_format(f.dtype))
             if self.verbose: print "Done."
         else:
             for b in range(nFiles):
                 if self.verbose: print "Writing to %s_%d%s ..." % (prefix, b+1, postfix),
-                numpy.savetxt("%s_%d%s" % (prefix, b+1, postfix), f[b*blocksize : (b+1)*blocksize])
+                numpy.savetxt("%s_%d%s" % (prefix, b+1, postfix), f[b*blocksize : (b+1)*blocksize], fmt=text_format(f.dtype))
                 if self.verbose: print "Done."
 
     def load(self, obj_vals=[], indir='', loadFile=None, prefix=None, postfix='.txt', nFiles=None, offset=1, scaling=1.0):
         
         if len(obj_vals) > 0:
-            x = obj_vals
+            x = numpy.asarray(obj_vals, dtype=self.dtype)
         else:
             FILES = []
             if loadFile:
@@ -436,63 +1189,32 @@ class Objective(object):
                 if not os.path.isfile(file):
                     raise Exception("Cannot find input file "+file)
                 if self.verbose: print "Reading "+file+" ...",
-                obj.append(numpy.loadtxt(open(file, "rb")))
+                obj.append(_read(file, dtype=self.dtype))
                 if self.verbose: print "Done."
             
-            if self.verbose: print "Stacking...",
-            if len(numpy.array(obj).shape) == 2: # one observable (list of 1-D arrays)
-                x = numpy.hstack(obj)
-            else: # more than one observable
-                x = numpy.vstack(obj)
-            if self.verbose: print "Done."
+            if len(obj) == 1:
+                x = obj[0]
+            else:
+                if self.verbose: print "Stacking...",
+                if len(obj[0].shape) == 1: # one observable (list of 1-D arrays)
+                    x = numpy.hstack(obj)
+                else: # more than one observable
+                    x = numpy.vstack(obj)
+                if self.verbose: print "Done."
         
-        if len(x) == 2*self.n*(1+self.k): 
-            if self.verbose: print "Extracting fM_1"
-            self.fM_1 = x[0:self.n,...] / scaling
-            if self.verbose: print "Extracting fM_2"
-            self.fM_2 = x[self.n:2*self.n,...] / scaling
-            curr_length = 2*self.n
-            try: 
-                l = len(x[0])
-                self.fN_j = numpy.zeros((self.k, self.n, l))
-                self.fN_nj = numpy.zeros((self.k, self.n, l))
-            except TypeError:
-                self.fN_j = numpy.zeros((self.k, self.n, 1))
-                self.fN_nj = numpy.zeros((self.k, self.n, 1))
-            if self.verbose: print "Extracting fN_j"
-            for i in range(self.k):
-                self.fN_j[i] = x[curr_length:curr_length+self.n,...] / scaling
-                curr_length += self.n
-            if self.verbose: print "Extracting fN_nj"
-            for i in range(self.k):
-                self.fN_nj[i] = x[curr_length:curr_length+self.n,...] / scaling
-                curr_length += self.n
-            if self.verbose: print "...Done."
+        if len(x) == self.n*len(self.kinds): 
+            if scaling != 1.0: x = x / scaling
+            if len(x.shape) == 1: x = x.reshape((len(x), 1)) # one observable
+            if self.verbose: print "Extracting fM_1, fM_2, fN_j and fN_nj"
+            self._attach(x)
         else:
-            raise Exception("Loaded objective has length "+str(len(x))+". Must have length %d." % (2*self.n*(1+self.k)))
-        
-        # Trim the row from *all* matrices if *one* has a nan
-        nans = [] 
-        # locate nans
-        isnan = numpy.logical_or(numpy.isnan(self.fM_1), numpy.isnan(self.fM_2))
-        for i in range(self.k):
-            isnan = numpy.logical_or(isnan, numpy.isnan(self.fN_j[i]))
-            isnan = numpy.logical_or(isnan, numpy.isnan(self.fN_nj[i]))
-        # If there are multiple objectives, use the first column
-        if len(isnan.shape) > 1: isnan = isnan[:,0]
-
-        # Construct array of NaN rows
-        for i in range(len(isnan)):
-            if isnan[i]: nans.append(i)
+            raise Exception("Loaded objective has length "+str(len(x))+". Must have length %d." % (self.n*len(self.kinds)))
         
-        # Now delete the located nans
-        self.fM_1     = numpy.delete(self.fM_1,  nans, axis=0)
-        self.fM_2     = numpy.delete(self.fM_2,  nans, axis=0)
-        self.fN_j     = numpy.delete(self.fN_j,  nans, axis=1)
-        self.fN_nj    = numpy.delete(self.fN_nj, nans, axis=1)
-        
-        if len(nans) > 0:
-            print "WARNING: %d of %d objectives were NaN, %lf%% loss\r" % (len(nans), 2*self.n*(1+self.k), 100.0*len(nans)/(2*self.n*(1+self.k)))
+        # Draws where *one* matrix has a nan are masked out of *all* of them (for that objective)
+        self.update_mask()
+        nans = self.n - numpy.count_nonzero(self.mask)
+        if nans > 0:
+            print "WARNING: %d of %d objectives were NaN, %lf%% loss\r" % (nans, len(self._flat), 100.0*nans/len(self._flat))
 
 class Varsens(object):
     '''The main variance sensitivity object which contains the core of the computation. It will
@@ -517,6 +1239,34 @@ class Varsens(object):
             are ignored, and this is used as the sample
         verbose : bool
             Whether or not to print progress in computation
+        second_order : bool or list of pairs, optional (default: True)
+            Second order sensitivities to compute. True computes sens_2 and sens_2n for
+            every pair of parameters, one (k, k) matrix per objective: arrays of shape
+            (k, k, m). A list of (i, j) pairs computes only those, giving arrays of shape
+            (len(pairs), m). False skips them (sens_2 and sens_2n are None).
+        mask : str, optional (default: "row")
+            How draws with a NaN objective value (see Objective.update_mask()) are left
+            out. "row" drops the draw for every objective; "objective" drops it only for
+            the objectives that are NaN, so n_valid is then an array with one count per
+            objective. Bootstrap intervals always use "row".
+        outputs : index, tuple of indices or function, optional (default: None)
+            The objective outputs to analyse, so indices are only computed for those. An
+            index (e.g. an array or slice) selects columns of the m stored objectives; a
+            tuple indexes the output shape of the Objective (e.g. (slice(None, None, 10),)
+            for every 10th time point of a trajectory); a function reduces each block of
+            values along its last axis (e.g. lambda y: y.mean(axis=-1, keepdims=True)).
+            The selected values are read one block at a time and accumulated in float64.
+        groups : list of lists of int, optional (default: None)
+            Parameter groups of the sample created from (k, n, scaling_func), see Sample.
+            The sensitivities (and self.k) are then those of the groups, in order.
+        scheme : str, optional (default: "double")
+            Sampling scheme of the sample created from (k, n, scaling_func), see layout().
+            A given sample or Objective keeps its own. With "jansen" or "radial" there are
+            no second order sensitivities, and with "radial" no first order ones (sens is
+            None).
+        objectiveArgs : keyword arguments, optional
+            Additional arguments passed to Objective() when evaluating an objective
+            function (e.g. vectorized, batch_size, executor)
 
         Returns
         -------
@@ -542,17 +1292,25 @@ class Varsens(object):
             >>> v.sens_t # doctest: +ELLIPSIS
             array([...])
     '''
-    def __init__(self, objective, scaling_func=None, k=None, n=None, sample=None, verbose=True):
-        self.verbose = verbose
+    def __init__(self, objective, scaling_func=None, k=None, n=None, sample=None, verbose=True, second_order=True,
+                 mask="row", outputs=None, scheme="double", groups=None, **objectiveArgs):
+        if mask not in ("row", "objective"):
+            raise ValueError("Unknown mask '%s', must be 'row' or 'objective'" % mask)
+        if mask == "objective" and callable(outputs):
+            raise ValueError("mask='objective' requires outputs to be an index, not a function")
+        self.verbose      = verbose
+        self.second_order = second_order
+        self.mask         = mask
         # If the sample object is predefined use it
         if isinstance(sample, Sample):
             self.sample = sample
-            self.k      = sample.k
+            self.k      = sample.factors
             self.n      = sample.n
         elif k != None and n != None and scaling_func != None: # Create sample from space definition
             self.k      = k
             self.n      = n
-            self.sample = Sample(k, n, scaling_func, verbose)
+            self.sample = Sample(k, n, scaling_func, verbose=verbose, scheme=scheme, groups=groups)
+            self.k      = self.sample.factors
         elif not isinstance(objective, Objective):
             # No sample provided, no sample space definition provided, no pre-evaluated Objective provided
             # Impossible to compute variable sensitivity
@@ -564,23 +1322,157 @@ class Varsens(object):
             self.k         = objective.k
             self.n         = objective.n
         else: # The object is predefined.
-            self.objective = Objective(self.k, self.n, self.sample, objective, verbose)
+            self.objective = Objective(self.k, self.n, self.sample, objective, verbose=verbose, **objectiveArgs)
+
+        # Indices into the output shape become indices of the flattened objectives
+        if isinstance(outputs, tuple):
+            shape   = self.objective.shape
+            outputs = numpy.arange(int(numpy.prod(shape))).reshape(shape)[outputs].reshape(-1)
+        self.outputs = outputs
 
         # From the model executions, compute the variable sensitivity
         self.compute_varsens()
 
+    def update(self, n_extra):
+        '''Extend the sample by n_extra draws, evaluate the objective on the new points only
+        and recompute the sensitivities from all the points (see Objective.extend()).'''
+        self.objective.extend(n_extra)
+        self.n = self.objective.n
+        self.compute_varsens()
+        return self
+
+    def run_until(self, tolerance, max_evals=float("inf"), method="change", max_doublings=20):
+        '''Double n (see update()) until the sensitivities are estimated to within tolerance,
+        until the next doubling would take the total number of objective evaluations past
+        max_evals, or until n has been doubled max_doublings times.
+
+        Parameters
+        ----------
+        tolerance : float
+            Desired accuracy of sens and sens_t
+        max_evals : int, optional (default: no limit)
+            Budget of objective evaluations, including those already spent
+        method : str, optional (default: "change")
+            How the error is estimated. "change" uses the largest absolute change of any
+            sens or sens_t between successive doublings; "profile" uses the error predicted
+            for n and k by the power law fitted to the error profiles (see
+            varsens.convergence).
+        max_doublings : int, optional (default: 20)
+            Largest number of doublings of n, so that a tolerance that cannot be reached
+            (e.g. with a noisy objective) does not double n forever
+
+        Returns
+        -------
+        evaluations : int
+            Total number of objective evaluations spent. self.converged and self.error record
+            whether the tolerance was reached and the last error estimate.
+        '''
+        if method not in ("change", "profile"):
+            raise ValueError("Unknown convergence method '%s'" % method)
+        if method == "profile" and convergence.required_n(self.k, tolerance) is None:
+            raise ValueError("The error profile does not decrease with n for k=%d, so it never reaches %g" % (self.k, tolerance))
+        previous = None
+        doublings = 0
+        while True:
+            if method == "profile":
+                self.error = float(convergence.predicted_error(self.n, self.k))
+            elif previous is None:
+                self.error = float("inf")
+            else:
+                self.error = max(numpy.nanmax(numpy.abs(now - before)) for now, before in zip(self.estimates(), previous))
+            self.converged = self.error <= tolerance
+            if self.converged: break
+            if self.objective.evaluations + self.n*len(self.objective.kinds) > max_evals: break
+            if doublings >= max_doublings: break
+            if self.verbose: print "Error %g above %g at n=%d, doubling n" % (self.error, tolerance, self.n)
+            previous = [numpy.array(x) for x in self.estimates()]
+            self.update(self.n)
+            doublings += 1
+        self.evaluations = self.objective.evaluations
+        return self.evaluations
+
+    def estimates(self):
+        '''The first (if estimated) and total order sensitivities'''
+        return [x for x in (self.sens, self.sens_t) if x is not None]
+
+    def bootstrap(self, B=1000, alpha=0.05, **kwargs):
+        '''Compute bootstrap confidence intervals by resampling the existing objective values
+        (see varsens.bootstrap.confidence_intervals() for the arguments). The intervals are
+        stored as sens_ci and sens_t_ci (and sens_2_ci, sens_2n_ci), arrays holding the
+        lower and upper bounds, and also returned in a dict.'''
+        intervals = bootstrap.confidence_intervals(self, B, alpha, **kwargs)
+        for name, ci in intervals.items():
+            setattr(self, name+"_ci", ci)
+        return intervals
+
+    def select(self, x):
+        '''The analysed outputs (see outputs) of x, an array of objective values whose last
+        axis runs over the objectives, as float64. No copy is made when all the float64
+        objectives are analysed.'''
+        if self.outputs is None:
+            y = x
+        elif callable(self.outputs):
+            y = self.outputs(x)
+        else:
+            y = x[..., self.outputs]
+        return numpy.asarray(y, dtype=numpy.float64)
+
     def compute_varsens(self):
         ''' Main computation of sensitivity via Saltelli method.'''
         if self.verbose: print "Final sensitivity calculation"
         
-#         n = len(self.objective.fM_1)
-        self.E_2 = sum(self.objective.fM_1*self.objective.fM_2) / self.n      # Eq (21)
-#         self.E_2 = sum(self.objective.fM_1) / self.n # Eq(22)
-#         self.E_2 *= self.E_2
-        
-        #estimate V(y) from self.objective.fM_1 and self.objective.fM_2
-        # paper uses only self.objective.fM_1, this is a better estimator
-        self.var_y = numpy.var(numpy.concatenate((self.objective.fM_1, self.objective.fM_2), axis=0), axis=0, ddof=1)
+        # Draws masked as invalid (NaN) by the Objective are left out of the sums, nothing is
+        # deleted. With mask="objective" each objective keeps every draw valid for it, so n
+        # becomes an array of the valid draws per objective.
+        o = self.objective
+        fM_1 = self.select(o.fM_1)
+        fM_2 = None if o.fM_2 is None else self.select(o.fM_2)
+        W = o.valid_mask(per_objective=(self.mask == "objective"))
+        if W is not None and callable(self.outputs):
+            W = numpy.repeat(o.mask[:,None], fM_1.shape[1], axis=1)
+        elif W is not None and self.outputs is not None:
+            W = W[:, self.outputs]
+        def total(x, y=None):
+            xy = x if y is None else x*y
+            return numpy.sum(xy if W is None else numpy.where(W, xy, 0.0), axis=0)
+        if W is None:
+            n = self.n
+        elif self.mask == "objective":
+            n = numpy.count_nonzero(W, axis=0)
+        else:
+            n = numpy.count_nonzero(o.mask)
+        self.n_valid = n
+
+        if fM_2 is None: # The radial scheme only has fM_1 to estimate E^2 and V(y) from
+            mean       = total(fM_1) / n
+            self.E_2   = mean**2
+            self.var_y = total((fM_1-mean)**2) / (n - 1.0)
+        else:
+            self.E_2 = total(fM_1, fM_2) / n      # Eq (21)
+#             self.E_2 = sum(self.objective.fM_1) / self.n # Eq(22)
+#             self.E_2 *= self.E_2
+
+            #estimate V(y) from self.objective.fM_1 and self.objective.fM_2
+            # paper uses only self.objective.fM_1, this is a better estimator
+            mean       = (total(fM_1) + total(fM_2)) / (2.0*n)
+            self.var_y = (total((fM_1-mean)**2) + total((fM_2-mean)**2)) / (2.0*n - 1)
+
+        if o.scheme != "double":
+            # With f(A) = fM_1, f(B) = fM_2 and f(A_B^i) = fN_nj[i] (A with column i from B)
+            #   sens[i]   = f(B).(f(A_B^i) - f(A)) / n, over V(y)   (Saltelli 2010)
+            #   sens_t[i] = |f(A) - f(A_B^i)|^2 / 2n, over V(y)     (Jansen 1999)
+            # The radial scheme does not evaluate B, so has no first order estimate
+            self.sens   = None if fM_2 is None else numpy.zeros((self.k,)+fM_1.shape[1:])
+            self.sens_t = numpy.zeros((self.k,)+fM_1.shape[1:])
+            for i in range(self.k):
+                fN_nj = self.select(o.fN_nj[i])
+                if fM_2 is not None: self.sens[i] = total(fM_2, fN_nj - fM_1) / n
+                self.sens_t[i] = total((fM_1 - fN_nj)**2) / (2.0*n)
+            if self.sens is not None: self.sens /= self.var_y
+            self.sens_t /= self.var_y
+            self.U_j = self.U_nj = None
+            self.sens_2 = self.sens_2n = None
+            return
 
 # FIXME: This NEED WORK, and it is IMPORTANT
         #if not numpy.all(numpy.sqrt(numpy.abs(self.E_2)) > 1.96*numpy.sqrt(self.var_y / self.n)):
@@ -588,12 +1480,16 @@ class Varsens(object):
         #    raise ArithmeticError
         
         # Estimate U_j and U_-j values and store them, but by double method
-        self.U_j  =  numpy.sum(self.objective.fM_1 * self.objective.fN_j,  axis=1) / (self.n - 1)  # Eq (12)
-        self.U_j  += numpy.sum(self.objective.fM_2 * self.objective.fN_nj, axis=1) / (self.n - 1) 
-        self.U_j  /= 2.0
-        self.U_nj =  numpy.sum(self.objective.fM_1 * self.objective.fN_nj, axis=1) / (self.n - 1)  # Eq (unnumbered one after 18)
-        self.U_nj += numpy.sum(self.objective.fM_2 * self.objective.fN_j,  axis=1) / (self.n - 1) 
-        self.U_nj /= 2.0
+        # One parameter at a time, so temporaries are n rows rather than k*n
+        self.U_j  = numpy.zeros((self.k,)+fM_1.shape[1:])
+        self.U_nj = numpy.zeros((self.k,)+fM_1.shape[1:])
+        for i in range(self.k):
+            fN_j  = self.select(o.fN_j[i])
+            fN_nj = self.select(o.fN_nj[i])
+            self.U_j[i]  = total(fM_1, fN_j)  + total(fM_2, fN_nj)  # Eq (12)
+            self.U_nj[i] = total(fM_1, fN_nj) + total(fM_2, fN_j)   # Eq (unnumbered one after 18)
+        self.U_j  /= 2.0 * (n - 1)
+        self.U_nj /= 2.0 * (n - 1)
         
         #allocate the S_i and ST_i arrays
         if len(self.U_j.shape) == 1:
@@ -608,18 +1504,52 @@ class Varsens(object):
             self.sens[j]   = (self.U_j[j] - self.E_2) / self.var_y
             self.sens_t[j] = 1.0 - ((self.U_nj[j]- self.E_2) / self.var_y)
             
-        # Compute 2nd order terms (from double estimates)
-        self.sens_2  =  numpy.tensordot(self.objective.fN_nj, self.objective.fN_j,  axes=([1],[1]))
-        self.sens_2  += numpy.tensordot(self.objective.fN_j,  self.objective.fN_nj, axes=([1],[1]))
-        self.sens_2  /= 2.0 * (self.n-1)
-        self.sens_2  -= self.E_2
-        self.sens_2  /= self.var_y
-        
-        self.sens_2n =  numpy.tensordot(self.objective.fN_nj, self.objective.fN_nj, axes=([1],[1]))
-        self.sens_2n += numpy.tensordot(self.objective.fN_j,  self.objective.fN_j,  axes=([1],[1]))
-        self.sens_2n /= 2.0 * (self.n-1)
-        self.sens_2n -= self.E_2
-        self.sens_2n /= self.var_y
+        # Compute 2nd order terms (from double estimates), invalid draws zeroed so they add nothing
+        self.compute_second_order(o.fN_j, o.fN_nj, n, W)
+
+    def compute_second_order(self, fN_j, fN_nj, n, W=None):
+        '''Second order sensitivities from the (double) estimates
+
+            sens_2[a,b]  = (fN_nj[a].fN_j[b]  + fN_j[a].fN_nj[b]) / 2(n-1), less E_2, over V(y)
+            sens_2n[a,b] = (fN_nj[a].fN_nj[b] + fN_j[a].fN_j[b] ) / 2(n-1), less E_2, over V(y)
+
+        Products are only taken between matching objectives, and both are symmetric in a and
+        b, so only the upper triangle is computed. fN_j and fN_nj are the stored values
+        (e.g. a memory mapped float32 store): each block is read, converted (see select())
+        and masked by the valid draws W when it is used, so only two pairs of (n, m) blocks
+        are in memory at a time.'''
+        if self.second_order is False or self.second_order is None:
+            self.sens_2 = self.sens_2n = None
+            return
+        def block(x, i):
+            x = self.select(x[i])
+            return x if W is None else numpy.where(W, x, 0.0)
+        if self.second_order is True:
+            pairs = [(a, b) for a in range(self.k) for b in range(a, self.k)]
+        else:
+            pairs = [tuple(p) for p in numpy.array(self.second_order, dtype=int).reshape((-1, 2))]
+        sens_2  = []
+        sens_2n = []
+        for p, (a, b) in enumerate(pairs):
+            if p == 0 or a != pairs[p-1][0]: # Runs of pairs with the same a share its blocks
+                j_a, nj_a = block(fN_j, a), block(fN_nj, a)
+            j_b, nj_b = block(fN_j, b), block(fN_nj, b)
+            sens_2.append(numpy.sum(nj_a*j_b  + j_a*nj_b, axis=0))
+            sens_2n.append(numpy.sum(nj_a*nj_b + j_a*j_b,  axis=0))
+        if self.second_order is True:
+            m = len(sens_2[0])
+            self.sens_2  = numpy.zeros((self.k, self.k, m))
+            self.sens_2n = numpy.zeros((self.k, self.k, m))
+            for (a, b), x, y in zip(pairs, sens_2, sens_2n):
+                self.sens_2[a,b]  = self.sens_2[b,a]  = x
+                self.sens_2n[a,b] = self.sens_2n[b,a] = y
+        else:
+            self.sens_2  = numpy.array(sens_2)
+            self.sens_2n = numpy.array(sens_2n)
+        for x in (self.sens_2, self.sens_2n):
+            x /= 2.0 * (n-1)
+            x -= self.E_2
+            x /= self.var_y
 
         # Numerical error can make some values exceed what is sensible
 #         self.sens    = numpy.clip(self.sens,    0, 1)
@@ -121,3 +121,47 @@ def magnitude(points, reference, orders=3.0, base=10.0):
     factor = base ** orders
     return power(points, reference / factor, reference * factor)
 
+
+SCALINGS = ('linear', 'power', 'percentage', 'magnitude')
+
+def from_spec(spec):
+    """Build a scaling function from a JSON serializable specification, so the scaling can be
+    recorded in a file and recreated elsewhere (e.g. on each node of a cluster job)
+
+    Parameters
+    ----------
+    spec : dict or None
+        The name of one of the scaling helpers (linear, power, percentage or magnitude)
+        as 'method', and its remaining arguments (lists are converted to arrays). None,
+        or a 'method' of 'identity', gives the identity scaling.
+
+    Returns
+    -------
+    scaling : function
+        The scaling function, with the specification as its 'spec' attribute
+
+    Examples
+    ________
+
+        >>> from numpy import *
+        >>> from varsens import *
+        >>> f = scale.from_spec({'method': 'linear', 'lower_bound': [-100, -10, 1000], 'upper_bound': [100, 20, 2000]})
+        >>> f(array([0.5]*3))
+        array([    0.,     5.,  1500.])
+        >>>
+
+    """
+    spec = dict(spec or {'method': 'identity'})
+    method = spec.get('method', 'identity')
+    if method == 'identity':
+        scaling = lambda points: points
+    elif method in SCALINGS:
+        function = globals()[method]
+        args = dict((key, numpy.asarray(value) if isinstance(value, list) else value)
+                    for key, value in spec.items() if key != 'method')
+        scaling = lambda points: function(points, **args)
+    else:
+        raise Exception("Unknown scaling method '%s', expected one of identity, %s" % (method, ", ".join(SCALINGS)))
+    scaling.__name__ = str(method)
+    scaling.spec     = spec
+    return scaling
@@ -0,0 +1,443 @@
+"""Low discrepancy sequences generated with NumPy.
+
+Every generator derives from Sequence and computes the points at any index directly
+(take(index), or points(start, count) for consecutive ones), so a sample can be continued
+deep into a sequence, or any of its rows regenerated, without generating the points
+before it. The stateful get()/skip()/reset() interface matches
+ghalton.Halton. The backends available to Sample(..., sequence=name) are
+
+    "halton"           Halton sequence (radical inverse in the first dim primes)
+    "scrambled_halton" Halton with random digit permutations in each dimension
+    "sobol"            Sobol sequence with the Joe & Kuo direction numbers
+    "lattice"          Extensible rank-1 lattice in base 2
+    "lhs"              Latin hypercube, in independent blocks of n points
+    "ghalton"          ghalton.Halton itself, to reproduce samples made with it exactly
+                       (skipping generates the points)
+
+Sobol points are computed from the Joe & Kuo direction numbers (new-joe-kuo-6.21201,
+supporting up to 21201 dimensions, shipped in varsens/data), see
+
+    S. Joe and F. Y. Kuo, Constructing Sobol sequences with better two-dimensional
+    projections, SIAM J. Sci. Comput. 30, 2635-2654 (2008).
+    http://web.maths.unsw.edu.au/~fkuo/sobol/
+
+The direction numbers are distributed under a BSD style license by their authors.
+"""
+
+import gzip
+import os
+import numpy
+
+DIRECTION_NUMBERS = os.path.join(os.path.dirname(__file__), 'data', 'new-joe-kuo-6.21201.gz')
+
+def primes(count):
+    """The first count prime numbers, as an array"""
+    if count < 1: return numpy.zeros(0, dtype=numpy.int64)
+    # The count-th prime is below count*(log(count) + log(log(count))) for count >= 6
+    limit = int(count*(numpy.log(count+1) + numpy.log(numpy.log(count+2)))) + 15
+    sieve = numpy.ones(limit, dtype=bool)
+    sieve[:2] = False
+    for p in range(2, int(limit**0.5)+1):
+        if sieve[p]: sieve[p*p::p] = False
+    return numpy.flatnonzero(sieve)[:count].astype(numpy.int64)
+
+def radical_inverse(index, bases, permutations=None):
+    """Radical inverse of each index in each base, as an array of shape (len(index), len(bases))
+
+    Parameters
+    ----------
+    index : array of int
+        Indices of the points
+    bases : array of int
+        Base of each dimension
+    permutations : list of arrays, optional
+        A permutation of the digits of each base (fixing 0), applied to every digit
+
+    Returns
+    -------
+    x : numpy.array
+    """
+    i = numpy.asarray(index, dtype=numpy.int64)[:,None] * numpy.ones(len(bases), dtype=numpy.int64)
+    if permutations is not None:
+        offsets = numpy.concatenate(([0], numpy.cumsum(bases)[:-1]))
+        table   = numpy.concatenate(permutations)
+    digits = []
+    while numpy.any(i > 0):
+        d = i % bases
+        digits.append(d if permutations is None else table[offsets + d])
+        i //= bases
+    # Summed from the least significant digit (Horner's rule), which is exact to rounding
+    x = numpy.zeros(i.shape)
+    for d in reversed(digits):
+        x = (x + d) / bases
+    return x
+
+def direction_numbers(dim, bits=32, filename=DIRECTION_NUMBERS):
+    """Sobol direction numbers V for the first dim dimensions
+
+    Parameters
+    ----------
+    dim : int
+        Number of dimensions
+    bits : int, optional (default: 32)
+        Bits of precision, allowing 2**bits points
+    filename : str, optional
+        Direction number file in the Joe & Kuo format (d s a m_1 ... m_s per line, after
+        a header line), optionally gzip compressed
+
+    Returns
+    -------
+    V : numpy.array of uint64, shape (bits, dim)
+        V[i, d] is the direction number used when bit i of the Gray code changes
+    """
+    V = numpy.zeros((bits, dim), dtype=numpy.uint64)
+    # The first dimension is the van der Corput sequence in base 2
+    V[:, 0] = [1 << (bits-1-i) for i in range(bits)]
+    if dim == 1: return V
+    opener = gzip.open if filename.endswith('.gz') else open
+    with opener(filename, 'rb') as f:
+        f.readline() # Header
+        for d in range(1, dim):
+            line = f.readline()
+            if not line:
+                raise Exception("Sobol direction numbers are only available for %d dimensions" % d)
+            s, a = [int(x) for x in line.split()[1:3]]
+            m    = [int(x) for x in line.split()[3:]]
+            v    = [0]*bits
+            for i in range(min(s, bits)):
+                v[i] = m[i] << (bits-1-i)
+            for i in range(s, bits):
+                v[i] = v[i-s] ^ (v[i-s] >> s)
+                for j in range(1, s):
+                    v[i] ^= ((a >> (s-1-j)) & 1) * v[i-j]
+            V[:, d] = v
+    return V
+
+class Sequence(object):
+    ''' Base class of the sequence generators. Subclasses implement take(index), the points
+        at arbitrary indices, and may override points(start, count) for consecutive ones;
+        the position in the sequence is just an index, so skip() is O(1).
+
+        Parameters
+        ----------
+        dim : int
+            Number of dimensions
+
+        Attributes
+        ----------
+        burn_in : int
+            Number of initial points Sample discards before drawing from the sequence
+    '''
+    burn_in = 0
+
+    def __init__(self, dim):
+        self.dim = int(dim)
+        self.reset()
+
+    def points(self, start, count):
+        '''The count points starting at index start, as an array of shape (count, dim) in [0,1)'''
+        return self.take(numpy.arange(start, start+count))
+
+    def take(self, index):
+        '''The points at the given indices, as an array of shape (len(index), dim) in [0,1)'''
+        index = numpy.asarray(index, dtype=numpy.int64).reshape(-1)
+        x = numpy.zeros((len(index), self.dim))
+        for i, p in enumerate(index):
+            x[i] = self.points(p, 1)[0]
+        return x
+
+    def reset(self):
+        '''Restart the sequence at the first point'''
+        self.index = 0
+        return self
+
+    def skip(self, count):
+        '''Advance the sequence by count points without generating them'''
+        self.index += int(count)
+        return self
+
+    def get(self, count):
+        '''The next count points, as an array of shape (count, dim) in [0,1)'''
+        x = self.points(self.index, int(count))
+        self.index += int(count)
+        return x
+
+class Halton(Sequence):
+    ''' The Halton sequence: coordinate d of the point at index i is the radical inverse of
+        i in the d-th prime. Index 0 is the origin, so with the default burn in of 20*dim+1
+        points the sample matches ghalton.Halton's (to rounding).
+
+        Examples
+        ________
+            >>> from varsens import *
+            >>> sequence.Halton(2).get(4).tolist() # doctest: +ELLIPSIS
+            [[0.0, 0.0], [0.5, 0.333...], [0.25, 0.666...], [0.75, 0.111...]]
+    '''
+    def __init__(self, dim):
+        Sequence.__init__(self, dim)
+        self.bases   = primes(self.dim)
+        self.burn_in = 20*self.dim + 1 # The initial points are linearly correlated
+
+    def take(self, index):
+        return radical_inverse(index, self.bases)
+
+class ScrambledHalton(Halton):
+    ''' The Halton sequence with the digits of each dimension scrambled by a random
+        permutation (fixing 0), which breaks the correlation between the high dimensions of
+        the plain sequence, so no burn in is needed beyond the origin.
+
+        Parameters
+        ----------
+        dim : int
+            Number of dimensions
+        seed : int, optional (default: 1)
+            Seed of the permutations
+    '''
+    def __init__(self, dim, seed=1):
+        Halton.__init__(self, dim)
+        random = numpy.random.RandomState(seed)
+        self.permutations = [numpy.concatenate(([0], 1+random.permutation(b-1))) for b in self.bases]
+        self.burn_in = 1
+
+    def take(self, index):
+        return radical_inverse(index, self.bases, self.permutations)
+
+class Sobol(Sequence):
+    ''' The Sobol sequence. The point at index i is the XOR of the direction numbers selected
+        by the bits of the Gray code of i, so consecutive points differ by a single direction
+        number (the one for the lowest zero bit of i) and a block is the cumulative XOR of
+        those, computed by numpy.bitwise_xor.accumulate. Reaching any index costs O(bits).
+
+        Parameters
+        ----------
+        dim : int
+            Number of dimensions
+        bits : int, optional (default: 32)
+            Bits of precision, allowing 2**bits points
+
+        Examples
+        ________
+            >>> from varsens import *
+            >>> s = sequence.Sobol(2)
+            >>> s.get(4).tolist()
+            [[0.0, 0.0], [0.5, 0.5], [0.75, 0.25], [0.25, 0.75]]
+            >>> s.skip(3).get(1).tolist()
+            [[0.125, 0.625]]
+    '''
+    burn_in = 1 # The origin
+
+    def __init__(self, dim, bits=32):
+        self.bits  = int(bits)
+        self.V     = direction_numbers(int(dim), self.bits)
+        self.scale = 0.5**self.bits
+        Sequence.__init__(self, dim)
+
+    def _points(self, index):
+        '''Integer coordinates of the points at the given indices'''
+        if len(index) and numpy.max(index) >= 2**self.bits:
+            raise Exception("Sobol sequence exhausted, increase bits")
+        gray = index ^ (index >> 1)
+        x    = numpy.zeros((len(index), self.dim), dtype=numpy.uint64)
+        for i in range(self.bits):
+            x ^= self.V[i] * ((gray >> i) & 1).astype(numpy.uint64)[:,None]
+        return x
+
+    def take(self, index):
+        return self._points(numpy.asarray(index, dtype=numpy.int64).reshape(-1)) * self.scale
+
+    def points(self, start, count):
+        if start + count > 2**self.bits:
+            raise Exception("Sobol sequence exhausted, increase bits")
+        x = numpy.zeros((count, self.dim), dtype=numpy.uint64)
+        if count > 0:
+            x[0] = self._points(numpy.array([start]))[0]
+            # Index of the lowest zero bit of start+i-1, i.e. the lowest set bit of start+i
+            t = numpy.arange(start+1, start+count, dtype=numpy.int64)
+            c = numpy.frexp((t & -t).astype(float))[1] - 1
+            x[1:] = self.V[c]
+            numpy.bitwise_xor.accumulate(x, axis=0, out=x)
+        return x * self.scale
+
+class Lattice(Sequence):
+    ''' An extensible rank-1 lattice in base 2: the point at index i is frac(phi(i)*z), where
+        phi is the van der Corput sequence in base 2 and z the generating vector. The first
+        2**m points form a lattice for every m. Computed exactly in integer arithmetic.
+
+        Dimensions d and e of the first 2**m points are identical when z_d = z_e, and
+        mirror images (x and 1-x) when z_d = -z_e, modulo 2**m. Either way the parameters
+        are confounded, so fewer than 2**m/4 dimensions of a base 2 lattice of 2**m points
+        can be told apart (the default Korobov vector reaches this bound). A Lattice for a
+        sample of n draws raises an exception if its first n points have too few distinct
+        dimensions, as does get() from the start of the sequence; see distinct().
+
+        Parameters
+        ----------
+        dim : int
+            Number of dimensions
+        z : array of int, optional
+            Generating vector of odd integers (e.g. from published tables). By default the
+            Korobov vector z_d = a**d mod 2**32.
+        a : int, optional (default: 17797)
+            Korobov parameter of the default generating vector
+        shift : array, optional
+            A random shift, added modulo 1 to every point
+        n : int, optional
+            Number of draws of the sample, whose dimensions must be distinct
+
+        Examples
+        ________
+            >>> from varsens import *
+            >>> sequence.Lattice(40).distinct(64), sequence.Lattice(40).distinct(256)
+            (16, 40)
+            >>>
+
+    '''
+    bits = 32
+
+    def __init__(self, dim, z=None, a=17797, shift=None, n=None):
+        Sequence.__init__(self, dim)
+        if z is None:
+            z = [1]
+            for d in range(1, self.dim): z.append((z[-1]*a) % 2**self.bits)
+        self.z = numpy.asarray(z, dtype=numpy.uint64)[:self.dim]
+        if len(self.z) != self.dim:
+            raise Exception("Lattice generating vector has fewer than %d elements" % self.dim)
+        self.shift = shift
+        if n is not None: self.check(n)
+
+    def distinct(self, count):
+        '''Number of distinct dimensions, not counting mirror images, of the first count points'''
+        m = int(numpy.ceil(numpy.log2(max(int(count), 1))))
+        r = self.z.astype(numpy.int64) % 2**m
+        return len(numpy.unique(numpy.minimum(r, (2**m - r) % 2**m)))
+
+    def check(self, count):
+        '''Raise an exception if the first count points have confounded dimensions'''
+        if self.distinct(count) < self.dim:
+            m = next(m for m in range(self.bits+1) if self.distinct(2**m) == self.dim or m == self.bits)
+            raise Exception("The first %d lattice points have only %d distinct dimensions of %d, so parameters "
+                            "would be confounded. Use at least %d points or another sequence." %
+                            (count, self.distinct(count), self.dim, 2**m))
+
+    def get(self, count):
+        if self.index == 0: self.check(count)
+        return Sequence.get(self, count)
+
+    def take(self, index):
+        i = numpy.asarray(index, dtype=numpy.uint64).reshape(-1)
+        r = numpy.zeros(len(i), dtype=numpy.uint64)
+        for b in range(self.bits): # Bit reversal
+            r |= ((i >> numpy.uint64(b)) & numpy.uint64(1)) << numpy.uint64(self.bits-1-b)
+        # Products wrap modulo 2**64, which preserves them modulo 2**32
+        x = (r[:,None] * self.z[None,:]) & numpy.uint64(2**self.bits - 1)
+        x = x * 0.5**self.bits
+        if self.shift is not None: x = numpy.mod(x + self.shift, 1.0)
+        return x
+
+class LatinHypercube(Sequence):
+    ''' Latin hypercube sampling, in consecutive blocks of size points. Each block is an
+        independent Latin hypercube (every dimension visits each of the size strata once),
+        drawn from a seed derived from its block number, so any block is generated
+        directly. Sample draws M_1 and M_2 as two blocks of n points.
+
+        Part of a block is not a Latin hypercube, so a Sample can only discard, or be
+        extended by, whole blocks of n points (see check()).
+
+        Parameters
+        ----------
+        dim : int
+            Number of dimensions
+        size : int
+            Points per Latin hypercube
+        seed : int, optional (default: 1)
+            Seed of the random permutations and jitter
+    '''
+    def __init__(self, dim, size, seed=1):
+        Sequence.__init__(self, dim)
+        self.size   = int(size)
+        self.seed   = int(seed)
+        self._cache = (None, None)
+
+    def check(self, count):
+        '''Raise an exception unless count is a whole number of blocks'''
+        if int(count) % self.size:
+            raise Exception("A Latin hypercube sequence is used in whole blocks of %d points, not %d" %
+                            (self.size, int(count)))
+
+    def _block(self, b):
+        '''The points of block b'''
+        if self._cache[0] != b:
+            random = numpy.random.RandomState([self.seed, b])
+            strata = numpy.array([random.permutation(self.size) for d in range(self.dim)]).T
+            self._cache = (b, (strata + random.uniform(size=strata.shape)) / self.size)
+        return self._cache[1]
+
+    def take(self, index):
+        index = numpy.asarray(index, dtype=numpy.int64).reshape(-1)
+        x     = numpy.zeros((len(index), self.dim))
+        block = index // self.size
+        for b in numpy.unique(block):
+            rows = block == b
+            x[rows] = self._block(b)[index[rows] - b*self.size]
+        return x
+
+class GHalton(Sequence):
+    ''' ghalton.Halton behind the Sequence interface, reproducing samples generated with it
+        exactly. ghalton can only step forward, so reaching an index generates every point
+        before it.
+    '''
+    def __init__(self, dim):
+        import ghalton
+        Sequence.__init__(self, dim)
+        self.generator = ghalton.Halton(self.dim)
+        self.position  = 0
+        self.burn_in   = 20*self.dim
+
+    def take(self, index):
+        index = numpy.asarray(index, dtype=numpy.int64).reshape(-1)
+        x     = numpy.zeros((len(index), self.dim))
+        order = numpy.argsort(index, kind='mergesort')
+        for i in order: x[i] = self.points(index[i], 1)[0]
+        return x
+
+    def points(self, start, count):
+        if start < self.position:
+            self.generator.reset()
+            self.position = 0
+        if start > self.position: self.generator.get(start - self.position)
+        self.position = start + count
+        return numpy.array(self.generator.get(count)).reshape((count, self.dim))
+
+SEQUENCES = {'halton'           : Halton,
+             'scrambled_halton' : ScrambledHalton,
+             'sobol'            : Sobol,
+             'lattice'          : Lattice,
+             'lhs'              : LatinHypercube,
+             'ghalton'          : GHalton}
+
+def create(name, dim, n=None, **kwargs):
+    """Create a sequence generator by name (see SEQUENCES)
+
+    Parameters
+    ----------
+    name : str
+        Name of the sequence
+    dim : int
+        Number of dimensions
+    n : int, optional
+        Number of draws of the sample, the block size of "lhs"
+    kwargs : keyword arguments, optional
+        Passed to the generator
+
+    Returns
+    -------
+    sequence : Sequence
+    """
+    if name not in SEQUENCES:
+        raise Exception("Unknown sequence '%s', expected one of %s" % (name, ", ".join(sorted(SEQUENCES))))
+    if name == 'lhs':
+        if n is None: raise Exception("A Latin hypercube sequence requires the number of draws n")
+        kwargs.setdefault('size', n)
+    if name == 'lattice' and n is not None:
+        kwargs.setdefault('n', n) # Checks the sample's dimensions are distinct
+    return SEQUENCES[name](dim, **kwargs)
@@ -0,0 +1,155 @@
+"""Generate any shard of a sample's rows independently, e.g. on each node of an array job.
+
+A sample is fully determined by a small specification: k, n, the scaling (see
+scale.from_spec), the sequence, the points discarded from it and the seed of the M_2
+shuffle. Row j of M_1 is point j of the sequence (after the burn in and discard) and row
+j of M_2 is point n + p[j], where p is the permutation drawn from the seed, so any row of
+the flat layout (M_1, M_2, N_j[0..k-1], N_nj[0..k-1], each n rows long, or the blocks of
+another scheme, see varsens.saltelli.layout()) can be computed from the two sequence
+points it is made of. A worker regenerates exactly the rows of
+its shard without the rest of the sample ever being generated, written or read.
+
+Shard s (counting from 1) holds rows [(s-1)*blocksize, s*blocksize) and matches the file
+prefix_s written by Sample.export(blocksize=blocksize), so objectives computed from
+shards load with Objective(prefix=..., nFiles=...) as before.
+"""
+
+import json
+import numpy
+from varsens import scale
+from varsens.sequence import create as create_sequence
+from varsens.saltelli import layout, membership
+
+def spec(k, n, scaling=None, sequence="halton", discard=0, seed=1, n_shards=1, blocksize=None, scheme="double",
+         groups=None):
+    """The specification of a sample and of its division into shards
+
+    Parameters
+    ----------
+    k : int
+        Number of parameters
+    n : int
+        Number of low discrepancy draws
+    scaling : dict, optional
+        Scaling specification (see scale.from_spec), by default the identity
+    sequence : str, optional (default: "halton")
+        Name of the low discrepancy sequence (see varsens.sequence)
+    discard : int, optional (default: 0)
+        Points discarded from the sequence after its burn in, as in Sample (a multiple
+        of n for "lhs")
+    seed : int, optional (default: 1)
+        Seed of the shuffle of M_2, as in Sample
+    n_shards : int, optional (default: 1)
+        Number of shards, ignored if blocksize is given
+    blocksize : int, optional
+        Rows per shard
+    scheme : str, optional (default: "double")
+        Sampling scheme, as in Sample
+    groups : list of lists of int, optional
+        Parameter groups, as in Sample
+
+    Returns
+    -------
+    spec : dict
+        JSON serializable specification
+    """
+    k, n  = int(k), int(n)
+    if sequence == "lhs" and int(discard) % n:
+        raise Exception("A Latin hypercube sample can only discard whole blocks of n=%d points, not %d" % (n, int(discard)))
+    if groups is not None:
+        groups = [[int(c) for c in group] for group in groups]
+        membership(groups, k) # Check they are a partition of the parameters
+    total = n*len(layout(scheme, k if groups is None else len(groups))[0])
+    if blocksize is None: blocksize = int(numpy.ceil(float(total) / n_shards))
+    return {'kind'      : 'sample',
+            'k'         : k,
+            'n'         : n,
+            'scaling'   : scaling,
+            'sequence'  : sequence,
+            'discard'   : int(discard),
+            'seed'      : int(seed),
+            'scheme'    : scheme,
+            'groups'    : groups,
+            'rows'      : total,
+            'blocksize' : int(blocksize)}
+
+def save(spec, filename):
+    """Write a specification to a JSON file"""
+    with open(filename, 'w') as f:
+        json.dump(spec, f, indent=1, sort_keys=True)
+
+def load(filename):
+    """Read a specification from a JSON file"""
+    with open(filename) as f:
+        return json.load(f)
+
+def factors(spec):
+    """Number of N_j (and N_nj) blocks of a specification: its groups, or parameters"""
+    return spec['k'] if spec.get('groups') is None else len(spec['groups'])
+
+def shards(spec):
+    """Number of shards of a specification"""
+    return int(numpy.ceil(float(spec['rows']) / spec['blocksize']))
+
+def shard_range(spec, shard):
+    """The [start, stop) rows of shard (counting from 1) in the flat layout"""
+    if shard < 1 or shard > shards(spec):
+        raise Exception("Shard %d is out of range, the sample has %d shards" % (shard, shards(spec)))
+    start = (int(shard)-1) * spec['blocksize']
+    return start, min(start + spec['blocksize'], spec['rows'])
+
+def take(spec, index):
+    """Rows of the flat layout of the sample at the given indices
+
+    Parameters
+    ----------
+    spec : dict
+        Sample specification
+    index : array of int
+        Row indices in Sample.flat() order
+
+    Returns
+    -------
+    x : numpy.array of shape (len(index), k)
+    """
+    k, n    = spec['k'], spec['n']
+    index   = numpy.asarray(index, dtype=int).reshape(-1)
+    seq     = create_sequence(spec['sequence'], k, n)
+    offset  = seq.burn_in + spec.get('discard', 0)
+    scaling = scale.from_spec(spec.get('scaling'))
+    kinds, params = layout(spec.get('scheme', "double"), factors(spec))
+    G       = numpy.eye(k, dtype=bool) if spec.get('groups') is None else membership(spec['groups'], k)
+    kind    = kinds[index // n]
+    i       = params[index // n]
+    j       = index %  n
+
+    # Only the M_1 and M_2 rows the requested rows are built from are generated
+    draws   = numpy.unique(j)
+    M_2     = numpy.random.RandomState(spec.get('seed', 1)).permutation(n)[draws]
+    M_1     = scaling(seq.take(offset + draws))
+    M_2     = scaling(seq.take(offset + n + M_2))
+    row     = numpy.searchsorted(draws, j)
+
+    # M_1 rows are rows of M_1 and M_2 rows rows of M_2. N_j[i] is M_2 with the columns of
+    # group (or parameter) i from M_1, N_nj[i] is M_1 with those columns from M_2
+    use_1   = numpy.where((kind == 2)[:,None], G[i], numpy.where((kind == 3)[:,None], ~G[i], (kind == 0)[:,None]))
+    return numpy.where(use_1, M_1[row], M_2[row])
+
+def rows(spec, shard):
+    """The rows of shard (counting from 1) of the sample, in Sample.flat() order
+
+    Examples
+    ________
+
+        >>> from varsens import *
+        >>> import numpy
+        >>> spec = shard.spec(3, 16, {'method': 'linear', 'lower_bound': [0, 0, 0], 'upper_bound': [1, 2, 3]}, n_shards=4)
+        >>> x = numpy.vstack([shard.rows(spec, s) for s in range(1, shard.shards(spec)+1)])
+        >>> s = Sample(3, 16, scale.from_spec(spec['scaling']), verbose=False)
+        >>> numpy.allclose(x, s.flat())
+        True
+        >>>
+
+    """
+    start, stop = shard_range(spec, shard)
+    return take(spec, numpy.arange(start, stop))
@@ -0,0 +1,153 @@
+"""Binary storage of flattened samples and objectives.
+
+A store is a pair of files sharing a prefix: ``prefix.npy`` holds the flattened array
+(rows in Sample.flat() order, float64 unless a dtype is chosen) and ``prefix.json`` is a small header recording
+k, n, the block layout used for batch processing and any additional metadata. Arrays
+are written block by block and read back through a memory map, so neither side needs
+to hold a second copy of the data in memory.
+"""
+
+import json
+import os
+import numpy
+from numpy.lib.format import open_memmap
+
+def paths(prefix):
+    """Return the (data, header) file names for a store prefix
+
+    Parameters
+    ----------
+    prefix : str
+        Store prefix, optionally ending in '.npy' or '.json'
+
+    Returns
+    -------
+    (data, header) : tuple of str
+    """
+    root, ext = os.path.splitext(prefix)
+    if ext not in ('.npy', '.json'): root = prefix
+    return root + '.npy', root + '.json'
+
+def create(prefix, shape, header, dtype=numpy.float64):
+    """Create a store and return its data file as a writable memory map
+
+    Parameters
+    ----------
+    prefix : str
+        Store prefix
+    shape : tuple
+        Shape of the stored array, (rows, columns)
+    header : dict
+        Header entries, must be JSON serializable. 'rows', 'columns' and 'dtype' are
+        filled in from the array.
+    dtype : numpy.dtype, optional (default: float64)
+
+    Returns
+    -------
+    data : numpy.memmap
+    """
+    data, head = paths(prefix)
+    header = dict(header)
+    header['rows']    = int(shape[0])
+    header['columns'] = int(shape[1]) if len(shape) > 1 else 1
+    header['dtype']   = numpy.dtype(dtype).str
+    header['data']    = os.path.basename(data)
+    with open(head, 'w') as f:
+        json.dump(header, f, indent=1, sort_keys=True)
+    return open_memmap(data, mode='w+', dtype=dtype, shape=tuple(shape))
+
+def open_store(prefix, mode='r'):
+    """Open a store
+
+    Parameters
+    ----------
+    prefix : str
+        Store prefix, or the name of either of its files
+    mode : str, optional (default: 'r')
+        Memory map mode ('r', 'r+' or 'c')
+
+    Returns
+    -------
+    (header, data) : (dict, numpy.memmap)
+    """
+    data, head = paths(prefix)
+    header = read_header(head)
+    return header, numpy.load(data, mmap_mode=mode)
+
+def read_header(prefix):
+    """Read the header of a store as a dict"""
+    with open(paths(prefix)[1]) as f:
+        return json.load(f)
+
+def blocks(rows, blocksize):
+    """Split rows into consecutive [start, stop) blocks of at most blocksize rows"""
+    blocksize = int(min(blocksize, rows)) if rows > 0 else 1
+    return [[b, min(b+blocksize, rows)] for b in range(0, rows, blocksize)]
+
+def block(prefix, b):
+    """Return block b (counting from 1, as in exported batch files) of a store
+
+    Parameters
+    ----------
+    prefix : str
+        Store prefix
+    b : int
+        Block number, starting from 1
+
+    Returns
+    -------
+    rows : numpy.memmap
+        A read only view of the rows in the block
+    """
+    header, data = open_store(prefix)
+    start, stop = header['blocks'][int(b)-1]
+    return data[start:stop]
+
+def concatenate(files, prefix, header=None, delimiter=None, dtype=numpy.float64):
+    """Join batch output files, in order, into a single store that can be memory mapped
+
+    Parameters
+    ----------
+    files : list of str
+        Batch files, either .npy arrays or whitespace (or delimiter) separated text
+    prefix : str
+        Prefix of the store to create
+    header : dict, optional
+        Header entries for the store (e.g. k and n). The rows of each input file are
+        recorded as its blocks.
+    delimiter : str, optional
+        Column delimiter of text files
+    dtype : numpy.dtype, optional (default: float64)
+        Type of the joined array (e.g. numpy.float32 to halve its size)
+
+    Returns
+    -------
+    data : numpy.memmap
+        The joined array, opened read only
+    """
+    def rows(file):
+        if file.endswith('.npy'):
+            shape = numpy.load(file, mmap_mode='r').shape
+            return shape[0], (shape[1] if len(shape) > 1 else 1)
+        count, columns = 0, 1
+        with open(file) as f:
+            for line in f:
+                if line.strip():
+                    if count == 0: columns = len(line.split(delimiter))
+                    count += 1
+        return count, columns
+
+    shapes = [rows(file) for file in files]
+    starts = numpy.cumsum([0] + [r for r, c in shapes])
+    header = dict(header or {})
+    header['blocks'] = [[int(starts[i]), int(starts[i+1])] for i in range(len(files))]
+    data = create(prefix, (int(starts[-1]), shapes[0][1]), header, dtype)
+    for i, file in enumerate(files):
+        if file.endswith('.npy'):
+            x = numpy.load(file, mmap_mode='r')
+        else:
+            x = numpy.loadtxt(file, delimiter=delimiter, ndmin=2)
+        data[starts[i]:starts[i+1]] = numpy.reshape(x, (len(x), -1))
+    data.flush()
+    del data
+    return open_store(prefix)[1]
@@ -0,0 +1,64 @@
+from varsens    import *
+from nose.tools import *
+import numpy
+
+def objective(x): return [numpy.sum(x**2), numpy.prod(x)]
+
+def test_any_order():
+    k = 4
+    n = 32
+    s = Sample(k, n, lambda x: x, verbose=False)
+    o = Objective(k, n, s, objective, verbose=False)
+    v = Varsens(o, verbose=False)
+
+    y     = o.flat()
+    order = numpy.random.RandomState(0).permutation(len(y))
+    a     = Accumulator(k, n, second_order=True)
+    for chunk in numpy.array_split(order, 5):
+        assert_false(a.complete)
+        a.add(chunk, y[chunk])
+    assert_true(a.complete)
+
+    assert_almost_equal(numpy.sum(numpy.abs(a.E_2    - v.E_2)),    0.0)
+    assert_almost_equal(numpy.sum(numpy.abs(a.var_y  - v.var_y)),  0.0)
+    assert_almost_equal(numpy.sum(numpy.abs(a.sens   - v.sens)),   0.0)
+    assert_almost_equal(numpy.sum(numpy.abs(a.sens_t - v.sens_t)), 0.0)
+    for i in range(k):
+        for j in range(k):
+            for m in range(2):
+                assert_almost_equal(a.sens_2[i,j,m],  v.sens_2[i,j,m])
+                assert_almost_equal(a.sens_2n[i,j,m], v.sens_2n[i,j,m])
+
+def test_blocks():
+    k = 3
+    n = 20
+    s = Sample(k, n, lambda x: x, verbose=False)
+    y = numpy.sum(s.flat(), axis=1)
+    a = Accumulator(k, n)
+    a.add_block(0, y[:50])
+    # Repeated rows are ignored
+    a.add_block(40, y[40:])
+    assert_true(a.complete)
+    assert_almost_equal(a.fraction, 1.0)
+    v = Varsens(Objective(k, n, objective_vals=y, verbose=False), verbose=False)
+    assert_almost_equal(numpy.sum(numpy.abs(a.sens_t - v.sens_t)), 0.0)
+    # Second order terms were not accumulated
+    assert_false(hasattr(a, 'sens_2'))
+    assert_raises(AttributeError, getattr, a, 'sens_2n')
+
+def test_groups():
+    k = 4
+    n = 16
+    groups = [[0, 2], [1, 3]]
+    s = Sample(k, n, lambda x: x, verbose=False, groups=groups)
+    y = numpy.sum(s.flat()**2, axis=1)
+    a = Accumulator(k, n, groups=groups).add_block(0, y)
+    assert_true(a.complete)
+    v = Varsens(Objective(k, n, s, objective_vals=y, verbose=False), sample=s, verbose=False)
+    assert_equal(a.sens.shape, v.sens.shape)
+    assert_almost_equal(numpy.sum(numpy.abs(a.sens   - v.sens)),   0.0)
+    assert_almost_equal(numpy.sum(numpy.abs(a.sens_t - v.sens_t)), 0.0)
+
+def test_schemes():
+    for scheme in ("jansen", "radial"):
+        assert_raises(Exception, Accumulator, 3, 8, scheme=scheme)
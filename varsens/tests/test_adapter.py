@@ -0,0 +1,71 @@
+from varsens    import *
+from nose.tools import *
+import numpy
+
+names     = ['kf', 'kr', 'A_0']
+rate_args = [['kf', 'kf'], ['kr', '2.5'], [], ['kc', 'kf']]
+initials  = [(0, 'A_0'), (2, 'C_0')]
+values    = {'kc': 3.0, 'C_0': 7.0}
+
+def loop(x):
+    # The per element computation the adapter replaces
+    column = dict((name, i) for i, name in enumerate(names))
+    c = numpy.zeros((len(x), len(rate_args)))
+    for i in range(len(x)):
+        for j in range(len(rate_args)):
+            rate = 1.0
+            for r in rate_args[j]:
+                if r in column:   rate *= x[i][column[r]]
+                elif r in values: rate *= values[r]
+                else:             rate *= float(r)
+            c[i][j] = rate
+    y = numpy.zeros((len(x), 3))
+    for species, p in initials:
+        y[:,species] = x[:,column[p]] if p in column else values[p]
+    return c, y
+
+def test_matches_loop():
+    x = Sample(3, 20, lambda x: 1.0 + x, verbose=False).flat()
+    a = adapter.Adapter(names, rate_args, initials, 3, values)
+    rates, initial = a(x)
+    expected_rates, expected_initial = loop(x)
+    assert_equal(rates.shape, (len(x), 4))
+    assert_almost_equal(numpy.max(numpy.abs(rates - expected_rates)), 0.0)
+    assert_almost_equal(numpy.max(numpy.abs(initial - expected_initial)), 0.0)
+
+def test_column_map():
+    # Sample columns given explicitly, one of them unused
+    a = adapter.Adapter({'kr': 0, 'kf': 2}, [['kf'], ['kr', 'kf']])
+    assert_equal(a.rates(numpy.array([[2.0, 5.0, 3.0]])).tolist(), [[3.0, 6.0]])
+    # An argument that is neither sampled, given a value, nor a number
+    assert_raises(Exception, adapter.Adapter, names, [['kx']])
+
+class Parameter(object):
+    def __init__(self, name, value):
+        self.name  = name
+        self.value = value
+
+class Rate(object):
+    # The parts of a sympy rate expression from_pysb uses
+    def __init__(self, *args):
+        self.args   = args
+        self.is_Mul = len(args) > 1
+    def __str__(self): return "*".join(self.args)
+
+class Model(object):
+    def __init__(self):
+        self.parameters = [Parameter('kf', 1.0), Parameter('syn_rate', 2.0), Parameter('scale_kr', 3.0),
+                           Parameter('A_0', 10.0)]
+        self.species    = ['A()', 'B()']
+        self.initial_conditions = [('A()', self.parameters[3])]
+        self.reactions  = [{'rate': Rate('kf', '__s0**2')},
+                           {'rate': Rate('syn_rate')},
+                           {'rate': Rate('scale_kr', '__s0', '__s1')}]
+    def parameters_rules(self): return self.parameters[:3]
+
+def test_from_pysb():
+    # Parameters whose names start with "s" are kept, species concentrations dropped
+    a = adapter.from_pysb(Model())
+    rates, initial = a(numpy.array([[2.0, 5.0, 7.0]]))
+    assert_equal(rates.tolist(), [[2.0, 5.0, 7.0]])
+    assert_equal(initial.tolist(), [[10.0, 0.0]])
@@ -0,0 +1,45 @@
+from varsens    import *
+from nose.tools import *
+import numpy
+
+def objective(x): return [numpy.sum(x*numpy.array([1.0, 2.0, 3.0])), x[0]*x[1]]
+
+def test_intervals():
+    v  = Varsens(objective, lambda x: x, 3, 256, verbose=False)
+    ci = v.bootstrap(B=200, chunk=64, seed=1, second_order=True)
+    assert_equal(ci['sens'].shape,   (2,)+v.sens.shape)
+    assert_equal(v.sens_t_ci.shape,  (2,)+v.sens_t.shape)
+    assert_equal(ci['sens_2'].shape, (2, 3, 3, 2))
+    assert_true(numpy.all(ci['sens'][0]   <= ci['sens'][1]))
+    assert_true(numpy.all(ci['sens_t'][0] <= ci['sens_t'][1]))
+    # Point estimates fall inside their intervals
+    assert_true(numpy.all((v.sens   >= ci['sens'][0])   & (v.sens   <= ci['sens'][1])))
+    assert_true(numpy.all((v.sens_t >= ci['sens_t'][0]) & (v.sens_t <= ci['sens_t'][1])))
+
+def test_identity_weights():
+    # With every draw taken exactly once the replicate equals the estimate
+    from varsens.bootstrap import _terms, _weighted
+    v = Varsens(objective, lambda x: x, 3, 64, verbose=False)
+    o = v.objective
+    F  = _terms(o.fM_1, o.fM_2, o.fN_j, o.fN_nj)
+    r  = _weighted(numpy.ones((1, 64)), F, o.fN_j, o.fN_nj, True)
+    assert_almost_equal(numpy.sum(numpy.abs(r['sens'][0]   - v.sens)),   0.0)
+    assert_almost_equal(numpy.sum(numpy.abs(r['sens_t'][0] - v.sens_t)), 0.0)
+    for a in range(3):
+        for b in range(3):
+            for m in range(2):
+                assert_almost_equal(r['sens_2'][0,a,b,m],  v.sens_2[a,b,m])
+                assert_almost_equal(r['sens_2n'][0,a,b,m], v.sens_2n[a,b,m])
+
+def test_executor():
+    from concurrent.futures import ThreadPoolExecutor
+    v = Varsens(objective, lambda x: x, 3, 64, verbose=False)
+    a = v.bootstrap(B=50, chunk=10, seed=3)
+    with ThreadPoolExecutor(2) as pool:
+        b = v.bootstrap(B=50, chunk=10, seed=3, executor=pool)
+    assert_almost_equal(numpy.sum(numpy.abs(a['sens'] - b['sens'])), 0.0)
+    # The same seed gives the same intervals, another seed other draws
+    c = v.bootstrap(B=50, chunk=10, seed=3)
+    assert_almost_equal(numpy.sum(numpy.abs(a['sens'] - c['sens'])), 0.0)
+    d = v.bootstrap(B=50, chunk=10, seed=4)
+    assert_true(numpy.sum(numpy.abs(a['sens'] - d['sens'])) > 0.0)
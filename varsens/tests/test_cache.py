@@ -0,0 +1,53 @@
+from varsens    import *
+from nose.tools import *
+import numpy
+import os
+import shutil
+import tempfile
+
+calls = []
+
+def counted(x):
+    calls.append(1)
+    return [numpy.sum(x), numpy.prod(x)]
+
+def test_repeated_analysis():
+    k = 3
+    tmpdir = tempfile.mkdtemp()
+    filename = os.path.join(tmpdir, "cache.db")
+    o1 = Objective(k, 16, Sample(k, 16, lambda x: x, verbose=False), counted, verbose=False, cache=filename)
+    assert_equal(o1.hits, 0)
+    assert_equal(o1.evaluations, 2*16*(1+k))
+
+    # Doubling n: M_1 rows repeat, and the cache persists between objectives
+    del calls[:]
+    s  = Sample(k, 32, lambda x: x, verbose=False)
+    o2 = Objective(k, 32, s, counted, verbose=False, cache=filename, vectorized=False, batch_size=7)
+    plain = Objective(k, 32, s, counted, verbose=False)
+    assert_true(o2.hits >= 16)
+    assert_equal(o2.hits + o2.evaluations, 2*32*(1+k))
+    assert_equal(o2.evaluations, len(calls) - 2*32*(1+k))
+    assert_true(numpy.all(o2.flat() == plain.flat()))
+
+    # Everything is found the second time
+    o3 = Objective(k, 32, s, counted, verbose=False, cache=cache.Cache(filename))
+    shutil.rmtree(tmpdir)
+    assert_equal(o3.evaluations, 0) # The number of objectives is taken from the cache too
+    assert_equal(o3.hits, 2*32*(1+k))
+    assert_true(numpy.all(o3.flat() == plain.flat()))
+
+def test_eviction():
+    c = cache.Cache(":memory:", max_bytes=10*16)
+    x = numpy.random.RandomState(1).rand(30, 4)
+    for i in range(30):
+        c.put(x[i:i+1], [[i, 2.0*i]])
+    assert_equal(len(c), 10)
+    # The least recently used rows were evicted
+    found, values = c.get(x, 2)
+    assert_equal(list(numpy.flatnonzero(found)), range(20, 30))
+    assert_equal(values[29].tolist(), [29.0, 58.0])
+    # A lookup refreshes an entry, so it outlives newer ones
+    c.max_entries = 10
+    c.get(x[20:21], 2)
+    c.put(x[0:1], [[0, 0]])
+    assert_equal(c.get(x[20:22], 2)[0].tolist(), [True, False])
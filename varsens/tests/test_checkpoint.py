@@ -0,0 +1,97 @@
+from varsens    import *
+from varsens    import checkpoint
+from nose.tools import *
+import numpy
+import os
+import tempfile
+
+def objective(x): return [numpy.sum(x), numpy.prod(x)]
+
+class Crash(object):
+    '''objective, raising after a given number of calls'''
+    def __init__(self, calls): self.calls = calls
+    def __call__(self, x):
+        self.calls -= 1
+        if self.calls < 0: raise KeyboardInterrupt
+        return objective(x)
+
+def counted(x):
+    counted.calls += 1
+    return objective(x)
+
+def test_resume():
+    k = 3
+    n = 16
+    prefix = os.path.join(tempfile.mkdtemp(), "run")
+    s = Sample(k, n, lambda x: x, verbose=False)
+    assert_raises(KeyboardInterrupt, Objective, k, n, s, Crash(50), verbose=False, batch_size=8, checkpoint=prefix)
+    # Only whole batches were recorded
+    done = checkpoint.completed(prefix)[:2*n*(1+k)]
+    assert_equal(numpy.count_nonzero(done), 49)
+
+    # A record cut short by a crash is dropped
+    with open(prefix + ".ckpt", "ab") as f: f.write(b"\x01\x02\x03")
+
+    counted.calls = 0
+    o = Objective(k, n, s, counted, verbose=False, batch_size=8, checkpoint=prefix)
+    assert_equal(counted.calls, 2*n*(1+k) - 49)
+    p = Objective(k, n, s, objective, verbose=False)
+    assert_almost_equal(numpy.sum(numpy.abs(o.flat() - p.flat())), 0.0)
+    assert_true(numpy.all(checkpoint.completed(prefix)[:2*n*(1+k)]))
+
+    # Resuming a complete checkpoint evaluates nothing
+    counted.calls = 0
+    Objective(k, n, s, counted, verbose=False, checkpoint=prefix)
+    assert_equal(counted.calls, 0)
+
+def test_extend():
+    k = 2
+    n = 8
+    prefix = os.path.join(tempfile.mkdtemp(), "run")
+    o = Objective(k, n, Sample(k, n, lambda x: x, verbose=False), objective, verbose=False, checkpoint=prefix)
+    o.extend(8)
+    counted.calls = 0
+    p = Objective(k, 16, o.sample, counted, verbose=False, checkpoint=prefix)
+    assert_equal(counted.calls, 0)
+    assert_almost_equal(numpy.sum(numpy.abs(o.flat() - p.flat())), 0.0)
+    assert_raises(Exception, Objective, k, n, o.sample, objective, verbose=False, checkpoint=prefix)
+
+def test_layout():
+    # A checkpoint is not resumed by a sample of another scheme or grouping
+    k = 3
+    n = 8
+    prefix = os.path.join(tempfile.mkdtemp(), "run")
+    Objective(k, n, Sample(k, n, lambda x: x, verbose=False), objective, verbose=False, checkpoint=prefix)
+    jansen = Sample(k, n, lambda x: x, verbose=False, scheme="jansen")
+    assert_raises(Exception, Objective, k, n, jansen, objective, verbose=False, checkpoint=prefix)
+    grouped = Sample(k+1, n, lambda x: x, verbose=False, groups=[[0, 1], [2], [3]])
+    assert_raises(Exception, Objective, k, n, grouped, objective, verbose=False, checkpoint=prefix)
+    # The same layout still resumes
+    counted.calls = 0
+    Objective(k, n, Sample(k, n, lambda x: x, verbose=False), counted, verbose=False, checkpoint=prefix)
+    assert_equal(counted.calls, 0)
+
+def failing(x):
+    if x[0] < 0.25: raise ValueError("solver failed")
+    return objective(x)
+
+def test_resume_failures():
+    # The reason codes of failed rows are restored along with their values
+    k = 3
+    n = 16
+    prefix = os.path.join(tempfile.mkdtemp(), "run")
+    s = Sample(k, n, lambda x: x, verbose=False)
+    fresh = Objective(k, n, s, failing, verbose=False, capture=True)
+    assert_true(numpy.count_nonzero(fresh.failures) > 0)
+
+    crash = Crash(60)
+    def interrupted(x):
+        crash(x)
+        return failing(x)
+    assert_raises(KeyboardInterrupt, Objective, k, n, s, interrupted, verbose=False, capture=True,
+                  batch_size=8, checkpoint=prefix)
+    o = Objective(k, n, s, failing, verbose=False, capture=True, batch_size=8, checkpoint=prefix)
+    assert_equal(list(o.failures), list(fresh.failures))
+    o = Objective(k, n, s, objective, verbose=False, checkpoint=prefix)
+    assert_equal(list(o.failures), list(fresh.failures))
+    assert_equal(numpy.count_nonzero(numpy.isnan(o.flat()[:,0])), numpy.count_nonzero(fresh.failures))
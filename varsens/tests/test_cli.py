@@ -0,0 +1,78 @@
+from varsens    import *
+from varsens    import cli
+from nose.tools import *
+import numpy
+import os
+import shutil
+import sys
+import tempfile
+
+MODEL = '''
+import numpy
+def objective(x): return [numpy.sum(x*numpy.array([1.0, 2.0, 3.0])), x[0]*x[1]]
+
+calls = []
+def first_fails(x):
+    calls.append(x)
+    if len(calls) == 1: raise ValueError("solver failed")
+    return objective(x)
+'''
+
+def test_pipeline():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        spec   = os.path.join(tmpdir, "spec.json")
+        model  = os.path.join(tmpdir, "model.py")
+        with open(model, "w") as f: f.write(MODEL)
+
+        assert_equal(cli.main(["-q", "generate", spec, "-k", "3", "-n", "64", "--shards", "5",
+                               "--scaling", '{"method": "linear", "lower_bound": [0, 0, 0], "upper_bound": [1, 1, 2]}']), 0)
+        for b in range(1, 6):
+            cli.main(["-q", "evaluate", spec, str(b), "--objective", model+":objective", "--outdir", tmpdir,
+                      "--binary" if b % 2 else "--prefix=objective"])
+
+        # A duplicated shard is refused
+        os.rename(os.path.join(tmpdir, "objective_2.txt"), os.path.join(tmpdir, "objective_1.txt"))
+        assert_equal(cli.main(["-q", "merge", spec, os.path.join(tmpdir, "merged"), "--indir", tmpdir]), 1)
+        os.rename(os.path.join(tmpdir, "objective_1.txt"), os.path.join(tmpdir, "objective_2.txt"))
+        assert_equal(cli.main(["-q", "merge", spec, os.path.join(tmpdir, "merged"), "--indir", tmpdir]), 0)
+
+        results = os.path.join(tmpdir, "sens.npz")
+        assert_equal(cli.main(["-q", "analyze", spec, os.path.join(tmpdir, "merged.npy"), "--output", results]), 0)
+
+        s = Sample(3, 64, scale.from_spec(shard.load(spec)['scaling']), verbose=False)
+        v = Varsens(cli.load_function(model+":objective"), sample=s, verbose=False)
+        r = numpy.load(results)
+        assert_almost_equal(numpy.max(numpy.abs(r['sens']   - v.sens)),   0.0)
+        assert_almost_equal(numpy.max(numpy.abs(r['sens_2'] - v.sens_2)), 0.0)
+    finally:
+        shutil.rmtree(tmpdir)
+
+def test_missing_shard():
+    tmpdir = tempfile.mkdtemp()
+    spec   = os.path.join(tmpdir, "spec.json")
+    try:
+        cli.main(["-q", "generate", spec, "-k", "2", "-n", "8", "--blocksize", "10"])
+        numpy.savetxt(os.path.join(tmpdir, "objective_1.txt"), numpy.zeros(10))
+        assert_equal(cli.main(["-q", "merge", spec, os.path.join(tmpdir, "merged"), "--indir", tmpdir]), 1)
+    finally:
+        shutil.rmtree(tmpdir)
+
+def test_capture_first_row():
+    # The first row fails: it is recorded as NaN, and no row is evaluated twice
+    tmpdir = tempfile.mkdtemp()
+    spec   = os.path.join(tmpdir, "spec.json")
+    model  = os.path.join(tmpdir, "capture_model.py")
+    try:
+        with open(model, "w") as f: f.write(MODEL)
+        cli.main(["-q", "generate", spec, "-k", "3", "-n", "8", "--shards", "2"])
+        assert_equal(cli.main(["-q", "evaluate", spec, "1", "--objective", model+":first_fails", "--outdir", tmpdir,
+                               "--capture"]), 0)
+        y = numpy.loadtxt(os.path.join(tmpdir, "objective_1.txt"), ndmin=2)
+        x = shard.rows(shard.load(spec), 1)
+        assert_equal(len(sys.modules['capture_model'].calls), len(x))
+        assert_equal(y.shape, (len(x), 2))
+        assert_true(numpy.all(numpy.isnan(y[0])))
+        assert_almost_equal(y[1, 1], x[1, 0]*x[1, 1])
+    finally:
+        shutil.rmtree(tmpdir)
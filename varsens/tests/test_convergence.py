@@ -0,0 +1,57 @@
+from varsens    import *
+from nose.tools import *
+import numpy
+
+def linear(x): return numpy.sum(x*numpy.array([1.0, 2.0, 3.0]))
+
+def test_profile():
+    # Prediction of sqrt(max error) quoted in profile/model.R
+    assert_almost_equal(numpy.sqrt(convergence.predicted_error(10000, 197)), 0.02657896, places=6)
+    n = convergence.required_n(106, 0.01)
+    assert_true(convergence.predicted_error(n, 106)   <= 0.01)
+    assert_true(convergence.predicted_error(n-1, 106) >  0.01)
+    assert_equal(convergence.required_n(1000, 0.01), None)
+
+def test_profile_run_until():
+    v = Varsens(linear, lambda x: x, 3, 8, verbose=False)
+    v.run_until(0.05, method="profile")
+    assert_true(v.converged)
+    # The first n whose predicted maximum error is within the tolerance
+    assert_true(convergence.predicted_error(v.n, 3) <= 0.05)
+    assert_true(convergence.predicted_error(v.n//2, 3) > 0.05)
+
+def test_run_until():
+    v = Varsens(linear, lambda x: x, 3, 32, verbose=False)
+    evaluations = v.run_until(0.01, max_evals=1e5)
+    assert_true(v.converged)
+    assert_true(v.error <= 0.01)
+    assert_true(evaluations <= 1e5)
+    assert_equal(evaluations, 2*v.n*(1+v.k))
+    # Analytical first order indices of a linear function
+    truth = numpy.array([1.0, 4.0, 9.0]) / 14.0
+    for i in range(3):
+        assert_almost_equal(v.sens[i], truth[i], places=1)
+
+def test_budget():
+    v = Varsens(linear, lambda x: x, 3, 32, verbose=False)
+    evaluations = v.run_until(1e-12, max_evals=2000)
+    assert_false(v.converged)
+    assert_true(evaluations <= 2000)
+    assert_equal(v.n, 128)
+
+def test_profile_unreachable():
+    # For large k the fitted error no longer falls with n, so there is nothing to run
+    k = 400
+    assert_equal(convergence.required_n(k, 1e-3), None)
+    v = Varsens(lambda x: numpy.sum(x), lambda x: x, k, 2, verbose=False, second_order=False)
+    assert_raises(ValueError, v.run_until, 1e-3, method="profile")
+    assert_equal(v.n, 2)
+
+def test_max_doublings():
+    # A noisy objective never settles, the doublings stop at max_doublings
+    noise = numpy.random.RandomState(1)
+    v = Varsens(lambda x: linear(x) + noise.normal(), lambda x: x, 3, 8, verbose=False)
+    evaluations = v.run_until(1e-12, max_doublings=3)
+    assert_false(v.converged)
+    assert_equal(v.n, 64)
+    assert_equal(evaluations, 2*64*(1+3))
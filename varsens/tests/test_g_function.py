@@ -87,3 +87,59 @@ def test_double_g_function():
         assert_almost_equal(truth[i], estimate[i][0],   places=2)
         assert_almost_equal(truth[i], estimate[5-i][1], places=2)
 
+
+def test_second_order_options():
+    s    = Sample(6, 512, lambda x: x, verbose=False)
+    full = Varsens(g_double_objective, sample=s, verbose=False)
+    assert_equal(full.sens_2.shape, (6, 6, 2))
+
+    pairs = [(0, 1), (2, 5), (4, 3)]
+    some  = Varsens(Objective(6, 512, objective_vals=full.objective.flat(), verbose=False),
+                    verbose=False, second_order=pairs)
+    assert_equal(some.sens_2.shape, (3, 2))
+    for p, (i, j) in enumerate(pairs):
+        for m in range(2):
+            assert_almost_equal(some.sens_2[p, m],  full.sens_2[i, j, m])
+            assert_almost_equal(some.sens_2n[p, m], full.sens_2n[j, i, m])
+
+    none = Varsens(g_double_objective, sample=s, verbose=False, second_order=False)
+    assert_equal(none.sens_2, None)
+    assert_almost_equal(numpy.sum(numpy.abs(none.sens - full.sens)), 0.0)
+
+def g_vectorized(x):
+    a = numpy.array(model)
+    return numpy.prod((numpy.abs(4.0*x-2.0)+a) / (1.0+a), axis=1)
+
+def test_schemes():
+    k = len(model)
+    n = 1024*16
+    truth = g_truth(model)
+    for scheme, blocks in (("jansen", k+2), ("radial", k+1)):
+        v = Varsens(g_vectorized, lambda x: x, k, n, verbose=False, scheme=scheme, vectorized=True)
+        assert_equal(v.objective.evaluations, n*blocks)
+        assert_equal(v.sens_2, None)
+        assert_almost_equal(g_var(model), v.var_y, places=2)
+        for i in range(k):
+            assert_almost_equal(g_truth_t(model, i), v.sens_t[i]*v.var_y, places=2)
+            if scheme == "jansen":
+                assert_almost_equal(truth[i], v.sens[i]*v.var_y, places=2)
+    # The radial scheme has no first order estimate
+    assert_equal(v.sens, None)
+
+def test_groups():
+    # The closed first order variance of a group u is prod_{i in u} (1+V_i) - 1, and its
+    # total is the variance less the closed variance of the other parameters
+    groups = [[0], [1], [2, 3], [4, 5]]
+    x      = 1.0 + g_truth(model)
+    v = Varsens(g_vectorized, lambda x: x, len(model), 1024*16, verbose=False, vectorized=True, groups=groups)
+    assert_equal(v.k, len(groups))
+    assert_equal(v.objective.evaluations, 1024*16*2*(1+len(groups)))
+    for i, group in enumerate(groups):
+        others = [j for j in range(len(model)) if j not in group]
+        assert_almost_equal(numpy.prod(x[group])-1.0, v.sens[i]*v.var_y, places=2)
+        assert_almost_equal(numpy.prod(x)-numpy.prod(x[others]), v.sens_t[i]*v.var_y, places=2)
+
+    s = Sample(len(model), 64, lambda x: x, verbose=False, groups=groups)
+    l = Sample(len(model), 64, lambda x: x, verbose=False, groups=groups, lazy=True)
+    assert_almost_equal(numpy.max(numpy.abs(s.flat() - l.flat())), 0.0)
+    assert_raises(Exception, Sample, len(model), 64, lambda x: x, verbose=False, groups=[[0, 1], [1, 2]])
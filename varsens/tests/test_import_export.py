@@ -54,14 +54,13 @@ def g_var(model):
 def run_objectives(tmpdir, b):
     for i in range(b):
         result = []
-        samples = numpy.loadtxt(tmpdir+("/batch-%d.csv" % (i+1)))
+        samples = numpy.loadtxt(tmpdir+("/batch_%d.csv" % (i+1)))
         for s in samples:
             result.append(g_objective(s))
-        numpy.savetxt(tmpdir+("/obj-%d.csv" % (i+1)), numpy.array(result))
+        numpy.savetxt(tmpdir+("/obj_%d.csv" % (i+1)), numpy.array(result))
 
 def load_results(tmpdir, s, b):
-    o = Objective(s.k, s.n, s, None)
-    o.load(tmpdir+"/obj-", ".csv", b)
+    o = Objective(s.k, s.n, s, indir=tmpdir, prefix="obj", postfix=".csv", nFiles=b)
     # Now compute results from batch
     v = Varsens(o, sample=s)
     return v
@@ -79,7 +78,7 @@ def test_import_export():
     v = Varsens(g_objective, verbose=False, sample=s)
     
     # Do a batch run, simulating ACCRE
-    s.export(tmpdir+"/batch-", ".csv", 200)
+    s.export(tmpdir, "batch", ".csv", blocksize=200)
     run_objectives(tmpdir, 72)
     v2 = load_results(tmpdir, s, 72)
 
@@ -97,3 +96,141 @@ def test_import_export():
 
 
 
+
+def test_binary_export():
+    tmpdir = mkdtemp()
+
+    k = 4
+    n = 64
+    s = Sample(k, n, lambda x: x, verbose=False)
+    s.export(tmpdir, "sample", blocksize=100, binary=True, metadata={'model': 'g'})
+
+    header = store.read_header(tmpdir+"/sample.json")
+    assert_equal(header['k'], k)
+    assert_equal(header['n'], n)
+    assert_equal(header['metadata']['model'], 'g')
+    assert_equal(len(header['blocks']), int(numpy.ceil(2.0*n*(1+k)/100)))
+    assert_almost_equal(numpy.sum(numpy.abs(store.block(tmpdir+"/sample", 2) - s.flat()[100:200])), 0.0)
+
+    # Reload the sample through a memory map
+    s2 = Sample(k, n, loadFile="sample.npy", indir=tmpdir, verbose=False)
+    assert_almost_equal(numpy.sum(numpy.abs(s.N_nj - s2.N_nj)), 0.0)
+
+    o = Objective(k, n, s, g_objective, verbose=False)
+    o.export(tmpdir, "objective", binary=True)
+    o2 = Objective(k, n, loadFile="objective.npy", indir=tmpdir, verbose=False)
+
+    shutil.rmtree(tmpdir)
+
+    assert_almost_equal(numpy.sum(numpy.abs(o.fM_1 - o2.fM_1)),   0.0)
+    assert_almost_equal(numpy.sum(numpy.abs(o.fN_j - o2.fN_j)),   0.0)
+    assert_almost_equal(numpy.sum(numpy.abs(o.fN_nj - o2.fN_nj)), 0.0)
+
+def test_nan_mask():
+    k = 3
+    n = 50
+    s = Sample(k, n, lambda x: x, verbose=False)
+    o = Objective(k, n, s, g_objective, verbose=False)
+
+    bad  = [3, 17, 40]
+    vals = o.flat()
+    vals[bad[0]]             = numpy.nan # in fM_1
+    vals[(2+1)*n + bad[1]]   = numpy.nan # in fN_j[1]
+    vals[(2+k+2)*n + bad[2]] = numpy.nan # in fN_nj[2]
+    masked = Objective(k, n, objective_vals=vals, verbose=False)
+    assert_equal(list(numpy.flatnonzero(~masked.mask)), bad)
+    # Values are masked, not deleted
+    assert_equal(masked.fM_1.shape, (n, 1))
+
+    # Same analysis as with the rows removed
+    keep    = numpy.array([j not in bad for j in range(n)])
+    trimmed = numpy.vstack([seg[keep] for seg in vals.reshape((2*(1+k), n, 1))])
+    v1 = Varsens(masked, verbose=False)
+    v2 = Varsens(Objective(k, n-len(bad), objective_vals=trimmed, verbose=False), verbose=False)
+    assert_almost_equal(v1.var_y, v2.var_y)
+    for i in range(k):
+        assert_almost_equal(v1.sens[i],   v2.sens[i])
+        assert_almost_equal(v1.sens_t[i], v2.sens_t[i])
+
+def test_objective_mask():
+    k = 3
+    n = 50
+    s = Sample(k, n, lambda x: x, verbose=False)
+    o = Objective(k, n, s, lambda x: [g_objective(x), numpy.sum(x)], verbose=False)
+
+    vals = o.flat().copy()
+    vals[5, 0]               = numpy.nan # fM_1, first objective only
+    vals[(2+2)*n + 30, 1]    = numpy.nan # fN_j[2], second objective only
+    masked = Objective(k, n, objective_vals=vals, verbose=False)
+    assert_equal(list(numpy.flatnonzero(~masked.mask)), [5, 30])
+    assert_equal(list(numpy.flatnonzero(~masked.masks[:,0])), [5])
+    assert_equal(list(numpy.flatnonzero(~masked.masks[:,1])), [30])
+
+    # Each objective is analysed as if it had been loaded on its own
+    v = Varsens(masked, verbose=False, mask="objective")
+    assert_equal(list(v.n_valid), [n-1, n-1])
+    for col in range(2):
+        single = Varsens(Objective(k, n, objective_vals=vals[:,col], verbose=False), verbose=False)
+        assert_equal(single.n_valid, n-1)
+        assert_almost_equal(v.var_y[col], single.var_y[0])
+        for i in range(k):
+            assert_almost_equal(v.sens[i,col],   single.sens[i,0])
+            assert_almost_equal(v.sens_t[i,col], single.sens_t[i,0])
+            for j in range(k):
+                assert_almost_equal(v.sens_2[i,j,col], single.sens_2[i,j,0])
+
+    # By row, a draw that is NaN for either objective is dropped for both
+    r = Varsens(masked, verbose=False)
+    assert_equal(r.n_valid, n-2)
+
+    # The mask is applied to each (n, m) block as it is read, not to full copies
+    shapes = set()
+    def outputs(x):
+        shapes.add(numpy.shape(x))
+        return x
+    w = Varsens(masked, verbose=False, outputs=outputs)
+    assert_equal(shapes, set([(n, 2)]))
+    assert_true(numpy.allclose(w.sens_2, r.sens_2))
+
+def test_single_precision():
+    k = 6
+    n = 64
+    tmpdir = mkdtemp()
+    s  = Sample(k, n, lambda x: x, verbose=False)
+    s1 = Sample(k, n, lambda x: x, verbose=False, dtype=numpy.float32)
+    assert_equal(s1.flat().dtype, numpy.float32)
+    assert_almost_equal(numpy.max(numpy.abs(s1.flat() - s.flat())), 0.0, places=6)
+
+    # The type survives export and load, in binary and text
+    s1.export(tmpdir, "sample", binary=True)
+    s1.export(tmpdir, "sample")
+    b = Sample(k, n, loadFile="sample.npy", indir=tmpdir, verbose=False)
+    t = Sample(k, n, loadFile="sample.txt", indir=tmpdir, verbose=False, dtype=numpy.float32)
+    assert_equal(b.N_j.dtype, numpy.float32)
+    assert_true(numpy.all(b.flat() == s1.flat()))
+    assert_true(numpy.all(t.flat() == s1.flat()))
+
+    o  = Objective(k, n, s, g_objective, verbose=False)
+    o1 = Objective(k, n, s1, g_objective, verbose=False, dtype=numpy.float32)
+    o1.export(tmpdir, "objective", binary=True)
+    o1.export(tmpdir, "objective")
+    b = Objective(k, n, loadFile="objective.npy", indir=tmpdir, verbose=False)
+    t = Objective(k, n, loadFile="objective.txt", indir=tmpdir, verbose=False, dtype=numpy.float32)
+    shutil.rmtree(tmpdir)
+    assert_equal(b.fN_nj.dtype, numpy.float32)
+    assert_true(numpy.all(b.flat() == o1.flat()))
+    assert_true(numpy.all(t.flat() == o1.flat()))
+
+    # Accumulated in float64, the indices are as accurate as the stored values
+    v  = Varsens(o,  verbose=False)
+    v1 = Varsens(b, verbose=False)
+    assert_almost_equal(numpy.max(numpy.abs(v1.sens   - v.sens)),   0.0, places=5)
+    assert_almost_equal(numpy.max(numpy.abs(v1.sens_t - v.sens_t)), 0.0, places=5)
+    assert_almost_equal(numpy.max(numpy.abs(v1.sens_2 - v.sens_2)), 0.0, places=5)
+    # The stored values are converted one (n, m) block at a time
+    shapes = set()
+    def outputs(x):
+        shapes.add(numpy.shape(x))
+        return x
+    Varsens(b, verbose=False, outputs=outputs)
+    assert_equal(shapes, set([(n, 1)]))
@@ -0,0 +1,37 @@
+from varsens    import *
+from nose.tools import *
+import numpy
+
+model = numpy.array([0, 0.5, 3, 9, 99, 99])
+
+def g_vectorized(x):
+    return numpy.prod((numpy.abs(4.0*x-2.0)+model) / (1.0+model), axis=1)
+
+def test_trajectories():
+    m = morris.Morris(g_vectorized, 6, 8, vectorized=True, verbose=False)
+    assert_equal(m.evaluations, 8*7)
+    step = numpy.diff(m.points, axis=1)
+    for t in range(8):
+        # Each step moves one parameter by delta, and each parameter moves once
+        assert_equal(sorted(numpy.flatnonzero(numpy.abs(step[t]) > 1e-12) % 6), range(6))
+        assert_almost_equal(numpy.max(numpy.abs(numpy.abs(step[t]).sum(axis=1) - m.delta)), 0.0)
+    assert numpy.all((m.points >= 0.0) & (m.points <= 1.0))
+
+def test_screening():
+    scaling = lambda x: scale.linear(x, numpy.zeros(6), numpy.ones(6))
+    m = morris.Morris(g_vectorized, 6, 20, scaling, vectorized=True, verbose=False)
+    assert_equal(m.ranking()[:2], [0, 1])
+    assert_equal(m.shortlist(0.05), [0, 1, 2, 3])
+    assert_equal(m.shortlist(count=2), [0, 1])
+
+    sample, objective = m.reduce(1024*4, threshold=0.05)
+    assert_equal(sample.k, 4)
+    v = Varsens(objective, sample=sample, vectorized=True, verbose=False)
+    assert_equal(v.objective.evaluations, 1024*4*2*5)
+    # The screened out parameters are fixed at the centre of their range
+    assert_almost_equal(numpy.max(numpy.abs(objective.expand(sample.M_1[:3])[:, 4:] - 0.5)), 0.0)
+    sens = objective.full(v.sens)
+    assert_equal(sens.shape, (6, 1))
+    sens = sens[:,0]
+    assert_equal(list(numpy.argsort(-sens)[:4]), [0, 1, 2, 3])
+    assert_equal(list(sens[4:]), [0.0, 0.0])
@@ -1,4 +1,5 @@
 from varsens    import *
+from varsens    import saltelli
 from nose.tools import *
 import numpy
 
@@ -19,7 +20,8 @@ def test_invert():
     k = 8
     n = 23
     s = Sample(k, n, lambda x: x, False)
-    o = Objective(k, n, s, invert, False)
+    # verbose by keyword, the fifth positional argument of Objective is objective_vals
+    o = Objective(k, n, s, invert, verbose=False)
     assert_almost_equal(numpy.sum(1.0 - o.fM_1 - s.M_1), 0.0)
     assert_almost_equal(numpy.sum(1.0 - o.fM_2 - s.M_2), 0.0)
     assert_almost_equal(numpy.sum(1.0 - o.fN_j - s.N_j), 0.0)
@@ -29,7 +31,7 @@ def test_shape():
     k = 8
     n = 23
     s = Sample(k, n, lambda x: x, False)
-    o = Objective(k, n, s, invert, False)
+    o = Objective(k, n, s, invert, verbose=False)
     assert_equal(o.fM_1.shape[0], n)
     assert_equal(o.fM_1.shape[1], k)
     assert_equal(o.fM_2.shape[0], n)
@@ -45,8 +47,228 @@ def test_empty():
     k = 8
     n = 23
     s = Sample(k, n, lambda x: x, False)
-    o = Objective(k, n, s, None, False)
-    assert_equal(o.fM_1, None)
-    assert_equal(o.fM_2, None)
-    assert_equal(o.fN_j, None)
-    assert_equal(o.fN_nj, None)
\ No newline at end of file
+    # Without values to load, an objective function is required
+    assert_raises(Exception, Objective, k, n, s, None, verbose=False)
+
+def test_vectorized():
+    k = 8
+    n = 23
+    s = Sample(k, n, lambda x: x, verbose=False)
+    o = Objective(k, n, s, invert, verbose=False)
+    v = Objective(k, n, s, invert, verbose=False, vectorized=True, batch_size=10)
+    assert_almost_equal(numpy.sum(numpy.abs(o.fM_1  - v.fM_1)),  0.0)
+    assert_almost_equal(numpy.sum(numpy.abs(o.fM_2  - v.fM_2)),  0.0)
+    assert_almost_equal(numpy.sum(numpy.abs(o.fN_j  - v.fN_j)),  0.0)
+    assert_almost_equal(numpy.sum(numpy.abs(o.fN_nj - v.fN_nj)), 0.0)
+
+def test_vectorized_scalar():
+    k = 4
+    n = 17
+    s = Sample(k, n, lambda x: x, verbose=False)
+    o = Objective(k, n, s, numpy.sum, verbose=False)
+    v = Objective(k, n, s, lambda x: numpy.sum(x, axis=1), verbose=False, vectorized=True)
+    assert_equal(v.fN_j.shape, (k, n, 1))
+    assert_almost_equal(numpy.sum(numpy.abs(o.fN_nj - v.fN_nj)), 0.0)
+
+def test_executor():
+    from concurrent.futures import ThreadPoolExecutor
+    k = 5
+    n = 19
+    s = Sample(k, n, lambda x: x, verbose=False)
+    o = Objective(k, n, s, invert, verbose=False)
+    with ThreadPoolExecutor(3) as pool:
+        p = Objective(k, n, s, invert, verbose=False, batch_size=7, executor=pool)
+    assert_almost_equal(numpy.sum(numpy.abs(o.fM_1  - p.fM_1)),  0.0)
+    assert_almost_equal(numpy.sum(numpy.abs(o.fN_j  - p.fN_j)),  0.0)
+    assert_almost_equal(numpy.sum(numpy.abs(o.fN_nj - p.fN_nj)), 0.0)
+
+def test_window():
+    import threading, time
+    from concurrent.futures import ThreadPoolExecutor
+    lock = threading.Lock()
+    state = {'running': 0, 'most': 0}
+    def counted(x):
+        with lock:
+            state['running'] += 1
+            state['most'] = max(state['most'], state['running'])
+        time.sleep(0.01)
+        with lock: state['running'] -= 1
+        return 1.0-x
+    k = 3
+    n = 12
+    s = Sample(k, n, lambda x: x, verbose=False)
+    with ThreadPoolExecutor(4) as pool:
+        p = Objective(k, n, s, counted, verbose=False, vectorized=True, batch_size=4, executor=pool, window=2)
+    assert_equal(state['most'], 2)
+    assert_almost_equal(numpy.sum(numpy.abs(1.0 - p.flat() - s.flat())), 0.0)
+
+def test_process_pool():
+    k = 3
+    n = 11
+    s = Sample(k, n, lambda x: x, verbose=False)
+    o = Objective(k, n, s, invert, verbose=False)
+    p = Objective(k, n, s, invert, verbose=False, vectorized=True, batch_size=5, executor=2)
+    assert_almost_equal(numpy.sum(numpy.abs(o.fM_2  - p.fM_2)),  0.0)
+    assert_almost_equal(numpy.sum(numpy.abs(o.fN_nj - p.fN_nj)), 0.0)
+
+def test_lazy_sample():
+    k = 6
+    n = 13
+    s = Sample(k, n, lambda x: x, verbose=False)
+    l = Sample(k, n, lambda x: x, verbose=False, lazy=True)
+    o = Objective(k, n, s, invert, verbose=False)
+    p = Objective(k, n, l, invert, verbose=False, vectorized=True)
+    assert_almost_equal(numpy.sum(numpy.abs(o.fN_j  - p.fN_j)),  0.0)
+    assert_almost_equal(numpy.sum(numpy.abs(o.fN_nj - p.fN_nj)), 0.0)
+
+def count_invert(x):
+    count_invert.calls += 1
+    return 1.0-x
+
+def test_extend():
+    k = 3
+    n = 8
+    s = Sample(k, n, lambda x: x, verbose=False)
+    count_invert.calls = 0
+    o = Objective(k, n, s, count_invert, verbose=False)
+    o.extend(4)
+    assert_equal(count_invert.calls, 2*(n+4)*(1+k))
+    assert_equal(o.evaluations, 2*(n+4)*(1+k))
+    assert_equal(o.n, n+4)
+    p = Objective(k, n+4, s, invert, verbose=False)
+    assert_almost_equal(numpy.sum(numpy.abs(o.fM_2  - p.fM_2)),  0.0)
+    assert_almost_equal(numpy.sum(numpy.abs(o.fN_j  - p.fN_j)),  0.0)
+    assert_almost_equal(numpy.sum(numpy.abs(o.fN_nj - p.fN_nj)), 0.0)
+
+def test_update():
+    k = 3
+    n = 16
+    v = Varsens(numpy.sum, lambda x: x, k, n, verbose=False)
+    v.update(16)
+    assert_equal(v.n, 32)
+    w = Varsens(Objective(k, 32, v.sample, numpy.sum, verbose=False), verbose=False)
+    assert_almost_equal(numpy.sum(numpy.abs(v.sens   - w.sens)),   0.0)
+    assert_almost_equal(numpy.sum(numpy.abs(v.sens_t - w.sens_t)), 0.0)
+
+def fragile(x):
+    if x[0] > 0.9: raise ValueError("Integration failed")
+    if x[1] > 0.95:
+        import time
+        time.sleep(10)
+    return [numpy.sum(x), numpy.prod(x)]
+
+def test_capture():
+    k = 3
+    n = 64
+    s = Sample(k, n, lambda x: x, verbose=False)
+    assert_raises(ValueError, Objective, k, n, s, fragile, verbose=False)
+    o = Objective(k, n, s, fragile, verbose=False, capture=True, timeout=0.05)
+    x = s.flat()
+    failed  = x[:,0] > 0.9
+    slow    = numpy.logical_not(failed) & (x[:,1] > 0.95)
+    assert_true(numpy.all(o.failures[failed] == saltelli.EXCEPTION))
+    assert_true(numpy.all(o.failures[slow]   == saltelli.TIMEOUT))
+    assert_equal(numpy.count_nonzero(o.failures), numpy.count_nonzero(failed | slow))
+    assert_true(numpy.all(numpy.isnan(o.flat()[failed | slow])))
+    # The failed rows are masked out of the analysis
+    v = Varsens(o, verbose=False)
+    assert_true(v.n_valid < n)
+    assert_false(numpy.any(numpy.isnan(v.sens)))
+
+def test_capture_first_rows():
+    # Rows failing before the first one that evaluates are captured like any other
+    k = 3
+    n = 16
+    s = Sample(k, n, lambda x: x, verbose=False)
+    x = s.flat()
+    bad = set(map(tuple, x[:2]))
+    def first_fail(p):
+        if tuple(p) in bad: raise ValueError("bad first row")
+        return [numpy.sum(p), numpy.prod(p)]
+    assert_raises(ValueError, Objective, k, n, s, first_fail, verbose=False)
+    o = Objective(k, n, s, first_fail, verbose=False, capture=True)
+    failed = numpy.array([tuple(p) in bad for p in x])
+    assert_true(failed[0])
+    assert_true(numpy.all(o.failures[failed] == saltelli.EXCEPTION))
+    assert_equal(numpy.count_nonzero(o.failures), numpy.count_nonzero(failed))
+    assert_true(numpy.all(numpy.isnan(o.flat()[failed])))
+    assert_almost_equal(numpy.sum(numpy.abs(o.flat()[~failed,0] - numpy.sum(x[~failed], axis=1))), 0.0)
+
+def blocking(x):
+    # Stands in for a solver stuck in compiled code: a SIGALRM cannot interrupt it
+    if x[1] > 0.9:
+        import signal, time
+        signal.signal(signal.SIGALRM, signal.SIG_IGN)
+        time.sleep(30)
+    return numpy.sum(x)
+
+def test_blocking_timeout():
+    k = 2
+    n = 16
+    s = Sample(k, n, lambda x: x, verbose=False)
+    slow = s.flat()[:,1] > 0.9
+    for executor in (None, 2):
+        o = Objective(k, n, s, blocking, verbose=False, capture=True, timeout=0.2, executor=executor, batch_size=8)
+        assert_true(numpy.all(o.failures[slow] == saltelli.TIMEOUT))
+        assert_equal(numpy.count_nonzero(o.failures), numpy.count_nonzero(slow))
+        assert_almost_equal(numpy.sum(numpy.abs(o.flat()[~slow,0] - numpy.sum(s.flat()[~slow], axis=1))), 0.0)
+
+def test_timeout_thread_executor():
+    # Threads cannot be killed when they hang, so a timeout needs worker processes
+    from concurrent.futures import ThreadPoolExecutor
+    s = Sample(3, 8, lambda x: x, verbose=False)
+    with ThreadPoolExecutor(2) as pool:
+        assert_raises(ValueError, Objective, 3, 8, s, invert, verbose=False, capture=True, timeout=1.0, executor=pool)
+
+def fragile_block(x):
+    if numpy.any(x[:,0] > 0.9): raise ValueError("Integration failed")
+    return numpy.sum(x, axis=1)
+
+def test_capture_vectorized():
+    k = 3
+    n = 32
+    s = Sample(k, n, lambda x: x, verbose=False)
+    o = Objective(k, n, s, fragile_block, verbose=False, vectorized=True, batch_size=16, capture=True)
+    failed = s.flat()[:,0] > 0.9
+    assert_true(numpy.all(o.failures[failed] == saltelli.EXCEPTION))
+    assert_equal(numpy.count_nonzero(o.failures), numpy.count_nonzero(failed))
+    assert_almost_equal(numpy.sum(numpy.abs(o.flat()[~failed,0] - numpy.sum(s.flat()[~failed], axis=1))), 0.0)
+
+def trajectory(x):
+    # 20 time points of 2 observables
+    t = numpy.linspace(0.05, 1, 20)
+    return numpy.array([x[0]*t + x[1], x[2]*t**2]).T
+
+def test_declared_shape():
+    k = 3
+    n = 16
+    s = Sample(k, n, lambda x: x, verbose=False)
+    o = Objective(k, n, s, trajectory, verbose=False)
+    assert_equal(o.shape, (20, 2))
+    assert_equal(o.fM_1.shape, (n, 40))
+    # Declared up front and stored as float32
+    d = Objective(k, n, s, trajectory, verbose=False, shape=(20, 2), dtype=numpy.float32)
+    assert_equal(d.fN_j.dtype, numpy.float32)
+    assert_almost_equal(numpy.max(numpy.abs(d.fN_j - o.fN_j)), 0.0, places=6)
+    # Only every 5th time point is kept
+    r = Objective(k, n, s, trajectory, verbose=False, reduce=(slice(None, None, 5),))
+    assert_equal(r.shape, (4, 2))
+    kept = o.flat().reshape((-1, 20, 2))[:, ::5].reshape((-1, 8))
+    assert_almost_equal(numpy.max(numpy.abs(r.flat() - kept)), 0.0)
+
+def test_outputs():
+    k = 3
+    n = 32
+    s = Sample(k, n, lambda x: x, verbose=False)
+    o = Objective(k, n, s, trajectory, verbose=False, dtype=numpy.float32)
+    v = Varsens(o, verbose=False)
+    # Every 5th time point, selected at analysis time
+    w = Varsens(o, verbose=False, outputs=(slice(None, None, 5),))
+    assert_equal(w.sens.shape, (k, 8))
+    columns = numpy.arange(40).reshape((20, 2))[::5].reshape(-1)
+    assert_almost_equal(numpy.max(numpy.abs(w.sens   - v.sens[:, columns])),   0.0)
+    assert_almost_equal(numpy.max(numpy.abs(w.sens_t - v.sens_t[:, columns])), 0.0)
+    assert_almost_equal(numpy.max(numpy.abs(w.sens_2 - v.sens_2[:, :, columns])), 0.0)
+    # A reduction along the outputs, here the final value of the first observable
+    f = Varsens(o, verbose=False, outputs=lambda y: y[..., -2:-1])
+    assert_almost_equal(numpy.max(numpy.abs(f.sens - v.sens[:, -2:-1])), 0.0)
@@ -0,0 +1,53 @@
+from varsens    import *
+from nose.tools import *
+import numpy
+
+# The Ishigami function, with analytic indices (Sobol and Levitan 1999)
+a = 7.0
+b = 0.1
+
+def ishigami(x):
+    return numpy.sin(x[:,0]) + a*numpy.sin(x[:,1])**2 + b*x[:,2]**4*numpy.sin(x[:,0])
+
+def ishigami_truth():
+    pi = numpy.pi
+    V   = a**2/8.0 + b*pi**4/5.0 + b**2*pi**8/18.0 + 0.5
+    V1  = 0.5*(1.0 + b*pi**4/5.0)**2
+    V2  = a**2/8.0
+    V13 = b**2*pi**8*(1.0/18.0 - 1.0/50.0)
+    return numpy.array([V1, V2, 0.0])/V, numpy.array([V1+V13, V2, V13])/V, V
+
+def scaling(x):
+    return scale.linear(x, -numpy.pi*numpy.ones(3), numpy.pi*numpy.ones(3))
+
+def test_multi_indices():
+    alpha = pce.multi_indices(3, 2)
+    assert_equal(len(alpha), 10)
+    assert_equal(list(alpha[0]), [0, 0, 0])
+    assert_equal(len(pce.multi_indices(3, 4, interaction=1)), 1+3*4)
+    assert len(pce.multi_indices(5, 4, q=0.5)) < len(pce.multi_indices(5, 4))
+    # The basis is orthonormal for uniform points
+    u = (numpy.arange(2000)[:,None] + 0.5)/2000
+    P = pce.legendre(u, 4)[:,0,:]
+    assert_almost_equal(numpy.max(numpy.abs(numpy.dot(P.T, P)/2000 - numpy.eye(5))), 0.0, places=3)
+
+def test_ishigami():
+    sens, sens_t, V = ishigami_truth()
+    s = Sample(3, 200, scaling, verbose=False)
+    p = pce.from_sample(s, ishigami, vectorized=True, degree=10, verbose=False)
+    assert p.error[0] < 1e-2
+    assert_almost_equal(1.0, p.var_y[0]/V, places=1)
+    for i in range(3):
+        assert_almost_equal(sens[i],   p.sens[i,0],   places=2)
+        assert_almost_equal(sens_t[i], p.sens_t[i,0], places=2)
+    # Closed index of a pair, and of the parameters other than a pair
+    assert_almost_equal(sens[0]+sens[1], p.sens_2[0,1,0], places=2)
+    assert_almost_equal(sens[1],           p.sens_2n[0,2,0], places=2)
+    assert_equal(p.sens_2.shape, (3, 3, 1))
+
+    # The same indices as a full Saltelli analysis, from 400 of its 4096*8 evaluations
+    v = Varsens(ishigami, scaling, 3, 4096, verbose=False, vectorized=True)
+    q = pce.from_sample(v.sample, v.objective, degree=10, verbose=False, second_order=[(0, 2), (1, 2)])
+    assert_equal(q.sens_2.shape, (2, 1))
+    for name, difference in p.compare(v).items():
+        assert difference < 0.05, (name, difference)
@@ -73,3 +73,43 @@ def test_flat():
     assert_equal(s.flat().shape[1], k)
     assert_equal(numpy.sum(s.M_1[0]),        numpy.sum(s.flat()[0] ))
     assert_equal(numpy.sum(s.N_nj[k-1][-1]), numpy.sum(s.flat()[-1]))
+
+def test_lazy():
+    k = 4
+    n = 9
+    x = Sample(k, n, lambda x: x, verbose=False)
+    y = Sample(k, n, lambda x: x, verbose=False, lazy=True)
+
+    assert_equal(y.N_j.shape, x.N_j.shape)
+    assert_almost_equal(numpy.sum(numpy.abs(x.N_j  - numpy.array(y.N_j))),  0.0)
+    assert_almost_equal(numpy.sum(numpy.abs(x.N_nj - numpy.array(y.N_nj))), 0.0)
+    for i in range(k):
+        assert_almost_equal(numpy.sum(numpy.abs(x.N_j[i] - y.N_j[i])), 0.0)
+        assert_almost_equal(numpy.sum(numpy.abs(x.N_nj[i][3] - y.N_nj[i, 3])), 0.0)
+    assert_almost_equal(numpy.sum(numpy.abs(x.flat() - y.flat())), 0.0)
+
+def test_take():
+    k = 3
+    n = 7
+    for lazy in [False, True]:
+        s = Sample(k, n, lambda x: x, verbose=False, lazy=lazy)
+        f = s.flat()
+        index = numpy.array([0, 5, n, 2*n+1, 3*n+6, 5*n+2, len(f)-1])
+        assert_almost_equal(numpy.sum(numpy.abs(f[index] - s.take(index))), 0.0)
+        assert_almost_equal(numpy.sum(numpy.abs(f[10:30] - s.rows(10, 30))), 0.0)
+
+def test_extend():
+    k = 4
+    n = 10
+    x = Sample(k, n, lambda x: x, verbose=False)
+    M_1 = x.M_1.copy()
+    M_2 = x.M_2.copy()
+    x.extend(6)
+    assert_equal(x.n, 16)
+    assert_equal(x.M_1.shape, (16, k))
+    assert_equal(x.N_nj.shape, (k, 16, k))
+    assert_almost_equal(numpy.sum(numpy.abs(x.M_1[:n] - M_1)), 0.0)
+    assert_almost_equal(numpy.sum(numpy.abs(x.M_2[:n] - M_2)), 0.0)
+    # The sequence is continued, not restarted
+    y = Sample(k, 2*16, lambda x: x, verbose=False)
+    assert_almost_equal(numpy.sum(numpy.abs(x.M_1[n:] - y.M_1[2*n:2*n+6])), 0.0)
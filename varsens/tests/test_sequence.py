@@ -0,0 +1,76 @@
+from varsens    import *
+from nose.tools import *
+import numpy
+
+def test_stratified():
+    # Each coordinate of the first 2^m Sobol points visits every interval [i/2^m, (i+1)/2^m)
+    x = sequence.Sobol(50).get(256)
+    for d in range(50):
+        assert_equal(sorted(numpy.floor(x[:,d]*256).astype(int)), list(range(256)))
+
+def test_skip():
+    x = sequence.Sobol(9).get(1000)
+    s = sequence.Sobol(9)
+    y = numpy.vstack([s.get(17), s.skip(500).get(483)])
+    assert_almost_equal(numpy.sum(numpy.abs(x[:17]  - y[:17])), 0.0)
+    assert_almost_equal(numpy.sum(numpy.abs(x[517:] - y[17:])), 0.0)
+
+def test_sobol_sample():
+    k = 5
+    n = 64
+    x = Sample(k, n, lambda x: x, verbose=False, sequence="sobol")
+    y = sequence.Sobol(k).skip(1).get(2*n)
+    assert_almost_equal(numpy.sum(numpy.abs(x.M_1 - y[:n])), 0.0)
+    assert_almost_equal(numpy.sum(numpy.abs(numpy.sort(x.M_2, axis=0) - numpy.sort(y[n:], axis=0))), 0.0)
+
+    # Extending continues the sequence after the 2n points already used
+    x.extend(n)
+    y = sequence.Sobol(k).skip(1+2*n).get(n)
+    assert_almost_equal(numpy.sum(numpy.abs(x.M_1[n:] - y)), 0.0)
+
+def test_random_access():
+    # Every backend gives the same points whether skipped to or generated in one go
+    for name in sorted(sequence.SEQUENCES):
+        s = sequence.create(name, 7, 50)
+        x = s.get(300)
+        y = s.reset().skip(123).get(177)
+        assert_almost_equal(numpy.sum(numpy.abs(x[123:] - y)), 0.0)
+        assert_true(numpy.all((x >= 0.0) & (x < 1.0)))
+
+def test_halton():
+    import ghalton
+    k = 12
+    x = sequence.Halton(k).skip(20*k+1).get(2000)
+    y = numpy.array(ghalton.Halton(k).get(20*k+2000))[20*k:]
+    assert_almost_equal(numpy.max(numpy.abs(x - y)), 0.0, places=12)
+    assert_equal(list(sequence.primes(10)), [2, 3, 5, 7, 11, 13, 17, 19, 23, 29])
+
+def test_latin_hypercube():
+    x = sequence.create('lhs', 4, 32).get(64)
+    for block in (x[:32], x[32:]):
+        for d in range(4):
+            assert_equal(sorted(numpy.floor(block[:,d]*32).astype(int)), list(range(32)))
+    # Part of a block is not a Latin hypercube, so blocks are not split
+    assert_raises(Exception, Sample, 4, 32, lambda x: x, verbose=False, sequence="lhs", discard=3)
+    assert_raises(Exception, shard.spec, 4, 32, sequence="lhs", discard=3)
+    s = Sample(4, 32, lambda x: x, verbose=False, sequence="lhs", discard=32)
+    assert_raises(Exception, s.extend, 8)
+    s.extend(32)
+    for d in range(4):
+        assert_equal(sorted(numpy.floor(s.M_1[32:,d]*32).astype(int)), list(range(32)))
+
+def test_lattice():
+    # The first 2^m points of an extensible lattice are a lattice: closed under addition
+    x = sequence.Lattice(3).get(64)
+    s = numpy.mod(x[5] + x[9], 1.0)
+    assert_true(numpy.min(numpy.sum(numpy.abs(x - s), axis=1)) < 1e-12)
+
+def test_lattice_distinct():
+    # Every dimension of the points drawn is distinct, and not the mirror image of another
+    for dim, count in ((16, 64), (40, 256), (256, 1024)):
+        x = sequence.Lattice(dim).get(count)
+        columns = numpy.round(numpy.vstack((x.T, numpy.mod(1.0-x.T, 1.0)))*count).astype(int)
+        assert_equal(len(set(map(tuple, columns))), 2*dim)
+    assert_raises(Exception, sequence.Lattice(40).get, 64)
+    assert_raises(Exception, sequence.Lattice, 300, n=1024)
+    assert_raises(Exception, Sample, 40, 64, lambda x: x, verbose=False, sequence="lattice")
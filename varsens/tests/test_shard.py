@@ -0,0 +1,69 @@
+from varsens    import *
+from nose.tools import *
+import numpy
+import os
+import shutil
+import tempfile
+
+scaling = {'method': 'magnitude', 'reference': [1.0, 10.0, 100.0, 1000.0], 'orders': 2.0}
+
+def test_shards_match_sample():
+    k = 4
+    n = 50
+    for name in ("halton", "sobol", "scrambled_halton", "lattice", "lhs"):
+        discard = n if name == "lhs" else 7 # Latin hypercubes discard whole blocks
+        spec = shard.spec(k, n, scaling, sequence=name, discard=discard, n_shards=9)
+        s    = Sample(k, n, scale.from_spec(scaling), verbose=False, sequence=name, discard=discard)
+        x    = numpy.vstack([shard.rows(spec, b) for b in range(1, shard.shards(spec)+1)])
+        assert_almost_equal(numpy.max(numpy.abs(x - s.flat())), 0.0)
+
+def test_export_blocks():
+    # Shard b matches the file written by Sample.export for block b
+    k = 3
+    n = 20
+    tmpdir = tempfile.mkdtemp()
+    spec = shard.spec(k, n, blocksize=37)
+    Sample(k, n, scale.from_spec(None), verbose=False).export(tmpdir, "sample", blocksize=37)
+    for b in range(1, shard.shards(spec)+1):
+        x = numpy.loadtxt(os.path.join(tmpdir, "sample_%d.txt" % b), ndmin=2)
+        assert_almost_equal(numpy.max(numpy.abs(x - shard.rows(spec, b))), 0.0)
+    assert_raises(Exception, shard.rows, spec, shard.shards(spec)+1)
+
+    shard.save(spec, os.path.join(tmpdir, "spec.json"))
+    assert_equal(shard.load(os.path.join(tmpdir, "spec.json")), spec)
+
+def test_schemes():
+    k = 4
+    n = 20
+    for scheme, blocks in (("jansen", k+2), ("radial", k+1)):
+        spec = shard.spec(k, n, scaling, scheme=scheme, n_shards=7)
+        s    = Sample(k, n, scale.from_spec(scaling), verbose=False, scheme=scheme)
+        assert_equal(spec['rows'], n*blocks)
+        assert_equal(s.flat().shape, (n*blocks, k))
+        x    = numpy.vstack([shard.rows(spec, b) for b in range(1, shard.shards(spec)+1)])
+        assert_almost_equal(numpy.max(numpy.abs(x - s.flat())), 0.0)
+
+def test_groups():
+    k = 4
+    n = 20
+    groups = [[0, 2], [1], [3]]
+    for scheme, blocks in (("double", 2*(1+len(groups))), ("jansen", len(groups)+2)):
+        spec = shard.spec(k, n, scaling, scheme=scheme, n_shards=5, groups=groups)
+        s    = Sample(k, n, scale.from_spec(scaling), verbose=False, scheme=scheme, groups=groups)
+        assert_equal(spec['rows'], n*blocks)
+        x    = numpy.vstack([shard.rows(spec, b) for b in range(1, shard.shards(spec)+1)])
+        assert_almost_equal(numpy.max(numpy.abs(x - s.flat())), 0.0)
+
+def test_saved_scaling():
+    # A spec read back from JSON (unicode method and keys) generates the same rows
+    k = 4
+    n = 20
+    tmpdir = tempfile.mkdtemp()
+    try:
+        spec = shard.spec(k, n, scaling, n_shards=3)
+        shard.save(spec, os.path.join(tmpdir, "spec.json"))
+        loaded = shard.load(os.path.join(tmpdir, "spec.json"))
+        for b in range(1, shard.shards(spec)+1):
+            assert_almost_equal(numpy.max(numpy.abs(shard.rows(loaded, b) - shard.rows(spec, b))), 0.0)
+    finally:
+        shutil.rmtree(tmpdir)